@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -85,6 +86,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test database (gitignored): the loyalty stress tests open concurrent
+        # connections that wait for SQLite's write lock instead of failing as they do on a
+        # shared in-memory database, and the worker-process command tests need a database
+        # their forked children can open
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
@@ -108,6 +116,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# Shared by every worker and management command on the host: the recommendation and fidelity
+# tier caches of each process are invalidated through the catalog and tier version tokens
+# stored here (per-user versions live in the database, where culling cannot evict them). A
+# per-process backend (LocMemCache) would only invalidate the process that saved the change;
+# use Redis or Memcached when the site runs on several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# The test run gets its own in-memory cache instead of the developer's .cache directory
+if len(sys.argv) > 1 and sys.argv[1] == 'test':
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -137,3 +168,39 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'client.User'
+
+# Recommendations
+# Per-worker LRU caches of ranked recommendation lists (entries, seconds)
+RECOMMENDATION_CACHE_SIZE = 1000
+RECOMMENDATION_COHORT_CACHE_SIZE = 100
+RECOMMENDATION_CACHE_TTL = 300
+# Offers ranked once per (price_range, tier) cohort
+RECOMMENDATION_COHORT_SIZE = 50
+# Stored recommendations younger than this (seconds) are served without running the engine
+RECOMMENDATION_PRECOMPUTE_MAX_AGE = 86400
+# Length of the stored offer lists; every view computes and stores this many, then shows a prefix
+RECOMMENDATION_STORED_LIMIT = 20
+# Tracking events (view/click/book) are buffered per worker and written in batches, when the
+# buffer is full or by a background thread at most this many seconds later
+RECOMMENDATION_TRACKING_BATCH_SIZE = 200
+RECOMMENDATION_TRACKING_FLUSH_INTERVAL = 5
+# Co-booking similarity: neighbours kept per offer, and weight of the similarity bonus (0 disables it)
+RECOMMENDATION_SIMILARITY_NEIGHBOURS = 20
+RECOMMENDATION_SIMILARITY_WEIGHT = 0.2
+# Retention (prune_recommendations): active rows not recomputed for this many days are deactivated,
+# inactive rows never viewed/clicked/booked are archived this many days later
+RECOMMENDATION_DEACTIVATE_AFTER_DAYS = 7
+RECOMMENDATION_ARCHIVE_AFTER_DAYS = 30
+# Feedback penalty: points removed = max penalty x negative feedbacks / (feedbacks + prior)
+RECOMMENDATION_FEEDBACK_MAX_PENALTY = 30
+RECOMMENDATION_FEEDBACK_PRIOR = 5
+# Two-stage ranking: offers fully scored per cohort (0 scores the whole catalog), best offers kept
+# per destination in that pool, and MMR lambda of the destination diversity re-rank (1 disables it)
+RECOMMENDATION_CANDIDATE_POOL = 300
+RECOMMENDATION_CANDIDATES_PER_DESTINATION = 3
+RECOMMENDATION_DIVERSITY_LAMBDA = 0.7
+
+# Loyalty
+# Seconds a worker keeps its in-memory fidelity tier table before re-reading it, even when no
+# invalidation reached it
+FIDELITY_TIER_TABLE_TTL = 60
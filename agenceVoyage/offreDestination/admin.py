@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Destination, Offre, Hebergement
+from .models import Destination, Offre, Hebergement, OffreStats
 
 
 @admin.register(Destination)
@@ -21,3 +21,10 @@ class HebergementAdmin(admin.ModelAdmin):
     search_fields = ('nom_hebergement', 'destination__nom_destination')
     list_filter = ('type_hebergement', 'destination', 'etoiles')
     filter_horizontal = ('offres',)
+
+
+@admin.register(OffreStats)
+class OffreStatsAdmin(admin.ModelAdmin):
+    list_display = ('offre', 'reservation_count', 'destination_count', 'min_etoiles', 'max_etoiles', 'has_five_star', 'updated_at')
+    list_filter = ('has_five_star',)
+    readonly_fields = ('offre', 'reservation_count', 'destination_count', 'min_etoiles', 'max_etoiles', 'has_five_star', 'updated_at')
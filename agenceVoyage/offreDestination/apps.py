@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OffredestinationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'offreDestination'
+    
+    def ready(self):
+        import offreDestination.signals
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from offreDestination.models import Offre, OffreStats
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table OffreStats depuis les réservations et hébergements, et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Vérifie seulement les écarts sans rien écrire (code de sortie 1 si écart)",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        check_only = options['check']
+
+        drifted = missing = total = 0
+        last_pk = 0
+        while True:
+            ids = list(
+                Offre.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_pk = ids[-1]
+
+            expected = OffreStats.compute(Offre.objects.filter(pk__in=ids))
+            stored = OffreStats.objects.in_bulk(ids)
+
+            for stats in expected:
+                current = stored.get(stats.offre_id)
+                if current is None:
+                    missing += 1
+                    self.stdout.write(f"Offre {stats.offre_id} : statistiques absentes")
+                    continue
+                diff = {
+                    field: (getattr(current, field), getattr(stats, field))
+                    for field in OffreStats.COUNTERS
+                    if getattr(current, field) != getattr(stats, field)
+                }
+                if diff:
+                    drifted += 1
+                    details = ", ".join(f"{field} {old} -> {new}" for field, (old, new) in diff.items())
+                    self.stdout.write(f"Offre {stats.offre_id} : {details}")
+
+            if not check_only:
+                with transaction.atomic():
+                    OffreStats.refresh(ids)
+            total += len(ids)
+
+        summary = f"{total} offres vérifiées, {drifted} en écart, {missing} sans statistiques"
+        if check_only and (drifted or missing):
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary if check_only else f"{summary} — statistiques reconstruites"))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_offre_stats(apps, schema_editor):
+    Offre = apps.get_model('offreDestination', 'Offre')
+    OffreStats = apps.get_model('offreDestination', 'OffreStats')
+
+    stats = []
+    for offre in Offre.objects.all():
+        etoiles = list(offre.hebergements.values_list('etoiles', flat=True))
+        stats.append(OffreStats(
+            offre=offre,
+            reservation_count=offre.reservations.count(),
+            destination_count=offre.nom_destinations.count(),
+            max_etoiles=max(etoiles) if etoiles else None,
+            min_etoiles=min(etoiles) if etoiles else None,
+            has_five_star=5 in etoiles,
+        ))
+    OffreStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0001_initial'),
+        ('reservation', '0003_reservation_offre_related_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OffreStats',
+            fields=[
+                ('offre', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='offreDestination.offre')),
+                ('reservation_count', models.PositiveIntegerField(default=0)),
+                ('destination_count', models.PositiveIntegerField(default=0)),
+                ('max_etoiles', models.PositiveIntegerField(blank=True, null=True)),
+                ('min_etoiles', models.PositiveIntegerField(blank=True, null=True)),
+                ('has_five_star', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_offre_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0002_offrestats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hebergement',
+            index=models.Index(fields=['etoiles', 'prix_par_nuit'], name='hebergement_etoiles_prix_idx'),
+        ),
+    ]
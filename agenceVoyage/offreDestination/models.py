@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, Exists, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 class Destination(models.Model):
     nom_destination = models.CharField(max_length=100)
@@ -42,5 +44,71 @@ class Hebergement(models.Model):
 
     offres = models.ManyToManyField(Offre, blank=True, related_name="hebergements")
 
+    class Meta:
+        indexes = [
+            # Couvre le classement de RecommendationEngine.rank_hebergements
+            models.Index(fields=['etoiles', 'prix_par_nuit'], name='hebergement_etoiles_prix_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.nom_hebergement} - {self.destination.nom_destination}"
+
+
+class OffreStats(models.Model):
+    """Statistiques dénormalisées par offre, maintenues par les signaux
+    (voir signals.py) et reconstruites par la commande rebuild_offer_stats"""
+    offre = models.OneToOneField(Offre, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    reservation_count = models.PositiveIntegerField(default=0)
+    destination_count = models.PositiveIntegerField(default=0)
+    max_etoiles = models.PositiveIntegerField(blank=True, null=True)
+    min_etoiles = models.PositiveIntegerField(blank=True, null=True)
+    has_five_star = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    COUNTERS = ['reservation_count', 'destination_count', 'max_etoiles', 'min_etoiles', 'has_five_star']
+
     def __str__(self):
-        return f"{self.nom_hebergement} - {self.destination.nom_destination}"
\ No newline at end of file
+        return f"Stats {self.offre_id} ({self.reservation_count} réservations)"
+
+    @staticmethod
+    def live_annotations():
+        """Expressions calculant les statistiques directement depuis les tables sources"""
+        from reservation.models import Reservation
+
+        destinations = Offre.nom_destinations.through.objects.filter(offre_id=OuterRef('pk'))
+        hebergements = Hebergement.objects.filter(offres=OuterRef('pk')).order_by().values('offres')
+
+        return {
+            'reservation_count': Coalesce(Subquery(
+                Reservation.objects.filter(offre_id=OuterRef('pk')).order_by()
+                .values('offre_id').annotate(n=Count('pk')).values('n'),
+                output_field=models.IntegerField()
+            ), 0),
+            'destination_count': Coalesce(Subquery(
+                destinations.order_by().values('offre_id').annotate(n=Count('pk')).values('n'),
+                output_field=models.IntegerField()
+            ), 0),
+            'max_etoiles': Subquery(hebergements.annotate(m=Max('etoiles')).values('m')),
+            'min_etoiles': Subquery(hebergements.annotate(m=Min('etoiles')).values('m')),
+            'has_five_star': Exists(Hebergement.objects.filter(offres=OuterRef('pk'), etoiles=5)),
+        }
+
+    @classmethod
+    def compute(cls, offres=None):
+        """Instances (non sauvegardées) recalculées pour les offres données"""
+        offres = Offre.objects.all() if offres is None else offres
+        rows = offres.annotate(**cls.live_annotations()).values_list('pk', *cls.COUNTERS)
+        return [cls(offre_id=row[0], **dict(zip(cls.COUNTERS, row[1:]))) for row in rows]
+
+    @classmethod
+    def refresh(cls, offre_ids):
+        """Recalcule entièrement les statistiques des offres données"""
+        offre_ids = [pk for pk in set(offre_ids) if pk is not None]
+        if not offre_ids:
+            return
+        cls.objects.bulk_create(
+            cls.compute(Offre.objects.filter(pk__in=offre_ids)),
+            update_conflicts=True,
+            unique_fields=['offre'],
+            update_fields=cls.COUNTERS + ['updated_at'],
+        )
@@ -0,0 +1,96 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from reservation.models import Reservation
+from .models import Offre, Destination, Hebergement, OffreStats
+
+
+def _increment_reservations(offre_id, delta):
+    """Ajuste le compteur de réservations sans relire l'offre"""
+    stats = OffreStats.objects.filter(offre_id=offre_id)
+    if delta < 0:
+        # Pas de recalcul ici : l'offre peut être en cours de suppression
+        stats.filter(reservation_count__gte=-delta).update(reservation_count=F('reservation_count') + delta)
+    elif not stats.update(reservation_count=F('reservation_count') + delta):
+        # Ligne absente : recalcul complet
+        OffreStats.refresh([offre_id])
+
+
+@receiver(post_save, sender=Offre)
+def create_offre_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        OffreStats.objects.get_or_create(offre=instance)
+
+
+@receiver(pre_save, sender=Reservation)
+def remember_reservation_offre(sender, instance, raw=False, **kwargs):
+    """Mémorise l'offre d'origine pour gérer un changement d'offre"""
+    if instance.pk and not raw:
+        instance._stats_offre_id = (
+            Reservation.objects.filter(pk=instance.pk).values_list('offre_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Reservation)
+def count_reservation(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        _increment_reservations(instance.offre_id, 1)
+        return
+
+    previous_offre_id = getattr(instance, '_stats_offre_id', None)
+    if previous_offre_id is not None and previous_offre_id != instance.offre_id:
+        _increment_reservations(previous_offre_id, -1)
+        _increment_reservations(instance.offre_id, 1)
+
+
+@receiver(post_delete, sender=Reservation)
+def uncount_reservation(sender, instance, **kwargs):
+    _increment_reservations(instance.offre_id, -1)
+
+
+@receiver(m2m_changed, sender=Offre.nom_destinations.through)
+def count_destinations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._stats_offre_ids = list(instance.offres.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            OffreStats.refresh([instance.pk])
+        elif action == 'post_clear':
+            OffreStats.refresh(getattr(instance, '_stats_offre_ids', []))
+        else:
+            OffreStats.refresh(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Hebergement.offres.through)
+def count_hebergement_stars(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._stats_offre_ids = list(instance.offres.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            OffreStats.refresh([instance.pk])
+        elif action == 'post_clear':
+            OffreStats.refresh(getattr(instance, '_stats_offre_ids', []))
+        else:
+            OffreStats.refresh(pk_set or [])
+
+
+@receiver(post_save, sender=Hebergement)
+def refresh_hebergement_stars(sender, instance, created, raw=False, **kwargs):
+    # Un hébergement nouvellement créé n'est encore lié à aucune offre
+    if not created and not raw:
+        OffreStats.refresh(instance.offres.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Hebergement)
+@receiver(pre_delete, sender=Destination)
+def remember_linked_offres(sender, instance, **kwargs):
+    # Les lignes M2M supprimées en cascade n'émettent pas m2m_changed
+    instance._stats_offre_ids = list(instance.offres.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Hebergement)
+@receiver(post_delete, sender=Destination)
+def refresh_linked_offres(sender, instance, **kwargs):
+    OffreStats.refresh(getattr(instance, '_stats_offre_ids', []))
@@ -1,3 +1,86 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from reservation.models import Reservation
+from .models import Destination, Hebergement, Offre, OffreStats
+
+
+class OffreStatsTests(TestCase):
+    """Statistiques dénormalisées tenues à jour par les signaux"""
+
+    def setUp(self):
+        self.client_user = get_user_model().objects.create_user(email="stats@example.com", password="x")
+        self.destination = Destination.objects.create(
+            nom_destination="Tozeur", pays="Tunisie", description="Oasis", image="destinations/tozeur.jpg"
+        )
+        self.offers = [
+            Offre.objects.create(
+                titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal('300.00'), image="offres/offre.jpg"
+            )
+            for i in range(2)
+        ]
+
+    def book(self, offer):
+        return Reservation.objects.create(client=self.client_user, offre=offer, nb_personnes=1)
+
+    def stats(self, offer):
+        return OffreStats.objects.get(offre=offer)
+
+    def check_drift(self):
+        call_command('rebuild_offer_stats', '--check', stdout=StringIO())
+
+    def test_reservation_counter_follows_creates_moves_and_deletes(self):
+        first, second = self.offers
+        reservation = self.book(first)
+        self.book(first)
+        self.assertEqual(self.stats(first).reservation_count, 2)
+
+        reservation.offre = second
+        reservation.save()
+        self.assertEqual((self.stats(first).reservation_count, self.stats(second).reservation_count), (1, 1))
+
+        reservation.delete()
+        self.assertEqual(self.stats(second).reservation_count, 0)
+        self.check_drift()
+
+    def test_relations_refresh_destinations_and_stars(self):
+        offer = self.offers[0]
+        offer.nom_destinations.add(self.destination)
+        hotel = Hebergement.objects.create(
+            nom_hebergement="Palmeraie", type_hebergement="hotel", destination=self.destination,
+            prix_par_nuit=Decimal('90.00'), etoiles=3,
+        )
+        hotel.offres.add(offer)
+        palace = Hebergement.objects.create(
+            nom_hebergement="Palace", type_hebergement="resort", destination=self.destination,
+            prix_par_nuit=Decimal('400.00'), etoiles=5,
+        )
+        offer.hebergements.add(palace)
+
+        stats = self.stats(offer)
+        self.assertEqual(
+            (stats.destination_count, stats.min_etoiles, stats.max_etoiles, stats.has_five_star), (1, 3, 5, True)
+        )
+
+        palace.delete()
+        self.destination.offres.clear()
+        stats = self.stats(offer)
+        self.assertEqual((stats.destination_count, stats.max_etoiles, stats.has_five_star), (0, 3, False))
+        self.check_drift()
+
+    def test_check_reports_drift_until_rebuilt(self):
+        offer = self.offers[0]
+        self.book(offer)
+        OffreStats.objects.filter(offre=offer).update(reservation_count=5)
+        OffreStats.objects.filter(offre=self.offers[1]).delete()
+
+        with self.assertRaisesMessage(CommandError, "2 offres vérifiées, 1 en écart, 1 sans statistiques"):
+            self.check_drift()
+
+        call_command('rebuild_offer_stats', stdout=StringIO())
+        self.assertEqual(self.stats(offer).reservation_count, 1)
+        self.check_drift()
@@ -32,7 +32,7 @@ from .forms import FiltreOffresForm
 
 def liste_offres(request):
     form = FiltreOffresForm(request.GET or None)
-    offres = Offre.objects.filter(actif=True)
+    offres = Offre.objects.filter(actif=True).select_related('stats')
 
     if form.is_valid():
         destination = form.cleaned_data.get('destination')
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import FidelityTierConfig, LoyaltyProgram, PointsTransaction
+from . import export
+from .models import FidelityTierConfig, LoyaltyProgram, PointsLot, PointsTotal, PointsTransaction
 
 
 @admin.register(FidelityTierConfig)
@@ -15,6 +16,12 @@ class LoyaltyProgramAdmin(admin.ModelAdmin):
     list_filter = ['tier', 'enrolled_at']
     search_fields = ['user__username', 'user__email']
     readonly_fields = ['totalEarnedPoints', 'totalRedeemedPoints', 'enrolled_at', 'last_tier_update']
+    actions = ['export_transactions']
+    
+    @admin.action(description="Exporter l'historique des points (CSV)")
+    def export_transactions(self, request, queryset):
+        transactions = PointsTransaction.objects.filter(loyalty_program__in=queryset.values('pk'))
+        return export.csv_response(transactions, 'loyalty_transactions_selection', with_client=True)
 
 
 @admin.register(PointsTransaction)
@@ -23,3 +30,19 @@ class PointsTransactionAdmin(admin.ModelAdmin):
     list_filter = ['transaction_type', 'created_at']
     search_fields = ['loyalty_program__user__username', 'description']
     readonly_fields = ['created_at']
+
+
+@admin.register(PointsTotal)
+class PointsTotalAdmin(admin.ModelAdmin):
+    list_display = ['loyalty_program', 'transaction_type', 'total', 'count', 'updated_at']
+    list_filter = ['transaction_type']
+    search_fields = ['loyalty_program__user__username']
+    readonly_fields = ['loyalty_program', 'transaction_type', 'total', 'count', 'updated_at']
+
+
+@admin.register(PointsLot)
+class PointsLotAdmin(admin.ModelAdmin):
+    list_display = ['loyalty_program', 'points', 'remaining', 'earned_at', 'expires_at', 'expired_at']
+    list_filter = ['expires_at', 'expired_at']
+    search_fields = ['loyalty_program__user__username']
+    readonly_fields = ['loyalty_program', 'transaction', 'points', 'earned_at', 'expired_at']
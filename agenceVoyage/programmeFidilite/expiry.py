@@ -0,0 +1,95 @@
+"""Expiration des lots de points.
+
+Les lots échus (remaining > 0, expires_at passée) sont lus dans l'index
+partiel points_lot_due_idx, par lots de chunk_size. Chaque lot est traité
+dans une transaction courte, avec un nombre fixe de requêtes quelle que soit
+la taille du lot :
+
+1. verrouillage des programmes concernés (même ordre que les opérations sur
+   les points : programme puis lots, voir LoyaltyProgram) ;
+2. relecture des lots échus de ces programmes, mis à zéro en un UPDATE ;
+3. une transaction 'expire' par programme (bulk_create) ;
+4. un UPDATE des soldes et de la prochaine date d'expiration, puis des
+   totaux de l'historique (PointsTotal.record_many) : les points expirés
+   sont relus par une sous-requête corrélée sur les transactions écrites,
+   plutôt qu'un CASE par programme dont la compilation coûte plus cher que
+   la requête elle-même.
+
+Un lot traité n'est plus échu (remaining = 0) : la lecture suivante reprend
+simplement en tête de l'index, sans OFFSET.
+"""
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import LoyaltyProgram, PointsLot, PointsTotal, PointsTransaction
+
+
+def due_lots(now=None):
+    """Lots non vides dont la date d'expiration est passée"""
+    return PointsLot.objects.filter(remaining__gt=0, expires_at__lte=now or timezone.now())
+
+
+def expire_chunk(lot_ids, now):
+    """Fait expirer des lots ; retourne (points expirés, lots, programmes)"""
+    with transaction.atomic():
+        program_ids = sorted(set(
+            due_lots(now).filter(pk__in=lot_ids).values_list('loyalty_program_id', flat=True)
+        ))
+        if not program_ids:
+            return 0, 0, 0
+        list(LoyaltyProgram.objects.select_for_update().filter(pk__in=program_ids).order_by('pk').values_list('pk'))
+
+        # Relus sous verrou : une rédemption concurrente a pu vider certains lots
+        lots = list(due_lots(now).filter(pk__in=lot_ids).values_list('pk', 'loyalty_program_id', 'remaining'))
+        expired = defaultdict(int)
+        for _, program_id, remaining in lots:
+            expired[program_id] += remaining
+        if not expired:
+            return 0, 0, 0
+
+        PointsLot.objects.filter(pk__in=[pk for pk, _, _ in lots]).update(remaining=0, expired_at=now)
+        expirations = PointsTransaction.objects.bulk_create([
+            PointsTransaction(
+                loyalty_program_id=program_id,
+                transaction_type='expire',
+                points_amount=points,
+                description=f'{points} points expirés',
+            )
+            for program_id, points in expired.items()
+        ])
+        LoyaltyProgram.objects.filter(pk__in=expired).update(
+            points=Greatest(F('points') - PointsTransaction.amount_of(expirations, OuterRef('pk')), Value(0)),
+            pointsExpiryDate=PointsLot.next_expiry(),
+        )
+        PointsTotal.record_many(expirations)
+
+    return sum(expired.values()), len(lots), len(expired)
+
+
+def expire_points(now=None, chunk_size=1000, pause=0, dry_run=False):
+    """
+    Fait expirer tous les lots échus ; retourne (points expirés, lots,
+    transactions 'expire' écrites)
+    """
+    now = now or timezone.now()
+    if dry_run:
+        due = due_lots(now).aggregate(points=Sum('remaining'), lots=Count('pk'))
+        return due['points'] or 0, due['lots'], 0
+
+    points_total = lots_total = transactions_total = 0
+    while True:
+        lot_ids = list(due_lots(now).order_by('expires_at', 'pk').values_list('pk', flat=True)[:chunk_size])
+        if not lot_ids:
+            break
+        points, lots, programs = expire_chunk(lot_ids, now)
+        points_total += points
+        lots_total += lots
+        transactions_total += programs
+        time.sleep(pause)
+
+    return points_total, lots_total, transactions_total
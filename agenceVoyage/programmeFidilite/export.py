@@ -0,0 +1,125 @@
+"""Export CSV en flux de l'historique des points.
+
+Les transactions sont lues par lots paginés par clé (pk décroissant, sans
+OFFSET), chaque lot avec un itérateur côté serveur, et les lignes CSV sont
+envoyées au fil de l'eau par une StreamingHttpResponse, éventuellement
+compressées en gzip. La mémoire utilisée ne dépend que de la taille d'un
+lot, quelle que soit la taille de l'export.
+"""
+import csv
+import zlib
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import PointsTransaction
+
+
+HEADER = ['Date', 'Time', 'Type', 'Points', 'Description']
+# Export de tous les programmes (administration) : une colonne client en plus
+ALL_PROGRAMS_HEADER = ['Client'] + HEADER
+
+CHUNK_SIZE = 2000
+# Taille des morceaux envoyés au client (octets avant compression)
+BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """Pseudo-fichier : csv.writer renvoie la ligne formatée au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def filter_dates(transactions, start=None, end=None):
+    """
+    Filtre par dates (« AAAA-MM-JJ », bornes incluses) ; lève ValueError si
+    une date est invalide
+    """
+    for value, lookup in ((start, 'created_at__date__gte'), (end, 'created_at__date__lte')):
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Date invalide : {value}")
+        transactions = transactions.filter(**{lookup: day})
+    return transactions
+
+
+def keyset_rows(transactions, fields, chunk_size=CHUNK_SIZE):
+    """Valeurs des transactions, de la plus récente à la plus ancienne, lot par lot"""
+    last_pk = None
+    while True:
+        chunk = transactions.order_by('-pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__lt=last_pk)
+
+        read = 0
+        for row in chunk.values_list('pk', *fields)[:chunk_size].iterator(chunk_size=chunk_size):
+            read += 1
+            last_pk = row[0]
+            yield row[1:]
+        if read < chunk_size:
+            return
+
+
+def transaction_rows(transactions, with_client=False, chunk_size=CHUNK_SIZE):
+    """Lignes CSV (mêmes colonnes que HEADER, précédées du client si with_client)"""
+    labels = dict(PointsTransaction.TRANSACTION_TYPES)
+    fields = ['created_at', 'transaction_type', 'points_amount', 'description']
+    if with_client:
+        fields.append('loyalty_program__user__email')
+
+    for row in keyset_rows(transactions, fields, chunk_size):
+        created_at, transaction_type, points_amount, description = row[:4]
+        line = [
+            created_at.strftime('%Y-%m-%d'),
+            created_at.strftime('%H:%M:%S'),
+            labels.get(transaction_type, transaction_type),
+            points_amount,
+            description,
+        ]
+        yield [row[4]] + line if with_client else line
+
+
+def stream_csv(rows, header):
+    """Texte CSV par morceaux d'environ BUFFER_SIZE caractères"""
+    writer = csv.writer(Echo())
+    buffer = [writer.writerow(header)]
+    size = len(buffer[0])
+    for row in rows:
+        line = writer.writerow(row)
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def gzip_stream(pieces):
+    """Compresse un flux de texte au format gzip, morceau par morceau"""
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # en-tête et pied gzip
+    for piece in pieces:
+        data = compressor.compress(piece.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(transactions, filename, with_client=False, compress=False):
+    """StreamingHttpResponse de l'export (fichier .csv ou .csv.gz)"""
+    header = ALL_PROGRAMS_HEADER if with_client else HEADER
+    content = stream_csv(transaction_rows(transactions, with_client), header)
+    filename = f'{filename}_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv'
+
+    if compress:
+        response = StreamingHttpResponse(gzip_stream(content), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
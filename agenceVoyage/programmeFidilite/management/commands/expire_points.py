@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from programmeFidilite import expiry
+
+
+class Command(BaseCommand):
+    help = (
+        "Fait expirer les lots de points échus de tous les programmes, par petits "
+        "lots, et écrit les transactions 'expire' correspondantes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Lots de points par transaction")
+        parser.add_argument('--pause', type=float, default=0, help="Pause entre deux transactions (secondes)")
+        parser.add_argument('--dry-run', action='store_true', help="Compte seulement, sans rien modifier")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        points, lots, transactions = expiry.expire_points(
+            chunk_size=max(options['chunk_size'], 1),
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+        )
+
+        prefix = "[simulation] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{points} points expirés sur {lots} lots ({transactions} transactions) "
+            f"en {time.monotonic() - started:.1f}s"
+        ))
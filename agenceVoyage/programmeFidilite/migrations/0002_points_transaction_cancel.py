@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmeFidilite', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointstransaction',
+            name='transaction_type',
+            field=models.CharField(choices=[('earn', 'Points gagnés'), ('redeem', 'Points utilisés'), ('expire', 'Points expirés'), ('bonus', 'Bonus points'), ('cancel', 'Points annulés')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_points_totals(apps, schema_editor):
+    """Totaux initiaux à partir de l'historique existant (une requête d'agrégation)"""
+    PointsTransaction = apps.get_model('programmeFidilite', 'PointsTransaction')
+    PointsTotal = apps.get_model('programmeFidilite', 'PointsTotal')
+
+    groups = (
+        PointsTransaction.objects.values('loyalty_program_id', 'transaction_type')
+        .annotate(total=Sum('points_amount'), count=Count('pk'))
+        .order_by()
+    )
+    PointsTotal.objects.bulk_create(
+        (PointsTotal(**group) for group in groups.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmeFidilite', '0002_points_transaction_cancel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('earn', 'Points gagnés'), ('redeem', 'Points utilisés'), ('expire', 'Points expirés'), ('bonus', 'Bonus points'), ('cancel', 'Points annulés')], max_length=20)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('loyalty_program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_totals', to='programmeFidilite.loyaltyprogram')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('loyalty_program', 'transaction_type'), name='unique_points_total_type')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pointstransaction',
+            index=models.Index(fields=['loyalty_program', '-created_at'], name='points_tx_program_created_idx'),
+        ),
+        migrations.RunPython(populate_points_totals, migrations.RunPython.noop),
+    ]
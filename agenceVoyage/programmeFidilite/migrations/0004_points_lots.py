@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:16
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_points_lots(apps, schema_editor):
+    """Un lot par programme pour le solde existant, qui expire à pointsExpiryDate"""
+    LoyaltyProgram = apps.get_model('programmeFidilite', 'LoyaltyProgram')
+    PointsLot = apps.get_model('programmeFidilite', 'PointsLot')
+    default_expiry = timezone.now() + timedelta(days=365)
+
+    programs = LoyaltyProgram.objects.filter(points__gt=0).values_list('pk', 'points', 'pointsExpiryDate')
+    batch = []
+    for pk, points, expires_at in programs.iterator(chunk_size=2000):
+        batch.append(PointsLot(
+            loyalty_program_id=pk, points=points, remaining=points, expires_at=expires_at or default_expiry,
+        ))
+        if len(batch) >= 2000:
+            PointsLot.objects.bulk_create(batch)
+            batch = []
+    PointsLot.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('programmeFidilite', '0003_points_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.PositiveIntegerField()),
+                ('remaining', models.PositiveIntegerField()),
+                ('earned_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('expired_at', models.DateTimeField(blank=True, null=True)),
+                ('loyalty_program', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points_lots', to='programmeFidilite.loyaltyprogram')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lots', to='programmeFidilite.pointstransaction')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('remaining__gt', 0)), fields=['expires_at'], name='points_lot_due_idx'), models.Index(condition=models.Q(('remaining__gt', 0)), fields=['loyalty_program', 'expires_at'], name='points_lot_fifo_idx')],
+            },
+        ),
+        migrations.RunPython(populate_points_lots, migrations.RunPython.noop),
+    ]
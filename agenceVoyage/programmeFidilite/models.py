@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.conf import settings
 from datetime import timedelta
 from django.utils import timezone
 
+from . import tiers
+
+
+# Durée de validité des points d'une accumulation
+POINTS_VALIDITY = timedelta(days=365)
+
 
 class loyaltyTier(models.TextChoices):  
     BRONZE = 'BRONZE', 'Bronze'
@@ -52,19 +60,46 @@ class LoyaltyProgram(models.Model):
         return f"LoyaltyProgram for {self.user.get_full_name()} - Tier: {self.tier}"
     
     def get_tier_config(self):
-        """Récupère la configuration du tier actuel"""
-        return FidelityTierConfig.objects.filter(tier=self.tier).first()
+        """Récupère la configuration du tier actuel (table en mémoire, voir tiers.py)"""
+        return tiers.get_table().get(self.tier)
+    
+    def get_progression(self):
+        """Progression vers le prochain tier"""
+        return tiers.get_table().progression(self.totalEarnedPoints)
+    
+    # Les soldes ne sont jamais lus puis réécrits en Python : chaque opération
+    # est un seul UPDATE conditionnel (F() expressions), suivi de l'écriture
+    # de la ligne d'historique dans la même transaction courte. Des workers
+    # concurrents sur le même programme ne perdent donc aucune mise à jour,
+    # et aucun verrou n'est gardé pendant les calculs Python.
+    #
+    # Les lots de points (PointsLot) ne sont modifiés qu'après l'UPDATE du
+    # programme, qui verrouille sa ligne jusqu'au commit : les opérations sur
+    # un même programme (et la purge, voir expiry.py) s'y sérialisent, toujours
+    # dans le même ordre (programme puis lots).
+    
+    BALANCE_FIELDS = ['points', 'totalEarnedPoints', 'totalRedeemedPoints', 'pointsExpiryDate', 'tier', 'last_tier_update']
+    
+    def _tier_changes(self, earned):
+        """Champs tier de l'UPDATE, calculés en SQL à partir des points totaux après l'opération"""
+        tier = tiers.get_table().tier_expression(earned)
+        if tier is None:
+            return {}
+        # last_tier_update avant tier : MySQL évalue le SET de gauche à droite
+        return {
+            'last_tier_update': Case(
+                When(tier=tier, then=F('last_tier_update')),
+                default=Value(timezone.now()),
+            ),
+            'tier': tier,
+        }
     
     def update_tier(self):
         """Met à jour le tier en fonction des points totaux"""
-        tier_config = FidelityTierConfig.objects.filter(
-            points_requis_min__lte=self.totalEarnedPoints
-        ).order_by('-points_requis_min').first()
-        
-        if tier_config:
-            self.tier = tier_config.tier
-            self.last_tier_update = timezone.now()
-            self.save()
+        changes = self._tier_changes(F('totalEarnedPoints'))
+        if changes:
+            LoyaltyProgram.objects.filter(pk=self.pk).update(**changes)
+            self.refresh_from_db(fields=['tier', 'last_tier_update'])
     
     def add_points(self, reservation):
         """
@@ -73,8 +108,9 @@ class LoyaltyProgram(models.Model):
         """
         points_base = int(reservation.prix_total * 10)
         
-        # Bonus 50% si hébergement 5 étoiles
-        bonus = int(points_base * 0.5) if reservation.hebergement.etoiles == 5 else 0
+        # Bonus 50% si l'offre réservée a un hébergement 5 étoiles
+        has_five_star = reservation.offre.hebergements.filter(etoiles=5).exists()
+        bonus = int(points_base * 0.5) if has_five_star else 0
         
         total_points = points_base + bonus
         
@@ -83,12 +119,31 @@ class LoyaltyProgram(models.Model):
         if tier_config:
             total_points = int(total_points * tier_config.bonus_multiplier)
         
-        self.points += total_points
-        self.totalEarnedPoints += total_points
-        self.pointsExpiryDate = timezone.now() + timedelta(days=365)
-        
-        self.update_tier()
-        self.save()
+        earned = F('totalEarnedPoints') + total_points
+        expires_at = timezone.now() + POINTS_VALIDITY
+        with transaction.atomic():
+            LoyaltyProgram.objects.filter(pk=self.pk).update(
+                points=F('points') + total_points,
+                totalEarnedPoints=earned,
+                # Le nouveau lot expire après tous les lots existants
+                pointsExpiryDate=Coalesce(PointsLot.next_expiry(), Value(expires_at)),
+                **self._tier_changes(earned),
+            )
+            accrual = PointsTransaction.objects.create(
+                loyalty_program=self,
+                transaction_type='earn',
+                points_amount=total_points,
+                reservation=reservation,
+                description=f'Points gagnés de la réservation {reservation.id_reservation}',
+            )
+            PointsLot.objects.create(
+                loyalty_program=self,
+                transaction=accrual,
+                points=total_points,
+                remaining=total_points,
+                expires_at=expires_at,
+            )
+        self.refresh_from_db(fields=self.BALANCE_FIELDS)
         
         return total_points
     
@@ -96,16 +151,89 @@ class LoyaltyProgram(models.Model):
         """
         Convertit les points en réduction
         1 point = 0.01€ de réduction
+        Retourne None si le solde est insuffisant au moment de l'UPDATE
         """
-        if points_to_redeem > self.points:
-            return None
-        
         reduction_amount = points_to_redeem * 0.01
-        self.points -= points_to_redeem
-        self.totalRedeemedPoints += points_to_redeem
-        self.save()
+        with transaction.atomic():
+            redeemed = LoyaltyProgram.objects.filter(pk=self.pk, points__gte=points_to_redeem).update(
+                points=F('points') - points_to_redeem,
+                totalRedeemedPoints=F('totalRedeemedPoints') + points_to_redeem,
+            )
+            if redeemed:
+                self._consume_lots(points_to_redeem)
+                PointsTransaction.objects.create(
+                    loyalty_program=self,
+                    transaction_type='redeem',
+                    points_amount=points_to_redeem,
+                    description=f'Rédemption de {points_to_redeem} points pour {reduction_amount}€',
+                )
+        self.refresh_from_db(fields=self.BALANCE_FIELDS)
         
-        return reduction_amount
+        return reduction_amount if redeemed else None
+    
+    def cancel_points(self, points_to_cancel, reservation_id, accrual_id=None):
+        """
+        Annule les points gagnés d'une réservation supprimée ; le solde ne
+        descend pas sous zéro si une partie a déjà été utilisée. Les points
+        sont d'abord retirés du lot de la transaction 'earn' accrual_id.
+        """
+        earned = Greatest(F('totalEarnedPoints') - points_to_cancel, Value(0))
+        with transaction.atomic():
+            LoyaltyProgram.objects.filter(pk=self.pk).update(
+                points=Greatest(F('points') - points_to_cancel, Value(0)),
+                totalEarnedPoints=earned,
+                **self._tier_changes(earned),
+            )
+            self._consume_lots(points_to_cancel, accrual_id)
+            PointsTransaction.objects.create(
+                loyalty_program=self,
+                transaction_type='cancel',
+                points_amount=points_to_cancel,
+                description=f'Points annulés (annulation réservation {reservation_id})',
+            )
+        self.refresh_from_db(fields=self.BALANCE_FIELDS)
+    
+    def _consume_lots(self, points, accrual_id=None):
+        """
+        Retire points des lots qui expirent le plus tôt (FIFO), après le lot
+        de la transaction accrual_id s'il est donné, puis met à jour la
+        prochaine date d'expiration. À appeler dans la transaction, après
+        l'UPDATE du solde du programme.
+        """
+        emptied = []
+        partial = None
+        order = ['expires_at', 'pk']
+        if accrual_id is not None:
+            order.insert(0, Case(When(transaction_id=accrual_id, then=Value(0)), default=Value(1)))
+        lots = self.points_lots.filter(remaining__gt=0).order_by(*order).values_list('pk', 'remaining')
+        for pk, remaining in lots.iterator(chunk_size=100):
+            if remaining <= points:
+                emptied.append(pk)
+                points -= remaining
+            else:
+                partial = (pk, points)
+                points = 0
+            if not points:
+                break
+        
+        if emptied:
+            PointsLot.objects.filter(pk__in=emptied).update(remaining=0)
+        if partial:
+            PointsLot.objects.filter(pk=partial[0]).update(remaining=F('remaining') - partial[1])
+        LoyaltyProgram.objects.filter(pk=self.pk).update(pointsExpiryDate=PointsLot.next_expiry())
+    
+    def points_stats(self):
+        """
+        Totaux de l'historique par type (total_earned, total_redeemed, ...) :
+        lus dans PointsTotal, à défaut calculés en une requête sur l'historique
+        """
+        totals = dict(self.points_totals.values_list('transaction_type', 'total'))
+        if not totals:
+            return PointsTransaction.stats(self.transactions.all())
+        return {
+            key: totals.get(transaction_type, 0)
+            for transaction_type, key in PointsTransaction.STAT_KEYS.items()
+        }
     
     def get_discount_percentage(self):
         """Retourne le pourcentage de remise selon le tier"""
@@ -120,6 +248,7 @@ class PointsTransaction(models.Model):
         ('redeem', 'Points utilisés'),
         ('expire', 'Points expirés'),
         ('bonus', 'Bonus points'),
+        ('cancel', 'Points annulés'),
     ]
     
     loyalty_program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='transactions')
@@ -129,8 +258,136 @@ class PointsTransaction(models.Model):
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Clés des statistiques de l'historique, par type de transaction
+    STAT_KEYS = {
+        'earn': 'total_earned',
+        'redeem': 'total_redeemed',
+        'expire': 'total_expired',
+        'bonus': 'total_bonus',
+        'cancel': 'total_cancelled',
+    }
+    
     def __str__(self):
         return f"{self.loyalty_program.user.username} - {self.transaction_type}: {self.points_amount} pts"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Historique d'un programme, du plus récent au plus ancien
+            models.Index(fields=['loyalty_program', '-created_at'], name='points_tx_program_created_idx'),
+        ]
+    
+    @classmethod
+    def stats(cls, transactions):
+        """Totaux par type d'un ensemble de transactions, en une seule requête (agrégation conditionnelle)"""
+        totals = transactions.order_by().aggregate(**{
+            key: Sum('points_amount', filter=Q(transaction_type=transaction_type))
+            for transaction_type, key in cls.STAT_KEYS.items()
+        })
+        return {key: total or 0 for key, total in totals.items()}
+    
+    @classmethod
+    def amount_of(cls, transactions, loyalty_program):
+        """
+        Points de la transaction du programme parmi transactions (au plus une
+        par programme), en sous-requête pour un UPDATE
+        """
+        return Subquery(
+            cls.objects.filter(pk__in=[tx.pk for tx in transactions], loyalty_program=loyalty_program)
+            .order_by().values('points_amount')[:1]
+        )
+
+
+class PointsTotal(models.Model):
+    """
+    Totaux de l'historique par programme et type de transaction, tenus à jour
+    à chaque écriture de PointsTransaction (voir signals.py) : les
+    statistiques se lisent sans parcourir l'historique.
+    """
+    loyalty_program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='points_totals')
+    transaction_type = models.CharField(max_length=20, choices=PointsTransaction.TRANSACTION_TYPES)
+    total = models.PositiveBigIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loyalty_program', 'transaction_type'], name='unique_points_total_type'),
+        ]
+    
+    def __str__(self):
+        return f"{self.loyalty_program_id} - {self.transaction_type}: {self.total} pts ({self.count})"
+    
+    @classmethod
+    def record(cls, loyalty_program_id, transaction_type, points_amount, delta):
+        """Ajoute (delta=1) ou retire (delta=-1) une transaction des totaux du programme"""
+        if delta > 0:
+            cls.objects.bulk_create(
+                [cls(loyalty_program_id=loyalty_program_id, transaction_type=transaction_type)],
+                ignore_conflicts=True,
+            )
+        cls.objects.filter(loyalty_program_id=loyalty_program_id, transaction_type=transaction_type).update(
+            total=Greatest(F('total') + points_amount * delta, Value(0)),
+            count=Greatest(F('count') + delta, Value(0)),
+            updated_at=timezone.now(),
+        )
+    
+    @classmethod
+    def record_many(cls, transactions):
+        """
+        Ajoute aux totaux des transactions créées par bulk_create (qui ne
+        déclenchent pas les signaux), de même type et au plus une par
+        programme, en deux requêtes
+        """
+        if not transactions:
+            return
+        transaction_type = transactions[0].transaction_type
+        program_ids = [tx.loyalty_program_id for tx in transactions]
+        cls.objects.bulk_create(
+            [cls(loyalty_program_id=program_id, transaction_type=transaction_type) for program_id in program_ids],
+            ignore_conflicts=True,
+        )
+        cls.objects.filter(transaction_type=transaction_type, loyalty_program_id__in=program_ids).update(
+            total=F('total') + PointsTransaction.amount_of(transactions, OuterRef('loyalty_program_id')),
+            count=F('count') + 1,
+            updated_at=timezone.now(),
+        )
+
+
+class PointsLot(models.Model):
+    """
+    Points d'une accumulation, avec leur propre date d'expiration. Les
+    rédemptions consomment les lots qui expirent le plus tôt (FIFO) ; la
+    commande expire_points fait expirer les lots échus (voir expiry.py).
+    La somme des remaining d'un programme est son solde de points.
+    """
+    loyalty_program = models.ForeignKey(LoyaltyProgram, on_delete=models.CASCADE, related_name='points_lots')
+    transaction = models.ForeignKey(
+        PointsTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='lots'
+    )
+    points = models.PositiveIntegerField()
+    remaining = models.PositiveIntegerField()
+    earned_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    expired_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Lots échus, pour la purge
+            models.Index(fields=['expires_at'], name='points_lot_due_idx', condition=Q(remaining__gt=0)),
+            # Lots d'un programme dans l'ordre de consommation
+            models.Index(
+                fields=['loyalty_program', 'expires_at'], name='points_lot_fifo_idx', condition=Q(remaining__gt=0),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.loyalty_program_id} - {self.remaining}/{self.points} pts (expire le {self.expires_at:%Y-%m-%d})"
+    
+    @classmethod
+    def next_expiry(cls):
+        """Date d'expiration du prochain lot non vide (sous-requête pour un UPDATE de LoyaltyProgram)"""
+        return Subquery(
+            cls.objects.filter(loyalty_program=OuterRef('pk'), remaining__gt=0)
+            .order_by('expires_at').values('expires_at')[:1]
+        )
\ No newline at end of file
@@ -1,8 +1,18 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.db import transaction
 from reservation.models import Reservation
-from .models import LoyaltyProgram, PointsTransaction
+from .models import FidelityTierConfig, LoyaltyProgram, PointsTotal, PointsTransaction
+from . import tiers
+
+
+@receiver(post_save, sender=FidelityTierConfig)
+@receiver(post_delete, sender=FidelityTierConfig)
+def invalidate_tier_table(sender, **kwargs):
+    """Table des tiers modifiée : rechargée par tous les processus (après commit,
+    pour qu'aucun processus ne relise l'ancienne version sous le nouveau jeton)"""
+    transaction.on_commit(tiers.invalidate)
 
 
 @receiver(post_save, sender=Reservation)
@@ -11,64 +21,65 @@ def update_loyalty_on_reservation(sender, instance, created, **kwargs):
     Signal automatique pour mettre à jour les points de fidélité
     quand une réservation est créée et payée
     """
-    try:
-        loyalty = LoyaltyProgram.objects.get(user=instance.client)
-    except LoyaltyProgram.DoesNotExist:
-        # Créer le programme de fidélité si n'existe pas
-        loyalty = LoyaltyProgram.objects.create(user=instance.client)
+    if not created:
+        return
     
-    # Récupérer l'hébergement associé à l'offre
-    # Note: Vous devez adapter cette logique selon votre relation entre Offre et Hebergement
-    try:
-        hebergements = instance.offre.hebergements.all()
-        hebergement = hebergements.first() if hebergements.exists() else None
-    except:
-        hebergement = None
+    # Créer le programme de fidélité si n'existe pas
+    loyalty, _ = LoyaltyProgram.objects.get_or_create(user=instance.client)
     
-    if hebergement:
-        # Ajouter les points
-        points_earned = loyalty.add_points(instance)
-        
-        # Créer une transaction
-        PointsTransaction.objects.create(
-            loyalty_program=loyalty,
-            transaction_type='earn',
-            points_amount=points_earned,
-            reservation=instance,
-            description=f'Points gagnés de la réservation {instance.id_reservation}'
-        )
+    # Seules les offres avec hébergement rapportent des points
+    if instance.offre.hebergements.exists():
+        # Ajoute les points et la transaction 'earn' (voir LoyaltyProgram.add_points)
+        loyalty.add_points(instance)
+
+
+@receiver(pre_delete, sender=Reservation)
+def remember_earned_points(sender, instance, **kwargs):
+    """
+    Points gagnés par la réservation, lus avant la suppression : ensuite la
+    transaction 'earn' n'y est plus liée (on_delete=SET_NULL)
+    """
+    instance._earned_points = PointsTransaction.objects.filter(
+        loyalty_program__user=instance.client_id,
+        reservation=instance,
+        transaction_type='earn',
+    ).values_list('loyalty_program_id', 'points_amount', 'pk').first()
 
 
 @receiver(post_delete, sender=Reservation)
 def refund_loyalty_on_cancellation(sender, instance, **kwargs):
     """
-    Signal automatique pour rembourser les points de fidélité
+    Signal automatique pour retirer les points de fidélité
     quand une réservation est annulée
     """
-    try:
-        loyalty = LoyaltyProgram.objects.get(user=instance.client)
-        
-        # Récupérer la transaction correspondante
-        transaction = PointsTransaction.objects.filter(
-            loyalty_program=loyalty,
-            reservation=instance,
-            transaction_type='earn'
-        ).first()
-        
-        if transaction:
-            # Rembourser les points
-            loyalty.points += transaction.points_amount
-            loyalty.totalEarnedPoints -= transaction.points_amount
-            loyalty.update_tier()
-            loyalty.save()
-            
-            # Créer une transaction de remboursement
-            PointsTransaction.objects.create(
-                loyalty_program=loyalty,
-                transaction_type='earn',
-                points_amount=-transaction.points_amount,
-                reservation=instance,
-                description=f'Points remboursés (annulation réservation {instance.id_reservation})'
-            )
-    except LoyaltyProgram.DoesNotExist:
-        pass
+    earned = getattr(instance, '_earned_points', None)
+    if not earned:
+        return
+    
+    loyalty_program_id, points_amount, accrual_id = earned
+    loyalty = LoyaltyProgram.objects.filter(pk=loyalty_program_id).first()
+    if loyalty:
+        loyalty.cancel_points(points_amount, instance.id_reservation, accrual_id)
+
+
+@receiver(pre_save, sender=PointsTransaction)
+def stash_previous_transaction(sender, instance, **kwargs):
+    instance._previous_transaction = None
+    if instance.pk:
+        instance._previous_transaction = (
+            PointsTransaction.objects.filter(pk=instance.pk).values_list('transaction_type', 'points_amount').first()
+        )
+
+
+@receiver(post_save, sender=PointsTransaction)
+def record_points_total(sender, instance, **kwargs):
+    """Met à jour les totaux du programme : retire l'ancienne version, ajoute la nouvelle"""
+    previous = getattr(instance, '_previous_transaction', None)
+    if previous is not None:
+        PointsTotal.record(instance.loyalty_program_id, *previous, delta=-1)
+    PointsTotal.record(instance.loyalty_program_id, instance.transaction_type, instance.points_amount, delta=1)
+
+
+@receiver(post_delete, sender=PointsTransaction)
+def forget_points_total(sender, instance, **kwargs):
+    PointsTotal.record(instance.loyalty_program_id, instance.transaction_type, instance.points_amount, delta=-1)
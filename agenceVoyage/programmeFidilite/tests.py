@@ -1,3 +1,324 @@
-from django.test import TestCase
+import gzip
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from offreDestination.models import Destination, Hebergement, Offre
+from reservation.models import Reservation
+from .models import FidelityTierConfig, LoyaltyProgram, PointsLot, PointsTransaction
+from . import expiry, export, tiers
+
+
+def create_tiers():
+    for tier, minimum, maximum in [
+        ('BRONZE', 0, 999), ('SILVER', 1000, 4999), ('GOLD', 5000, 19999), ('PLATINUM', 20000, 1000000),
+    ]:
+        FidelityTierConfig.objects.create(
+            tier=tier, points_requis_min=minimum, points_requis_max=maximum,
+            pourcentage_remise=Decimal('5.00'), bonus_multiplier=Decimal('1.00'),
+        )
+    tiers.invalidate()
+
+
+def create_offer(etoiles=4):
+    destination = Destination.objects.create(
+        nom_destination="Djerba", pays="Tunisie", description="Île", image="destinations/djerba.jpg"
+    )
+    hebergement = Hebergement.objects.create(
+        nom_hebergement="Hôtel Mer", type_hebergement="hotel", destination=destination,
+        prix_par_nuit=Decimal('120.00'), etoiles=etoiles,
+    )
+    offer = Offre.objects.create(
+        titre="Offre", description="Séjour", prix_par_personne=Decimal('50.00'), image="offres/offre.jpg",
+    )
+    offer.nom_destinations.add(destination)
+    hebergement.offres.add(offer)
+    return offer
+
+
+class TierTableTests(TestCase):
+    """Table des tiers en mémoire, rechargée après un changement fait par un autre processus"""
+
+    def setUp(self):
+        create_tiers()
+
+    def tearDown(self):
+        tiers.invalidate()
+
+    def test_table_reloads_on_other_process_token(self):
+        self.assertEqual(tiers.get_table().resolve(1200).tier, 'SILVER')
+
+        # Autre processus : la configuration change et il remplace le jeton partagé
+        FidelityTierConfig.objects.filter(tier='SILVER').update(points_requis_min=1500)
+        cache.set(tiers.VERSION_KEY, 'autre-processus', timeout=None)
+
+        self.assertEqual(tiers.get_table().resolve(1200).tier, 'BRONZE')
+
+    def test_table_reloads_after_ttl_without_invalidation(self):
+        with mock.patch('programmeFidilite.tiers.time.monotonic', return_value=1000):
+            table = tiers.get_table()
+        FidelityTierConfig.objects.filter(tier='SILVER').update(points_requis_min=1500)
+
+        with mock.patch('programmeFidilite.tiers.time.monotonic', return_value=1000 + tiers.TTL - 1):
+            self.assertIs(tiers.get_table(), table)
+        with mock.patch('programmeFidilite.tiers.time.monotonic', return_value=1000 + tiers.TTL):
+            self.assertEqual(tiers.get_table().resolve(1200).tier, 'BRONZE')
+
+
+class PointsLedgerTests(TestCase):
+    """Soldes, tier et historique restent cohérents"""
+
+    def setUp(self):
+        create_tiers()
+        self.user = get_user_model().objects.create_user(email="client@example.com", password="x")
+        self.offer = create_offer(etoiles=5)
+
+    def tearDown(self):
+        tiers.invalidate()
+
+    def test_reservation_earns_points_once_with_five_star_bonus(self):
+        reservation = Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        reservation.save()  # une mise à jour ne rapporte pas de points
+
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        self.assertEqual(loyalty.points, 1500)  # 100 € × 10, +50 % (5 étoiles)
+        self.assertEqual(loyalty.totalEarnedPoints, 1500)
+        self.assertEqual(loyalty.tier, 'SILVER')
+        self.assertEqual(list(loyalty.transactions.values_list('transaction_type', 'points_amount')), [('earn', 1500)])
+
+    def test_tier_date_changes_only_with_the_tier(self):
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        earlier = timezone.now() - timedelta(days=30)
+        LoyaltyProgram.objects.filter(user=self.user).update(last_tier_update=earlier)
+
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        self.assertEqual((loyalty.tier, loyalty.last_tier_update), ('SILVER', earlier))
+
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=4)
+        loyalty.refresh_from_db()
+        self.assertEqual(loyalty.tier, 'GOLD')
+        self.assertGreater(loyalty.last_tier_update, earlier)
+
+    def test_redeem_is_refused_above_balance(self):
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+
+        self.assertIsNone(loyalty.redeem_points(751))
+        self.assertEqual(loyalty.redeem_points(500), 5.0)
+        self.assertEqual((loyalty.points, loyalty.totalRedeemedPoints), (250, 500))
+        self.assertEqual(loyalty.transactions.filter(transaction_type='redeem').count(), 1)
+
+    def test_cancellation_removes_earned_points(self):
+        reservation = Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        loyalty.redeem_points(1000)
+
+        reservation.delete()
+
+        loyalty.refresh_from_db()
+        self.assertEqual((loyalty.points, loyalty.totalEarnedPoints), (0, 0))
+        self.assertEqual(loyalty.tier, 'BRONZE')
+        self.assertEqual(loyalty.transactions.get(transaction_type='cancel').points_amount, 1500)
+
+    def test_points_stats_follow_the_ledger(self):
+        reservation = Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        loyalty.redeem_points(300)
+        reservation.delete()
+        ledger = PointsTransaction.stats(loyalty.transactions.all())
+
+        with self.assertNumQueries(1):
+            stats = loyalty.points_stats()
+        self.assertEqual(stats, ledger)
+        self.assertEqual(
+            (stats['total_earned'], stats['total_redeemed'], stats['total_cancelled']), (2250, 300, 1500)
+        )
+
+        # Sans totaux (historique antérieur), une seule agrégation conditionnelle
+        loyalty.points_totals.all().delete()
+        with self.assertNumQueries(2):
+            self.assertEqual(loyalty.points_stats(), ledger)
+
+    def test_redemption_consumes_lots_first_to_expire(self):
+        first = Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        lots = list(loyalty.points_lots.order_by('pk'))
+        self.assertEqual([lot.remaining for lot in lots], [750, 1500])
+
+        loyalty.redeem_points(1000)
+
+        self.assertEqual([lot.remaining for lot in loyalty.points_lots.order_by('pk')], [0, 1250])
+        self.assertEqual(loyalty.pointsExpiryDate, lots[1].expires_at)
+
+    def test_cancellation_consumes_the_reservation_lot(self):
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        later = Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        first_lot, later_lot = loyalty.points_lots.order_by('expires_at')
+
+        later.delete()
+
+        first_lot.refresh_from_db()
+        later_lot.refresh_from_db()
+        self.assertEqual((first_lot.remaining, later_lot.remaining), (750, 0))
+        loyalty.refresh_from_db()
+        self.assertEqual((loyalty.points, loyalty.pointsExpiryDate), (750, first_lot.expires_at))
+
+    def test_expiry_sweep_expires_due_lots_in_bulk(self):
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=1)
+        Reservation.objects.create(client=self.user, offre=self.offer, nb_personnes=2)
+        other = get_user_model().objects.create_user(email="autre@example.com", password="x")
+        Reservation.objects.create(client=other, offre=self.offer, nb_personnes=1)
+        loyalty = LoyaltyProgram.objects.get(user=self.user)
+        loyalty.redeem_points(500)
+        PointsLot.objects.exclude(remaining=1500).update(expires_at=timezone.now() - timedelta(days=1))
+
+        # Nombre de requêtes fixe par lot : sélection, 10 requêtes (dont savepoint), sélection vide
+        with self.assertNumQueries(12):
+            self.assertEqual(expiry.expire_points(chunk_size=10), (250 + 750, 2, 2))
+
+        loyalty.refresh_from_db()
+        self.assertEqual(loyalty.points, 1500)
+        self.assertEqual(loyalty.transactions.get(transaction_type='expire').points_amount, 250)
+        self.assertEqual(loyalty.points_stats()['total_expired'], 250)
+        self.assertEqual(LoyaltyProgram.objects.get(user=other).points, 0)
+        self.assertEqual(expiry.expire_points(), (0, 0, 0))
+
+
+class TransactionExportTests(TestCase):
+    """Export CSV en flux de l'historique"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(email="export@example.com", password="x")
+        cls.loyalty = LoyaltyProgram.objects.create(user=cls.user)
+        PointsTransaction.objects.bulk_create([
+            PointsTransaction(loyalty_program=cls.loyalty, transaction_type='earn', points_amount=i, description=f"Ligne {i}")
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_export_streams_every_row_in_chunks(self):
+        with self.assertNumQueries(3):  # une requête par lot de 10
+            rows = list(export.transaction_rows(self.loyalty.transactions.all(), chunk_size=10))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0][2:], ['Points gagnés', 24, 'Ligne 24'])
+
+        response = self.client.get('/loyalty/history/', {'export': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(export.HEADER))
+        self.assertEqual(len(lines), 26)
+
+    def test_gzip_and_date_filters(self):
+        today = timezone.now().date().isoformat()
+        response = self.client.get('/loyalty/history/', {'export': 'csv', 'gzip': '1', 'start': today})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 26)
+
+        response = self.client.get('/loyalty/history/', {'export': 'csv', 'end': '2000-01-01'})
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+        response = self.client.get('/loyalty/history/', {'export': 'csv', 'start': 'hier'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentPointsTests(TransactionTestCase):
+    """Accumulations et rédemptions concurrentes sur le même programme
+    (base de test sur fichier, voir DATABASES['default']['TEST'])"""
+
+    WORKERS = 8
+    OPERATIONS = 25
+
+    def setUp(self):
+        create_tiers()
+        self.user = get_user_model().objects.create_user(email="stress@example.com", password="x")
+        self.offer = create_offer()
+        self.loyalty = LoyaltyProgram.objects.create(user=self.user, points=1000, totalEarnedPoints=1000)
+        PointsLot.objects.create(
+            loyalty_program=self.loyalty, points=1000, remaining=1000, expires_at=timezone.now() + timedelta(days=30),
+        )
+
+    def tearDown(self):
+        tiers.invalidate()
+
+    def _run(self, worker):
+        errors = []
+        barrier = threading.Barrier(self.WORKERS)
+
+        def target(index):
+            try:
+                barrier.wait()
+                worker(index)
+            except Exception as exc:  # remonté au thread principal
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=target, args=(i,)) for i in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_operations_lose_no_update(self):
+        redeemed = []
+
+        # Réservations créées à l'avance : les workers ne font que les opérations sur les points
+        reservations = [
+            Reservation(client=self.user, offre=self.offer, nb_personnes=1, prix_total=self.offer.prix_par_personne)
+            for _ in range(self.WORKERS * self.OPERATIONS)
+        ]
+        reservations = Reservation.objects.bulk_create(reservations)
+
+        def worker(index):
+            loyalty = LoyaltyProgram.objects.get(pk=self.loyalty.pk)
+            for i in range(self.OPERATIONS):
+                if (index + i) % 2:
+                    loyalty.add_points(reservations[index * self.OPERATIONS + i])
+                elif loyalty.redeem_points(70) is not None:
+                    redeemed.append(70)
+
+        self._run(worker)
+
+        loyalty = LoyaltyProgram.objects.get(pk=self.loyalty.pk)
+        ledger = dict(loyalty.transactions.values_list('transaction_type').annotate(total=Sum('points_amount')))
+        self.assertEqual(ledger['redeem'], sum(redeemed))
+        self.assertEqual(loyalty.totalRedeemedPoints, sum(redeemed))
+        self.assertEqual(loyalty.totalEarnedPoints, 1000 + ledger['earn'])
+        self.assertEqual(loyalty.points, 1000 + ledger['earn'] - ledger['redeem'])
+        self.assertGreaterEqual(loyalty.points, 0)
+        self.assertEqual(loyalty.points_stats(), PointsTransaction.stats(loyalty.transactions.all()))
+        self.assertEqual(loyalty.points, loyalty.points_lots.aggregate(total=Sum('remaining'))['total'])
+
+    def test_concurrent_redemptions_never_overdraw(self):
+        redeemed = []
+
+        def worker(index):
+            loyalty = LoyaltyProgram.objects.get(pk=self.loyalty.pk)
+            for _ in range(self.OPERATIONS):
+                if loyalty.redeem_points(30) is not None:
+                    redeemed.append(30)
+
+        self._run(worker)
+
+        loyalty = LoyaltyProgram.objects.get(pk=self.loyalty.pk)
+        # 1000 points : 33 rédemptions de 30 au plus, quel que soit l'entrelacement
+        self.assertEqual(sum(redeemed), 990)
+        self.assertEqual(loyalty.points, 10)
+        self.assertEqual(PointsTransaction.objects.filter(transaction_type='redeem').count(), 33)
+        self.assertEqual(list(loyalty.points_lots.values_list('remaining', flat=True)), [10])
@@ -0,0 +1,177 @@
+"""Table des tiers de fidélité, gardée en mémoire par processus.
+
+FidelityTierConfig ne compte que quelques lignes, modifiées quelques fois par
+an : la table est lue une fois, figée (tuples immuables triés par
+points_requis_min) puis partagée par toutes les requêtes du processus. Les
+recherches (tier courant, tier suivant, seuil précédent, progression) se
+font par dichotomie sur points_requis_min, sans requête.
+
+L'enregistrement ou la suppression d'un FidelityTierConfig (voir
+signals.py) remplace un jeton de version stocké dans le cache Django,
+partagé par tous les processus (settings.CACHES) : chacun recharge sa
+table au prochain accès. Un QuerySet.update() ne déclenche pas les
+signaux ; appeler invalidate() après une modification en masse.
+
+Si une invalidation se perd malgré tout (modification qui contourne les
+signaux, backend de cache propre à chaque processus), la table est relue
+au plus tard FIDELITY_TIER_TABLE_TTL secondes après son chargement. Elle
+ne compte que quelques lignes : la relire coûte autant que vérifier une
+empreinte en base.
+"""
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+from django.db.models.lookups import GreaterThanOrEqual
+
+
+VERSION_KEY = 'programmeFidilite:tier_config_version'
+
+# Durée maximale (secondes) d'une table chargée, même sans invalidation
+TTL = getattr(settings, 'FIDELITY_TIER_TABLE_TTL', 60)
+
+FIELDS = ['id', 'tier', 'points_requis_min', 'points_requis_max', 'pourcentage_remise', 'bonus_multiplier']
+
+
+class TierConfig(namedtuple('TierConfig', FIELDS)):
+    """Copie figée d'un FidelityTierConfig (mêmes attributs pour les gabarits et serializers)"""
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_tier_display(self):
+        from .models import FidelityTierConfig
+        return dict(FidelityTierConfig.TIER_CHOICES).get(self.tier, self.tier)
+
+    def __str__(self):
+        return f"{self.tier} ({self.points_requis_min}-{self.points_requis_max} pts) - {self.pourcentage_remise}% remise"
+
+
+class TierTable:
+    """Tiers triés par points_requis_min, avec recherche par dichotomie"""
+
+    def __init__(self, tiers):
+        self.tiers = tuple(sorted(tiers, key=lambda tier: (tier.points_requis_min, tier.id)))
+        self._minimums = tuple(tier.points_requis_min for tier in self.tiers)
+        self._by_name = {tier.tier: tier for tier in self.tiers}
+
+    def __iter__(self):
+        return iter(self.tiers)
+
+    def __len__(self):
+        return len(self.tiers)
+
+    def get(self, name):
+        """Configuration d'un tier par son nom (None s'il n'est pas configuré)"""
+        return self._by_name.get(name)
+
+    def resolve(self, points):
+        """Tier atteint avec points (plus grand points_requis_min <= points)"""
+        i = bisect_right(self._minimums, points)
+        return self.tiers[i - 1] if i else None
+
+    def next_tier(self, points):
+        """Premier tier dont points_requis_min dépasse points"""
+        i = bisect_right(self._minimums, points)
+        return self.tiers[i] if i < len(self.tiers) else None
+
+    def previous_threshold(self, points):
+        """Plus grand points_requis_min strictement inférieur à points (0 sinon)"""
+        i = bisect_left(self._minimums, points)
+        return self._minimums[i - 1] if i else 0
+
+    def tier_expression(self, earned):
+        """
+        Tier atteint avec earned (expression SQL des points totaux), pour un
+        UPDATE ; le tier est inchangé sous le premier seuil. None si aucun tier
+        n'est configuré.
+        """
+        if not self.tiers:
+            return None
+        return Case(
+            *[
+                When(GreaterThanOrEqual(earned, Value(tier.points_requis_min)), then=Value(tier.tier))
+                for tier in reversed(self.tiers)
+            ],
+            default=F('tier'),
+        )
+
+    def progression(self, points):
+        """Progression vers le tier suivant (mêmes clés que le tableau de bord)"""
+        next_tier = self.next_tier(points)
+        percentage = 0
+        if next_tier:
+            previous = self.previous_threshold(points)
+            current_range = next_tier.points_requis_min - previous
+            percentage = int((points - previous) / current_range * 100) if current_range > 0 else 0
+
+        return {
+            'current_points': points,
+            'next_tier': next_tier,
+            'points_needed': next_tier.points_requis_min - points if next_tier else 0,
+            'percentage': min(percentage, 100),
+            'next_tier_min': next_tier.points_requis_min if next_tier else points,
+        }
+
+
+_lock = threading.Lock()
+_loaded = (None, None, 0)  # (version, TierTable, chargée à (time.monotonic()))
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def load():
+    """Lit la table en base (une requête)"""
+    from .models import FidelityTierConfig
+    return TierTable(TierConfig(*row) for row in FidelityTierConfig.objects.values_list(*FIELDS))
+
+
+def _is_current(loaded, version):
+    loaded_version, table, loaded_at = loaded
+    return table is not None and loaded_version == version and time.monotonic() - loaded_at < TTL
+
+
+def get_table():
+    """
+    Table courante du processus, rechargée si un autre processus l'a
+    invalidée ou si elle a plus de TTL secondes
+    """
+    global _loaded
+    version = _version()
+    if not _is_current(_loaded, version):
+        with _lock:
+            if not _is_current(_loaded, version):
+                _loaded = (version, load(), time.monotonic())
+    return _loaded[1]
+
+
+def effective_tier(tier, earned_points):
+    """
+    Tier retenu pour le scoring : le tier enregistré s'il est configuré
+    (ou si aucun tier ne l'est), sinon celui atteint avec earned_points
+    """
+    table = get_table()
+    if not len(table) or table.get(tier):
+        return tier
+    resolved = table.resolve(earned_points)
+    return resolved.tier if resolved else tier
+
+
+def invalidate():
+    # Nouveau jeton : tous les processus rechargent leur table au prochain accès
+    global _loaded
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    _loaded = (None, None, 0)
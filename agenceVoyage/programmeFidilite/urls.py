@@ -13,6 +13,7 @@ urlpatterns = [
     path('history/', views.loyalty_points_history, name='points_history'),
     path('tiers/', views.loyalty_tier_info, name='tier_info'),
     path('redeem/', views.redeem_points_view, name='redeem_points'),
+    path('export/', views.export_all_transactions, name='export_all_transactions'),
     
     # JSON API endpoints
     path('api/summary/', views.api_loyalty_summary, name='api_summary'),
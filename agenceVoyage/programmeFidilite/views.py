@@ -1,20 +1,19 @@
 from django.shortcuts import render, get_object_or_404
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Sum
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, HttpResponseBadRequest
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import LoyaltyProgram, PointsTransaction, FidelityTierConfig
+from .models import LoyaltyProgram, PointsTransaction
+from . import export, tiers
 from .serializers import (
     LoyaltyProgramSerializer, 
     PointsTransactionSerializer,
     FidelityTierConfigSerializer
 )
-import csv
-from datetime import datetime
 
 
 @login_required
@@ -29,38 +28,8 @@ def loyalty_dashboard(request):
     
     tier_config = loyalty.get_tier_config()
     
-    # Calculer la progression vers le prochain tier
-    next_tier = FidelityTierConfig.objects.filter(
-        points_requis_min__gt=loyalty.totalEarnedPoints
-    ).order_by('points_requis_min').first()
-    
-    percentage = 0
-    if next_tier:
-        current_range = next_tier.points_requis_min - (
-            FidelityTierConfig.objects.filter(
-                points_requis_min__lt=loyalty.totalEarnedPoints
-            ).order_by('-points_requis_min').first().points_requis_min
-            if FidelityTierConfig.objects.filter(
-                points_requis_min__lt=loyalty.totalEarnedPoints
-            ).exists() else 0
-        )
-        current_progress = loyalty.totalEarnedPoints - (
-            FidelityTierConfig.objects.filter(
-                points_requis_min__lt=loyalty.totalEarnedPoints
-            ).order_by('-points_requis_min').first().points_requis_min
-            if FidelityTierConfig.objects.filter(
-                points_requis_min__lt=loyalty.totalEarnedPoints
-            ).exists() else 0
-        )
-        percentage = int((current_progress / current_range * 100)) if current_range > 0 else 0
-    
-    progression = {
-        'current_points': loyalty.totalEarnedPoints,
-        'next_tier': next_tier,
-        'points_needed': next_tier.points_requis_min - loyalty.totalEarnedPoints if next_tier else 0,
-        'percentage': min(percentage, 100),
-        'next_tier_min': next_tier.points_requis_min if next_tier else loyalty.totalEarnedPoints,
-    }
+    # Calculer la progression vers le prochain tier (sans requête, voir tiers.py)
+    progression = loyalty.get_progression()
     
     transactions = loyalty.transactions.all()[:10]
     
@@ -87,19 +56,15 @@ def loyalty_points_history(request):
     
     # Filter by transaction type if provided
     transaction_type = request.GET.get('type', '')
-    if transaction_type and transaction_type in ['earn', 'redeem', 'expire', 'bonus']:
+    if transaction_type and transaction_type in dict(PointsTransaction.TRANSACTION_TYPES):
         all_transactions = all_transactions.filter(transaction_type=transaction_type)
     
     # Check if export is requested
     if request.GET.get('export') == 'csv':
         return export_transactions_csv(request, all_transactions)
     
-    # Statistiques (calculate before slicing)
-    stats = {
-        'total_earned': loyalty.transactions.filter(transaction_type='earn').aggregate(Sum('points_amount'))['points_amount__sum'] or 0,
-        'total_redeemed': loyalty.transactions.filter(transaction_type='redeem').aggregate(Sum('points_amount'))['points_amount__sum'] or 0,
-        'total_expired': loyalty.transactions.filter(transaction_type='expire').aggregate(Sum('points_amount'))['points_amount__sum'] or 0,
-    }
+    # Statistiques : totaux tenus à jour par type (voir PointsTotal)
+    stats = loyalty.points_stats()
     
     # Now slice the transactions (last 50)
     transactions = all_transactions[:50]
@@ -114,24 +79,35 @@ def loyalty_points_history(request):
     return render(request, 'programmeFidilite/points_history.html', context)
 
 
-def export_transactions_csv(request, transactions):
-    """Export transactions to CSV file"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="loyalty_transactions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+def export_transactions_csv(request, transactions, filename='loyalty_transactions', with_client=False):
+    """
+    Export CSV en flux (voir export.py) : ?start=/?end= (AAAA-MM-JJ) filtrent
+    par date, ?gzip=1 compresse le flux
+    """
+    try:
+        transactions = export.filter_dates(transactions, request.GET.get('start'), request.GET.get('end'))
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
     
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Time', 'Type', 'Points', 'Description'])
+    return export.csv_response(
+        transactions,
+        filename,
+        with_client=with_client,
+        compress=request.GET.get('gzip') in ('1', 'true'),
+    )
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_all_transactions(request):
+    """Export de l'historique de tous les programmes (administration), filtrable par type"""
+    transactions = PointsTransaction.objects.all()
     
-    for transaction in transactions:
-        writer.writerow([
-            transaction.created_at.strftime('%Y-%m-%d'),
-            transaction.created_at.strftime('%H:%M:%S'),
-            transaction.get_transaction_type_display(),
-            transaction.points_amount,
-            transaction.description,
-        ])
+    transaction_type = request.GET.get('type', '')
+    if transaction_type in dict(PointsTransaction.TRANSACTION_TYPES):
+        transactions = transactions.filter(transaction_type=transaction_type)
     
-    return response
+    return export_transactions_csv(request, transactions, 'loyalty_transactions_all', with_client=True)
 
 
 @login_required
@@ -139,7 +115,7 @@ def export_transactions_csv(request, transactions):
 def loyalty_tier_info(request):
     """Informations détaillées sur les tiers de fidélité"""
     loyalty = get_object_or_404(LoyaltyProgram, user=request.user)
-    all_tiers = FidelityTierConfig.objects.all()
+    all_tiers = tiers.get_table().tiers
     current_tier = loyalty.get_tier_config()
     
     context = {
@@ -199,12 +175,17 @@ class LoyaltyProgramViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
+        tier_config = loyalty.get_tier_config()
+        stats = loyalty.points_stats()
         data = {
             'available_points': loyalty.points,
             'total_earned': loyalty.totalEarnedPoints,
             'total_redeemed': loyalty.totalRedeemedPoints,
+            'total_expired': stats['total_expired'],
+            'total_bonus': stats['total_bonus'],
+            'total_cancelled': stats['total_cancelled'],
             'tier': loyalty.tier,
-            'tier_config': FidelityTierConfigSerializer(loyalty.get_tier_config()).data if loyalty.get_tier_config() else None,
+            'tier_config': FidelityTierConfigSerializer(tier_config).data if tier_config else None,
         }
         
         return Response(data)
@@ -220,9 +201,7 @@ class LoyaltyProgramViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        next_tier = FidelityTierConfig.objects.filter(
-            points_requis_min__gt=loyalty.totalEarnedPoints
-        ).order_by('points_requis_min').first()
+        next_tier = tiers.get_table().next_tier(loyalty.totalEarnedPoints)
         
         data = {
             'current_tier': loyalty.tier,
@@ -272,22 +251,14 @@ class LoyaltyProgramViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if points_to_redeem > loyalty.points:
+        # Solde vérifié par l'UPDATE conditionnel lui-même (voir redeem_points)
+        discount_amount = loyalty.redeem_points(points_to_redeem)
+        if discount_amount is None:
             return Response(
                 {'error': f'Points insuffisants. Vous avez {loyalty.points} points'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        discount_amount = loyalty.redeem_points(points_to_redeem)
-        
-        # Créer une transaction
-        PointsTransaction.objects.create(
-            loyalty_program=loyalty,
-            transaction_type='redeem',
-            points_amount=points_to_redeem,
-            description=f'Rédemption de {points_to_redeem} points pour {discount_amount}€'
-        )
-        
         return Response({
             'success': True,
             'points_redeemed': points_to_redeem,
@@ -298,8 +269,7 @@ class LoyaltyProgramViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def all_tiers(self, request):
         """Liste de tous les tiers disponibles"""
-        tiers = FidelityTierConfig.objects.all()
-        serializer = FidelityTierConfigSerializer(tiers, many=True)
+        serializer = FidelityTierConfigSerializer(tiers.get_table().tiers, many=True)
         
         return Response(serializer.data)
 
@@ -315,15 +285,17 @@ def api_loyalty_summary(request):
     except LoyaltyProgram.DoesNotExist:
         return JsonResponse({'error': 'Programme de fidélité non trouvé'}, status=404)
     
-    next_tier = FidelityTierConfig.objects.filter(
-        points_requis_min__gt=loyalty.totalEarnedPoints
-    ).order_by('points_requis_min').first()
+    next_tier = tiers.get_table().next_tier(loyalty.totalEarnedPoints)
+    stats = loyalty.points_stats()
     
     return JsonResponse({
         'tier': loyalty.tier,
         'available_points': loyalty.points,
         'total_earned_points': loyalty.totalEarnedPoints,
         'total_redeemed_points': loyalty.totalRedeemedPoints,
+        'total_expired_points': stats['total_expired'],
+        'total_bonus_points': stats['total_bonus'],
+        'total_cancelled_points': stats['total_cancelled'],
         'discount_percentage': float(loyalty.get_discount_percentage()),
         'next_tier': next_tier.tier if next_tier else None,
         'points_needed_for_next_tier': next_tier.points_requis_min - loyalty.totalEarnedPoints if next_tier else 0,
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Recommendation, RecommendationFeedback
+from .models import Recommendation, RecommendationFeedback, RecommendationArchive, OfferSimilarity
 
 
 @admin.register(Recommendation)
@@ -7,13 +7,13 @@ class RecommendationAdmin(admin.ModelAdmin):
     list_display = ['user', 'recommendation_type', 'match_score', 'is_viewed', 'is_clicked', 'is_booked', 'created_at']
     list_filter = ['recommendation_type', 'is_viewed', 'is_booked', 'created_at']
     search_fields = ['user__username', 'offer__titre', 'destination__nom_destination']
-    readonly_fields = ['created_at', 'updated_at', 'viewed_at', 'clicked_at', 'booked_at']
+    readonly_fields = ['reason', 'created_at', 'updated_at', 'viewed_at', 'clicked_at', 'booked_at']
     
     fieldsets = (
         ('Utilisateur', {'fields': ['user']}),
         ('Type et contenu', {'fields': ['recommendation_type', 'offer', 'destination', 'hebergement']}),
         ('Scoring', {'fields': ['match_score', 'preference_match', 'price_match', 'tier_bonus', 'popularity_score']}),
-        ('Raison', {'fields': ['reason']}),
+        ('Raison', {'fields': ['reason_codes', 'reason']}),
         ('Tracking', {'fields': ['is_viewed', 'viewed_at', 'is_clicked', 'clicked_at', 'is_booked', 'booked_at']}),
         ('Status', {'fields': ['is_active', 'created_at', 'updated_at']}),
     )
@@ -25,3 +25,17 @@ class RecommendationFeedbackAdmin(admin.ModelAdmin):
     list_filter = ['feedback_type', 'rating', 'created_at']
     search_fields = ['recommendation__user__username', 'comment']
     readonly_fields = ['created_at']
+
+
+@admin.register(OfferSimilarity)
+class OfferSimilarityAdmin(admin.ModelAdmin):
+    list_display = ['offer', 'neighbour', 'co_bookings', 'score', 'updated_at']
+    search_fields = ['offer__titre', 'neighbour__titre']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(RecommendationArchive)
+class RecommendationArchiveAdmin(admin.ModelAdmin):
+    list_display = ['first_id', 'last_id', 'row_count', 'archived_at']
+    readonly_fields = ['first_id', 'last_id', 'row_count', 'archived_at']
+    exclude = ['payload']
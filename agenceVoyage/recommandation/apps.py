@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RecommandationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommandation'
+    
+    def ready(self):
+        import recommandation.signals
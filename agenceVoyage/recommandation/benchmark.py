@@ -0,0 +1,280 @@
+"""Banc d'essai du moteur de recommandation.
+
+generate_catalog() remplit la base avec un catalogue synthétique
+déterministe (même graine, mêmes données) ; run_benchmarks() mesure pour
+chaque point d'entrée (moteur et actions de RecommendationViewSet) le temps,
+le nombre de requêtes SQL et le pic mémoire Python. Utilisé par la commande
+benchmark_recommendations, qui travaille sur une base de test jetable.
+"""
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from decimal import Decimal
+
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from rest_framework.test import APIClient
+
+from offreDestination.models import Destination, Hebergement, Offre, OffreStats
+from preferences.models import Preference, PriceRange
+from programmeFidilite.models import LoyaltyProgram, loyaltyTier
+from reservation.models import Reservation
+
+from . import cache
+from .models import Recommendation
+
+
+# Volumes par échelle (nombre d'offres)
+SCALES = {
+    '1k': {'offers': 1000, 'destinations': 100, 'hebergements': 500, 'users': 200, 'reservations': 5000},
+    '10k': {'offers': 10000, 'destinations': 500, 'hebergements': 5000, 'users': 1000, 'reservations': 50000},
+    '100k': {'offers': 100000, 'destinations': 2000, 'hebergements': 50000, 'users': 5000, 'reservations': 500000},
+}
+
+BATCH_SIZE = 2000
+
+
+def generate_catalog(offers, destinations, hebergements, users, reservations, seed=42):
+    """Crée un catalogue synthétique ; retourne le nombre de lignes par modèle"""
+    rng = random.Random(seed)
+    User = get_user_model()
+
+    with transaction.atomic():
+        Destination.objects.bulk_create(
+            [
+                Destination(
+                    nom_destination=f"Destination {i}", pays=f"Pays {i % 40}",
+                    description="Destination générée", image="destinations/bench.jpg",
+                )
+                for i in range(destinations)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        destination_ids = list(Destination.objects.order_by('pk').values_list('pk', flat=True))
+
+        Offre.objects.bulk_create(
+            [
+                Offre(
+                    titre=f"Offre {i}", description="Offre générée",
+                    prix_par_personne=Decimal(rng.randint(100, 4000)), image="offres/bench.jpg",
+                    actif=rng.random() < 0.9,
+                )
+                for i in range(offers)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        offer_rows = list(Offre.objects.order_by('pk').values_list('pk', 'prix_par_personne'))
+        offer_ids = [pk for pk, _ in offer_rows]
+
+        OffreDestination = Offre.nom_destinations.through
+        OffreDestination.objects.bulk_create(
+            [
+                OffreDestination(offre_id=offer_id, destination_id=destination_id)
+                for offer_id in offer_ids
+                for destination_id in rng.sample(destination_ids, rng.randint(0, min(3, len(destination_ids))))
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        Hebergement.objects.bulk_create(
+            [
+                Hebergement(
+                    nom_hebergement=f"Hébergement {i}",
+                    type_hebergement=rng.choice(Hebergement.TYPES)[0],
+                    destination_id=rng.choice(destination_ids),
+                    prix_par_nuit=Decimal(rng.randint(30, 900)),
+                    etoiles=rng.randint(1, 5),
+                )
+                for i in range(hebergements)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        hebergement_ids = list(Hebergement.objects.order_by('pk').values_list('pk', flat=True))
+
+        HebergementOffre = Hebergement.offres.through
+        HebergementOffre.objects.bulk_create(
+            [
+                HebergementOffre(hebergement_id=hebergement_id, offre_id=offer_id)
+                for hebergement_id in hebergement_ids
+                for offer_id in rng.sample(offer_ids, rng.randint(0, min(4, len(offer_ids))))
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            [
+                User(
+                    email=f"bench{i}@example.com", username=f"bench{i}", password=password,
+                    first_name="Bench", last_name=str(i),
+                )
+                for i in range(users)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        user_ids = list(User.objects.filter(email__startswith='bench').order_by('pk').values_list('pk', flat=True))
+
+        # Un utilisateur sur cinq sans préférences, un sur trois sans programme de fidélité
+        Preference.objects.bulk_create(
+            [
+                Preference(user_id=user_id, price_range=rng.choice(PriceRange.values))
+                for user_id in user_ids if rng.random() < 0.8
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        LoyaltyProgram.objects.bulk_create(
+            [
+                LoyaltyProgram(user_id=user_id, tier=rng.choice(loyaltyTier.values), points=rng.randint(0, 20000))
+                for user_id in user_ids if rng.random() < 0.67
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        Reservation.objects.bulk_create(
+            [
+                Reservation(
+                    client_id=rng.choice(user_ids), offre_id=offer_id, nb_personnes=nb_personnes,
+                    prix_total=prix * nb_personnes, mode_paiement='carte',
+                )
+                for offer_id, prix, nb_personnes in (
+                    rng.choice(offer_rows) + (rng.randint(1, 4),) for _ in range(reservations)
+                )
+            ],
+            batch_size=BATCH_SIZE,
+        )
+
+        # bulk_create ne déclenche pas les signaux : statistiques recalculées en lots
+        for start in range(0, len(offer_ids), BATCH_SIZE):
+            OffreStats.refresh(offer_ids[start:start + BATCH_SIZE])
+
+    cache.invalidate_catalog()
+
+    return {
+        'offers': len(offer_ids),
+        'destinations': len(destination_ids),
+        'hebergements': len(hebergement_ids),
+        'users': len(user_ids),
+        'reservations': reservations,
+    }
+
+
+def measure(function, repeat=3, setup=None):
+    """Temps (ms), requêtes SQL et pic mémoire (Ko) de function, sur repeat exécutions"""
+    timings = []
+    queries = []
+    peaks = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+        queries.append(len(captured))
+
+    return {
+        'runs': repeat,
+        'wall_ms': {
+            'min': round(min(timings), 3),
+            'median': round(statistics.median(timings), 3),
+            'max': round(max(timings), 3),
+        },
+        'queries': max(queries),
+        'peak_kb': round(max(peaks), 1),
+    }
+
+
+def _clear_caches():
+    cache.user_recommendations.clear()
+    cache.cohort_recommendations.clear()
+
+
+def _stale_recommendations(user):
+    # Force le passage par le moteur au lieu des recommandations enregistrées
+    _clear_caches()
+    Recommendation.objects.filter(user=user).update(is_active=False)
+
+
+def entry_points(user):
+    """Points d'entrée mesurés : nom -> (fonction, préparation avant chaque exécution)"""
+    from .views import RecommendationEngine
+
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def get(action):
+        def call():
+            response = client.get(f'/recommendations/api/{action}/')
+            if response.status_code != 200:
+                raise RuntimeError(f"{action} : HTTP {response.status_code}")
+        return call
+
+    def track():
+        ids = list(Recommendation.objects.filter(user=user).values_list('pk', flat=True)[:20])
+        client.post(
+            '/recommendations/api/track/',
+            {'events': [{'recommendation_id': pk, 'event': 'click'} for pk in ids]},
+            format='json',
+        )
+
+    return {
+        'engine.generate_recommendations': (
+            lambda: RecommendationEngine(user).generate_recommendations(limit=20), _clear_caches,
+        ),
+        'engine.generate_recommendations[cached]': (
+            lambda: RecommendationEngine(user).generate_recommendations(limit=20), None,
+        ),
+        'engine.rank_destinations': (lambda: list(RecommendationEngine(user).rank_destinations(limit=10)), None),
+        'engine.rank_hebergements': (lambda: RecommendationEngine(user).rank_hebergements(limit=10), None),
+        'api.my_recommendations[engine]': (get('my_recommendations'), lambda: _stale_recommendations(user)),
+        'api.my_recommendations[stored]': (get('my_recommendations'), None),
+        'api.top_destinations': (get('top_destinations'), None),
+        'api.best_accommodations': (get('best_accommodations'), None),
+        'api.track': (track, None),
+    }
+
+
+def run_benchmarks(users=5, repeat=3, only=None):
+    """Mesure chaque point d'entrée pour les premiers utilisateurs ; une ligne par (point d'entrée, utilisateur)"""
+    results = []
+    sample = get_user_model().objects.select_related('preference', 'loyalty_program').order_by('pk')[:users]
+    for user in sample:
+        for name, (function, setup) in entry_points(user).items():
+            if only and name not in only:
+                continue
+            # Une exécution à blanc pour remplir les caches attendus (connexion, recommandations enregistrées)
+            if setup is not None:
+                setup()
+            function()
+            results.append({'entry_point': name, 'user': user.pk, **measure(function, repeat, setup)})
+    return results
+
+
+def environment():
+    """Contexte des mesures, pour comparer des résultats entre commits"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'timestamp': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'numpy': np.__version__,
+    }
@@ -0,0 +1,141 @@
+"""Cache des recommandations calculées par le moteur.
+
+Le score d'une offre ne dépend de l'utilisateur que par son segment
+(price_range, tier) : le classement est calculé une fois par segment, puis
+chaque utilisateur est servi depuis celui-ci.
+
+Les listes classées sont gardées en mémoire dans chaque worker (LRU borné,
+taille et durée de vie réglables par RECOMMENDATION_CACHE_SIZE,
+RECOMMENDATION_COHORT_CACHE_SIZE et RECOMMENDATION_CACHE_TTL). Les clés
+incluent des jetons de version : invalider revient à remplacer le jeton, ce
+qui vaut pour tous les workers et les commandes de gestion. Les jetons du
+catalogue et des tiers sont stockés dans le cache Django, partagé entre les
+processus (settings.CACHES) ; avec un backend propre à chaque processus
+(LocMemCache), seul le processus à l'origine du changement verrait
+l'invalidation, les autres attendant l'expiration de leurs entrées. La
+version de chaque utilisateur est en base (RecommendationVersion) : un
+jeton par utilisateur ne doit pas être évincé par le cache.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CATALOG_VERSION_KEY = 'recommandation:catalog_version'
+TIER_CONFIG_VERSION_KEY = 'recommandation:tier_config_version'
+
+# Nombre d'offres classées gardées par segment (price_range, tier)
+COHORT_SIZE = getattr(settings, 'RECOMMENDATION_COHORT_SIZE', 50)
+
+
+class LRUCache:
+    """Cache borné avec éviction LRU, expiration et compteurs hits/misses"""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def get_version(key):
+    """Jeton de version courant (créé s'il n'existe pas encore)"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    # Un nouveau jeton aléatoire : une clé expirée ne peut jamais ressusciter d'anciennes entrées
+    cache.set(key, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_user(user_id):
+    from .models import RecommendationVersion
+    RecommendationVersion.bump(user_id)
+
+
+def invalidate_catalog():
+    from .models import CatalogChange
+    bump_version(CATALOG_VERSION_KEY)
+    # En base : les recommandations enregistrées sont jugées par tous les processus
+    CatalogChange.mark()
+
+
+def invalidate_tier_config():
+    bump_version(TIER_CONFIG_VERSION_KEY)
+
+
+def cohort_cache_key(cohort, *parts):
+    return (
+        cohort,
+        get_version(CATALOG_VERSION_KEY),
+        get_version(TIER_CONFIG_VERSION_KEY),
+    ) + parts
+
+
+def user_cache_key(user_id, *parts):
+    from .models import RecommendationVersion
+    return (
+        user_id,
+        RecommendationVersion.current(user_id),
+        get_version(CATALOG_VERSION_KEY),
+        get_version(TIER_CONFIG_VERSION_KEY),
+    ) + parts
+
+
+user_recommendations = LRUCache(
+    max_size=getattr(settings, 'RECOMMENDATION_CACHE_SIZE', 1000),
+    ttl=getattr(settings, 'RECOMMENDATION_CACHE_TTL', 300),
+)
+
+cohort_recommendations = LRUCache(
+    max_size=getattr(settings, 'RECOMMENDATION_COHORT_CACHE_SIZE', 100),
+    ttl=getattr(settings, 'RECOMMENDATION_CACHE_TTL', 300),
+)
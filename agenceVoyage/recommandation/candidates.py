@@ -0,0 +1,124 @@
+"""Génération de candidates et diversification des recommandations d'offres.
+
+Le classement d'un segment se fait en deux étapes :
+
+1. generate : un score approché calculé en SQL (adéquation à la gamme de
+   prix, popularité, présence de destinations) retient un nombre borné
+   d'offres, complété par les meilleures offres de chaque destination pour
+   que la diversification ait des alternatives. Le moteur ne note que ces
+   candidates, en une passe NumPy (scoring.OfferCatalog) : le coût par
+   requête ne dépend plus de la taille du catalogue.
+2. diversify : les offres notées sont ré-ordonnées par pertinence marginale
+   maximale (MMR). À chaque rang on prend l'offre qui maximise
+   λ × score - (1 - λ) × 100 × similarité avec les offres déjà retenues, la
+   similarité étant l'indice de Jaccard de leurs destinations.
+
+Le score approché ne diffère du score complet que par le tier (constant pour
+un segment) et la pénalité de feedback (négative ou nulle) : le top du
+segment est donc dans le pool tant que le pool dépasse la taille du
+classement plus les offres pénalisées.
+"""
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When, Window
+from django.db.models.functions import RowNumber
+
+from offreDestination.models import Offre
+from . import scoring
+
+
+# Offres notées par segment, dont une part réservée aux meilleures offres de chaque destination
+POOL_SIZE = getattr(settings, 'RECOMMENDATION_CANDIDATE_POOL', 300)
+PER_DESTINATION = getattr(settings, 'RECOMMENDATION_CANDIDATES_PER_DESTINATION', 3)
+DESTINATION_SHARE = 4
+
+# λ du MMR : 1 garde l'ordre des scores, 0 ne regarde que la diversité
+DIVERSITY_LAMBDA = getattr(settings, 'RECOMMENDATION_DIVERSITY_LAMBDA', 0.7)
+
+
+def approximate_score(price_range, has_preferences):
+    """Score sans le tier ni le feedback, en SQL (offres annotées par with_scoring_inputs)"""
+    if has_preferences:
+        preference = Case(
+            When(destination_count__gt=0, then=Value(75.0)), default=Value(50.0), output_field=FloatField(),
+        )
+    else:
+        preference = Value(50.0, output_field=FloatField())
+
+    price = scoring.price_score_expression(
+        'prix_par_personne', price_range, scoring.OFFER_PRICE_BANDS, scoring.DEFAULT_OFFER_PRICE_BAND, 10
+    )
+    return preference * 0.4 + price * 0.3 + scoring.popularity_expression() * 0.1
+
+
+def generate(price_range, has_preferences, size=POOL_SIZE, per_destination=PER_DESTINATION):
+    """Identifiants des offres actives à noter (au plus size), en deux requêtes"""
+    offers = scoring.with_scoring_inputs(Offre.objects.filter(actif=True)).annotate(
+        candidate_score=approximate_score(price_range, has_preferences),
+    )
+
+    pool = {}
+    quota = size // DESTINATION_SHARE if per_destination else 0
+    if quota:
+        # Meilleure offre de chaque destination, puis la deuxième, etc.
+        by_destination = offers.annotate(
+            destination=F('nom_destinations'),
+            rank=Window(
+                RowNumber(),
+                partition_by=F('nom_destinations'),
+                order_by=[F('candidate_score').desc(), F('pk').asc()],
+            ),
+        ).filter(destination__isnull=False, rank__lte=per_destination)
+        for pk in by_destination.order_by('rank', '-candidate_score', 'pk').values_list('pk', flat=True):
+            pool[pk] = None
+            if len(pool) >= quota:
+                break
+
+    for pk in offers.order_by('-candidate_score', 'pk').values_list('pk', flat=True)[:size]:
+        if len(pool) >= size:
+            break
+        pool[pk] = None
+
+    return list(pool)
+
+
+def destination_sets(offer_ids):
+    """{offre: frozenset(destinations)} en une requête sur la table de liaison"""
+    sets = {pk: set() for pk in offer_ids}
+    rows = Offre.nom_destinations.through.objects.filter(offre_id__in=sets).values_list('offre_id', 'destination_id')
+    for offre_id, destination_id in rows:
+        sets[offre_id].add(destination_id)
+    return {pk: frozenset(destinations) for pk, destinations in sets.items()}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def diversify(recommendations, destinations, limit=None, diversity=DIVERSITY_LAMBDA):
+    """
+    Ré-ordonne des recommandations triées par score (MMR) ; les limit
+    premières sont celles qu'une sélection gloutonne de limit offres retient
+    """
+    remaining = list(recommendations)
+    if limit is None:
+        limit = len(remaining)
+    if diversity >= 1 or len(remaining) < 2:
+        return remaining[:limit]
+
+    sets = [destinations.get(rec['item'].pk, frozenset()) for rec in remaining]
+    closest = [0.0] * len(remaining)  # similarité maximale avec les offres retenues
+    selected = []
+    while remaining and len(selected) < limit:
+        best = max(
+            range(len(remaining)),
+            key=lambda i: diversity * remaining[i]['score'] - (1 - diversity) * 100 * closest[i],
+        )
+        selected.append(remaining.pop(best))
+        chosen = sets.pop(best)
+        closest.pop(best)
+        if chosen:
+            closest = [max(similarity, jaccard(chosen, other)) for similarity, other in zip(closest, sets)]
+
+    return selected
@@ -0,0 +1,175 @@
+"""Évaluation hors ligne de variantes de poids du score.
+
+Les recommandations d'offres enregistrées sont relues par utilisateur, avec
+leur résultat (clic, réservation, feedback), puis re-notées avec chaque
+variante de poids à partir du catalogue courant (voir scoring.OfferCatalog).
+Pour chaque variante on mesure :
+
+- precision@k : part des k premières offres (au-dessus du seuil) jugées
+  pertinentes, moyennée sur les utilisateurs ;
+- le taux de réservation et de clic des offres au-dessus du seuil ;
+- la couverture : part des lignes qui restent recommandées.
+
+Les lignes sont lues par lots (iterator) et seuls des compteurs sont
+gardés : la mémoire ne dépend que du catalogue et du nombre de
+recommandations d'un utilisateur. Les plages d'utilisateurs peuvent être
+évaluées dans des processus séparés (commande evaluate_recommendation_weights).
+"""
+import time
+from itertools import groupby
+from operator import itemgetter
+
+import numpy as np
+
+from offreDestination.models import Offre
+from . import scoring
+from .models import Recommendation
+
+
+POSITIVE_FEEDBACK = {'relevant', 'interested'}
+NEGATIVE_FEEDBACK = {'not_relevant'}
+
+COUNTERS = ['users', 'precision_sum', 'recommended', 'clicked', 'booked']
+
+
+def parse_variant(spec):
+    """« nom=préférences,prix,tier,popularité[,seuil] » -> (nom, Weights)"""
+    name, _, values = spec.partition('=')
+    numbers = [float(value) for value in values.split(',')]
+    if not name or len(numbers) not in (4, 5):
+        raise ValueError(f"Variante invalide : {spec}")
+    if len(numbers) == 4:
+        numbers.append(scoring.DEFAULT_WEIGHTS.threshold)
+    return name, scoring.Weights(*numbers)
+
+
+def is_relevant(is_clicked, is_booked, feedback_type, rating):
+    """Une recommandation est pertinente si elle a été cliquée, réservée ou
+    bien notée, sauf feedback explicitement négatif"""
+    if feedback_type in NEGATIVE_FEEDBACK:
+        return False
+    return bool(
+        is_clicked or is_booked
+        or feedback_type in POSITIVE_FEEDBACK
+        or (rating is not None and rating >= 4)
+    )
+
+
+def load_catalog():
+    """Catalogue de toutes les offres (y compris inactives), trié par id"""
+    return scoring.OfferCatalog.from_queryset(
+        scoring.with_scoring_inputs(Offre.objects.all()).order_by('pk')
+    )
+
+
+def evaluate_users(variants, k=10, user_range=(None, None), chunk_size=2000):
+    """
+    Évalue les variantes [(nom, Weights), ...] sur les utilisateurs
+    user_range = [début, fin[ ; retourne {nom: compteurs} et le nombre de lignes lues
+    """
+    started = time.monotonic()
+    catalog = load_catalog()
+    totals = {name: dict.fromkeys(COUNTERS, 0) for name, _ in variants}
+    if not len(catalog):
+        return {'totals': totals, 'rows': 0, 'seconds': time.monotonic() - started}
+
+    # Composantes indépendantes de l'utilisateur, calculées une fois
+    popularity = catalog.popularity_scores()
+    preference = {
+        True: catalog.preference_scores(True),
+        False: catalog.preference_scores(False),
+    }
+    price = {}
+
+    rows = Recommendation.objects.filter(recommendation_type='offer', offer__isnull=False)
+    start, end = user_range
+    if start is not None:
+        rows = rows.filter(user_id__gte=start)
+    if end is not None:
+        rows = rows.filter(user_id__lt=end)
+    rows = rows.order_by('user_id', 'pk').values_list(
+        'user_id', 'offer_id', 'is_clicked', 'is_booked', 'feedback__feedback_type', 'feedback__rating',
+        'user__preference__price_range', 'user__loyalty_program__tier',
+    ).iterator(chunk_size=chunk_size)
+
+    read = 0
+    for _, group in groupby(rows, key=itemgetter(0)):
+        group = list(group)
+        read += len(group)
+
+        offer_ids = np.fromiter((row[1] for row in group), dtype=np.int64, count=len(group))
+        positions = np.searchsorted(catalog.ids, offer_ids)
+        known = (positions < len(catalog)) & (catalog.ids[np.minimum(positions, len(catalog) - 1)] == offer_ids)
+        positions = positions[known]
+        kept = [row for row, ok in zip(group, known) if ok]
+        if not kept:
+            continue
+
+        clicked = np.array([row[2] for row in kept], dtype=bool)
+        booked = np.array([row[3] for row in kept], dtype=bool)
+        relevant = np.array([is_relevant(*row[2:6]) for row in kept], dtype=bool)
+
+        price_range, tier = kept[0][6], kept[0][7]
+        if price_range not in price:
+            price[price_range] = catalog.price_scores(price_range)
+        components = (
+            preference[price_range is not None][positions],
+            price[price_range][positions],
+            scoring.tier_bonus(tier),
+            popularity[positions],
+        )
+
+        for name, weights in variants:
+            scores = np.minimum(
+                components[0] * weights.preference
+                + components[1] * weights.price
+                + components[2] * weights.tier
+                + components[3] * weights.popularity,
+                100,
+            )
+            above = scores > weights.threshold
+            counters = totals[name]
+            counters['users'] += 1
+            counters['recommended'] += int(above.sum())
+            counters['clicked'] += int(clicked[above].sum())
+            counters['booked'] += int(booked[above].sum())
+
+            candidates = np.flatnonzero(above)
+            if len(candidates):
+                top = candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+                counters['precision_sum'] += float(relevant[top].sum()) / k
+
+    return {'totals': totals, 'rows': read, 'seconds': time.monotonic() - started}
+
+
+def merge(results):
+    """Additionne les compteurs de plusieurs évaluations partielles"""
+    merged = {'totals': {}, 'rows': 0, 'seconds': 0.0}
+    for result in results:
+        merged['rows'] += result['rows']
+        merged['seconds'] += result['seconds']
+        for name, counters in result['totals'].items():
+            total = merged['totals'].setdefault(name, dict.fromkeys(COUNTERS, 0))
+            for key, value in counters.items():
+                total[key] += value
+    return merged
+
+
+def report(result, variants, k):
+    """Métriques finales par variante"""
+    rows = result['rows']
+    metrics = []
+    for name, weights in variants:
+        counters = result['totals'][name]
+        recommended = counters['recommended']
+        metrics.append({
+            'variant': name,
+            'weights': weights._asdict(),
+            f'precision@{k}': counters['precision_sum'] / counters['users'] if counters['users'] else 0.0,
+            'booking_rate': counters['booked'] / recommended if recommended else 0.0,
+            'click_rate': counters['clicked'] / recommended if recommended else 0.0,
+            'coverage': recommended / rows if rows else 0.0,
+            'users': counters['users'],
+            'recommended': recommended,
+        })
+    return metrics
@@ -0,0 +1,81 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from recommandation import benchmark, tracking
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le moteur de recommandation et les actions de l'API sur un catalogue "
+        "synthétique, dans une base de test jetable"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(benchmark.SCALES), default='1k', help="Taille du catalogue")
+        parser.add_argument('--offers', type=int, help="Nombre d'offres (remplace celui de l'échelle)")
+        parser.add_argument('--seed', type=int, default=42, help="Graine du générateur")
+        parser.add_argument('--users', type=int, default=5, help="Utilisateurs mesurés")
+        parser.add_argument('--repeat', type=int, default=3, help="Exécutions par mesure")
+        parser.add_argument('--only', nargs='*', help="Points d'entrée à mesurer (tous par défaut)")
+        parser.add_argument('--output', help="Fichier JSON des résultats (sinon sortie standard)")
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help="Conserve la base de test (le catalogue n'est généré que si elle est vide)",
+        )
+
+    def handle(self, *args, **options):
+        volumes = dict(benchmark.SCALES[options['scale']])
+        if options['offers']:
+            volumes['offers'] = options['offers']
+        if options['only']:
+            unknown = set(options['only']) - set(benchmark.entry_points(None))
+            if unknown:
+                raise CommandError(f"Points d'entrée inconnus : {', '.join(sorted(unknown))}")
+
+        # Comme le lanceur de tests : hôte « testserver » autorisé, base de test séparée
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            from offreDestination.models import Offre
+
+            started = time.monotonic()
+            if Offre.objects.exists():
+                self.stdout.write("Catalogue existant réutilisé")
+                generated = None
+            else:
+                generated = benchmark.generate_catalog(seed=options['seed'], **volumes)
+                self.stdout.write(f"Catalogue généré en {time.monotonic() - started:.1f}s : {generated}")
+
+            results = benchmark.run_benchmarks(
+                users=options['users'], repeat=options['repeat'], only=options['only'],
+            )
+            report = {
+                'environment': benchmark.environment(),
+                'scale': options['scale'],
+                'seed': options['seed'],
+                'volumes': generated or volumes,
+                'results': results,
+            }
+        finally:
+            # Les événements de suivi encore en tampon appartiennent à la base de test
+            tracking.buffer.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        for row in results:
+            self.stdout.write(
+                f"{row['entry_point']:<42} user={row['user']:<6} "
+                f"{row['wall_ms']['median']:>9.2f} ms  {row['queries']:>4} req.  {row['peak_kb']:>9.1f} Ko"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
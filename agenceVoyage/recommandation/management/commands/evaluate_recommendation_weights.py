@@ -0,0 +1,96 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from recommandation import evaluation
+from recommandation.models import Recommendation
+from recommandation.workers import init_worker
+
+
+DEFAULT_VARIANTS = [
+    'baseline=0.4,0.3,0.2,0.1,40',
+    'prix=0.3,0.4,0.2,0.1,40',
+    'popularite=0.35,0.25,0.15,0.25,40',
+    'seuil50=0.4,0.3,0.2,0.1,50',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rejoue les recommandations enregistrées avec d'autres poids de score et "
+        "compare precision@k, taux de réservation et de clic"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--variant', action='append', dest='variants',
+            help="nom=préférences,prix,tier,popularité[,seuil] (répétable ; variantes par défaut sinon)",
+        )
+        parser.add_argument('--k', type=int, default=10, help="Taille du top pour precision@k")
+        parser.add_argument('--workers', type=int, default=1, help="Nombre de processus")
+        parser.add_argument('--ranges', type=int, help="Plages d'utilisateurs (par défaut 4 par processus)")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Lignes lues par lot")
+        parser.add_argument('--output', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        try:
+            variants = [evaluation.parse_variant(spec) for spec in options['variants'] or DEFAULT_VARIANTS]
+        except ValueError as e:
+            raise CommandError(str(e))
+        k = options['k']
+        workers = max(options['workers'], 1)
+
+        bounds = Recommendation.objects.filter(recommendation_type='offer').aggregate(
+            first=Min('user_id'), last=Max('user_id'),
+        )
+        if bounds['first'] is None:
+            raise CommandError("Aucune recommandation d'offre enregistrée")
+
+        # Plages [début, fin[ d'identifiants utilisateurs de même largeur
+        count = options['ranges'] or workers * 4
+        width = max((bounds['last'] - bounds['first'] + 1 + count - 1) // count, 1)
+        ranges = [
+            (start, start + width)
+            for start in range(bounds['first'], bounds['last'] + 1, width)
+        ]
+
+        started = time.monotonic()
+        if workers == 1:
+            results = [
+                evaluation.evaluate_users(variants, k, user_range, options['chunk_size'])
+                for user_range in ranges
+            ]
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                results = list(pool.map(
+                    evaluation.evaluate_users,
+                    [variants] * len(ranges), [k] * len(ranges), ranges, [options['chunk_size']] * len(ranges),
+                ))
+        elapsed = time.monotonic() - started
+
+        result = evaluation.merge(results)
+        metrics = evaluation.report(result, variants, k)
+
+        self.stdout.write(f"{result['rows']} recommandations, {len(ranges)} plages, {workers} processus, {elapsed:.1f}s")
+        for row in metrics:
+            self.stdout.write(
+                f"{row['variant']:<16} precision@{k}={row[f'precision@{k}']:.3f}  "
+                f"réservation={row['booking_rate']:.3f}  clic={row['click_rate']:.3f}  "
+                f"couverture={row['coverage']:.3f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'k': k,
+                    'rows': result['rows'],
+                    'seconds': round(elapsed, 3),
+                    'worker_seconds': round(result['seconds'], 3),
+                    'variants': metrics,
+                }, f, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from recommandation.models import Recommendation
+from recommandation.workers import init_worker
+
+
+def _precompute_chunk(user_ids, limit):
+    """Calcule et enregistre les recommandations d'un lot d'utilisateurs"""
+    from recommandation.views import RecommendationEngine
+
+    started = time.monotonic()
+    users = get_user_model().objects.filter(pk__in=user_ids).select_related('preference', 'loyalty_program')
+    results = [
+        (user, RecommendationEngine(user).generate_recommendations(limit=limit))
+        for user in users
+    ]
+    rows = Recommendation.objects.write_offer_recommendations(results, limit)
+
+    return len(results), len(rows), time.monotonic() - started
+
+
+class Command(BaseCommand):
+    help = "Précalcule et enregistre les recommandations d'offres de tous les utilisateurs (ou de ceux modifiés depuis une date)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help="Seulement les utilisateurs inscrits ou dont les préférences/le tier ont changé depuis (ISO 8601)",
+        )
+        parser.add_argument('--workers', type=int, default=1, help="Nombre de processus de calcul")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Utilisateurs par lot d'écriture")
+        parser.add_argument(
+            '--limit', type=int, default=Recommendation.objects.STORED_LIMIT, help="Recommandations par utilisateur",
+        )
+        parser.add_argument(
+            '--max-age', type=int,
+            help="Ignore les utilisateurs dont la liste enregistrée a moins de ce nombre de secondes",
+        )
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None and parse_date(options['since']):
+                since = parse_datetime(f"{options['since']}T00:00:00")
+            if since is None:
+                raise CommandError(f"Date invalide : {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            users = users.filter(
+                Q(date_joined__gte=since)
+                | Q(preference__updated_at__gte=since)
+                | Q(loyalty_program__last_tier_update__gte=since)
+            ).distinct()
+
+        if options['max_age'] is not None:
+            users = users.exclude(
+                recommendation_snapshot__computed_at__gte=timezone.now() - timedelta(seconds=options['max_age'])
+            )
+
+        user_ids = list(users.values_list('pk', flat=True))
+        chunk_size = max(options['chunk_size'], 1)
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        workers = max(options['workers'], 1)
+        limit = options['limit']
+
+        self.stdout.write(f"{len(user_ids)} utilisateurs, {len(chunks)} lots, {workers} processus")
+        started = time.monotonic()
+        done_users = done_rows = 0
+
+        def report(result):
+            nonlocal done_users, done_rows
+            users_count, rows_count, chunk_seconds = result
+            done_users += users_count
+            done_rows += rows_count
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"[{done_users}/{len(user_ids)}] lot de {users_count} en {chunk_seconds:.2f}s — "
+                f"{done_users / elapsed if elapsed else 0:.0f} utilisateurs/s"
+            )
+
+        if workers == 1:
+            for chunk in chunks:
+                report(_precompute_chunk(chunk, limit))
+        else:
+            # Ne pas transmettre la connexion du parent aux processus
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+                futures = [pool.submit(_precompute_chunk, chunk, limit) for chunk in chunks]
+                for future in as_completed(futures):
+                    report(future.result())
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{done_users} utilisateurs, {done_rows} recommandations en {elapsed:.1f}s "
+            f"({done_users / elapsed if elapsed else 0:.0f} utilisateurs/s)"
+        ))
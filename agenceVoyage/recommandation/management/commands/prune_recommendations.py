@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommandation import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Désactive les recommandations périmées et archive (JSON compressé) les "
+        "anciennes recommandations jamais consultées, par petits lots"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--deactivate-after', type=int, default=retention.DEACTIVATE_AFTER_DAYS,
+            help="Jours sans recalcul avant désactivation",
+        )
+        parser.add_argument(
+            '--archive-after', type=int, default=retention.ARCHIVE_AFTER_DAYS,
+            help="Jours d'inactivité avant archivage",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lignes par transaction")
+        parser.add_argument('--pause', type=float, default=0, help="Pause entre deux lots (secondes)")
+        parser.add_argument('--dry-run', action='store_true', help="Compte seulement, sans rien modifier")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch = {
+            'batch_size': max(options['batch_size'], 1),
+            'pause': options['pause'],
+            'dry_run': options['dry_run'],
+        }
+
+        deactivated = retention.deactivate_superseded(options['deactivate_after'], **batch)
+        archived, batches = retention.archive_unseen(options['archive_after'], **batch)
+
+        prefix = "[simulation] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{deactivated} recommandations désactivées, {archived} archivées "
+            f"({batches} lots) en {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recommandation import cache, similarity
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de similarité entre offres à partir de l'historique des réservations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int, default=similarity.NEIGHBOURS,
+            help="Voisins gardés par offre",
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Réservations lues par lot")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Lignes écrites par requête")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = similarity.rebuild(
+            limit=options['neighbours'],
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+        )
+        # Les recommandations calculées avec l'ancien index sont à recalculer
+        cache.invalidate_catalog()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} paires de voisins écrites en {time.monotonic() - started:.1f}s"
+        ))
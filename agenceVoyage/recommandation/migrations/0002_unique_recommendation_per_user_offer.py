@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_recommendations(apps, schema_editor):
+    """Garde la ligne la plus récente de chaque (user, offer, recommendation_type)"""
+    Recommendation = apps.get_model('recommandation', 'Recommendation')
+
+    duplicates = (
+        Recommendation.objects.filter(offer__isnull=False)
+        .values('user', 'offer', 'recommendation_type')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for group in duplicates:
+        Recommendation.objects.filter(
+            user=group['user'],
+            offer=group['offer'],
+            recommendation_type=group['recommendation_type'],
+        ).exclude(id=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0002_offrestats'),
+        ('recommandation', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_recommendations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='recommendation',
+            constraint=models.UniqueConstraint(fields=('user', 'offer', 'recommendation_type'), name='unique_recommendation_per_user_offer'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0003_hebergement_etoiles_prix_idx'),
+        ('recommandation', '0002_unique_recommendation_per_user_offer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('co_bookings', models.PositiveIntegerField(default=0, help_text='Clients ayant réservé les deux offres')),
+                ('score', models.FloatField(default=0, help_text='Similarité cosinus (0-1)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='offreDestination.offre')),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_offers', to='offreDestination.offre')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['offer', '-score'], name='offer_similarity_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('offer', 'neighbour'), name='unique_offer_neighbour')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0003_hebergement_etoiles_prix_idx'),
+        ('recommandation', '0003_offer_similarity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.PositiveIntegerField(help_text='Plus petit id archivé')),
+                ('last_id', models.PositiveIntegerField(help_text='Plus grand id archivé')),
+                ('row_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField(help_text='Lignes en JSON compressé (zlib)')),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-archived_at'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='recommendation',
+            name='recommandat_user_id_4b3c46_idx',
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(fields=['user', 'recommendation_type', 'is_active', '-match_score', '-created_at'], name='recommendation_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recommendation',
+            index=models.Index(condition=models.Q(('is_active', False), ('is_booked', False), ('is_clicked', False), ('is_viewed', False)), fields=['updated_at'], name='recommendation_archivable_idx'),
+        ),
+    ]
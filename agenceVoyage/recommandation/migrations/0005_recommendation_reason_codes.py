@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+
+# Fragments de l'ancien texte de raison et leur code (voir reasons.py)
+REASON_CODES = {
+    "Correspond à vos préférences": 1,
+    "Prix avantageux pour votre gamme": 2,
+    "Avantage spécial BRONZE": 4,
+    "Avantage spécial Bronze": 4,
+    "Avantage spécial SILVER": 8,
+    "Avantage spécial GOLD": 16,
+    "Avantage spécial PLATINUM": 32,
+    "Hébergement 5 étoiles disponible": 64,
+    "Souvent réservée avec vos voyages": 128,
+}
+DEFAULT_REASON = "Recommandé pour vous"
+SEPARATOR = " • "
+
+
+def reason_to_codes(apps, schema_editor):
+    """Une requête UPDATE par texte distinct : il n'y en a que quelques-uns"""
+    Recommendation = apps.get_model('recommandation', 'Recommendation')
+
+    for reason in Recommendation.objects.order_by().values_list('reason', flat=True).distinct():
+        codes = 0
+        for fragment in (reason or '').split(SEPARATOR):
+            codes |= REASON_CODES.get(fragment.strip(), 0)
+        if codes:
+            Recommendation.objects.filter(reason=reason).update(reason_codes=codes)
+
+
+def codes_to_reason(apps, schema_editor):
+    Recommendation = apps.get_model('recommandation', 'Recommendation')
+    labels = {}
+    for label, code in REASON_CODES.items():
+        labels.setdefault(code, label)
+
+    for codes in Recommendation.objects.order_by().values_list('reason_codes', flat=True).distinct():
+        fragments = [label for code, label in sorted(labels.items()) if codes & code]
+        Recommendation.objects.filter(reason_codes=codes).update(
+            reason=SEPARATOR.join(fragments) if fragments else DEFAULT_REASON
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommandation', '0004_retention_indexes_and_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='reason_codes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Raisons de la recommandation (masque de bits, voir reasons.py)'),
+        ),
+        migrations.RunPython(reason_to_codes, codes_to_reason),
+        migrations.RemoveField(
+            model_name='recommendation',
+            name='reason',
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:03
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+COUNTERS = ['relevant', 'not_relevant', 'already_visited', 'interested']
+NEGATIVE = ['not_relevant', 'already_visited']
+ALL = '*'
+
+
+def populate_feedback_stats(apps, schema_editor):
+    """Compteurs initiaux à partir des feedbacks existants (une requête d'agrégation)"""
+    RecommendationFeedback = apps.get_model('recommandation', 'RecommendationFeedback')
+    OfferFeedbackStats = apps.get_model('recommandation', 'OfferFeedbackStats')
+    max_penalty = getattr(settings, 'RECOMMENDATION_FEEDBACK_MAX_PENALTY', 30)
+    prior = getattr(settings, 'RECOMMENDATION_FEEDBACK_PRIOR', 5)
+
+    stats = defaultdict(lambda: dict.fromkeys(COUNTERS + ['rating_sum', 'rating_count'], 0))
+    groups = (
+        RecommendationFeedback.objects.filter(recommendation__offer__isnull=False)
+        .values(
+            'recommendation__offer_id', 'feedback_type',
+            'recommendation__user__preference__price_range', 'recommendation__user__loyalty_program__tier',
+        )
+        .annotate(n=Count('pk'), rating_sum=Sum('rating'), rating_count=Count('rating'))
+        .order_by()
+    )
+    for group in groups:
+        cohort = (
+            group['recommendation__user__preference__price_range'] or '',
+            group['recommendation__user__loyalty_program__tier'] or '',
+        )
+        for price_range, tier in (cohort, (ALL, ALL)):
+            row = stats[group['recommendation__offer_id'], price_range, tier]
+            if group['feedback_type'] in COUNTERS:
+                row[group['feedback_type']] += group['n']
+            row['rating_sum'] += group['rating_sum'] or 0
+            row['rating_count'] += group['rating_count']
+
+    rows = []
+    for (offer_id, price_range, tier), counters in stats.items():
+        negative = sum(counters[name] for name in NEGATIVE)
+        total = sum(counters[name] for name in COUNTERS)
+        rows.append(OfferFeedbackStats(
+            offer_id=offer_id, price_range=price_range, tier=tier,
+            adjustment=-max_penalty * negative / (total + prior),
+            **counters,
+        ))
+    OfferFeedbackStats.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0003_hebergement_etoiles_prix_idx'),
+        ('preferences', '0001_initial'),
+        ('programmeFidilite', '0001_initial'),
+        ('recommandation', '0005_recommendation_reason_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfferFeedbackStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_range', models.CharField(blank=True, max_length=20)),
+                ('tier', models.CharField(blank=True, max_length=20)),
+                ('relevant', models.PositiveIntegerField(default=0)),
+                ('not_relevant', models.PositiveIntegerField(default=0)),
+                ('already_visited', models.PositiveIntegerField(default=0)),
+                ('interested', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveIntegerField(default=0)),
+                ('rating_count', models.PositiveIntegerField(default=0)),
+                ('adjustment', models.FloatField(default=0, help_text='Pénalité de score (points, ≤ 0)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('offer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feedback_stats', to='offreDestination.offre')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('price_range', 'tier', 'offer'), name='unique_offer_feedback_cohort')],
+            },
+        ),
+        migrations.RunPython(populate_feedback_stats, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,164 @@
-from django.db import models
+import json
+import zlib
+
+from django.db import models, transaction
 from django.conf import settings
+from django.db.models import F, Value, prefetch_related_objects
+from django.db.models.functions import Cast
+from django.utils import timezone
+from datetime import timedelta
+
+from . import reasons
+
+
+class RecommendationManager(models.Manager):
+    SCORE_FIELDS = ['match_score', 'reason_codes', 'preference_match', 'price_match', 'tier_bonus', 'popularity_score']
+    # Relations lues par RecommendationSerializer
+    API_RELATED = ['offer', 'destination', 'hebergement', 'feedback']
+    # Taille des listes enregistrées, commune à toutes les vues (chacune en affiche un préfixe)
+    STORED_LIMIT = getattr(settings, 'RECOMMENDATION_STORED_LIMIT', 20)
+    
+    def with_reason(self, code):
+        """Recommandations dont les raisons incluent code (test de bits en SQL)"""
+        return self.alias(matched_reason=F('reason_codes').bitand(code)).filter(matched_reason=code)
+    
+    def for_api(self):
+        """Recommandations avec les relations sérialisées, en une seule requête"""
+        return self.select_related(*self.API_RELATED)
+    
+    def write_offer_recommendations(self, results, limit, batch_size=500):
+        """
+        Enregistre les listes classées du moteur, [(user, recommandations), ...],
+        calculées avec limit, en upserts groupés, puis désactive les
+        recommandations d'offres de ces utilisateurs qui n'ont pas été réécrites
+        """
+        rows = []
+        users = []
+        snapshots = []
+        written = set()
+        written_at = timezone.now()
+        for user, recommendations in results:
+            users.append(user)
+            snapshots.append(RecommendationSnapshot(
+                user=user, limit=limit, count=len(recommendations), computed_at=written_at,
+            ))
+            written.update((user.pk, rec['item'].pk) for rec in recommendations)
+            rows.extend(
+                self.model(
+                    user=user,
+                    offer=rec['item'],
+                    recommendation_type='offer',
+                    match_score=rec['score'],
+                    reason_codes=rec['reason_codes'],
+                    preference_match=rec['preference_match'],
+                    price_match=rec['price_match'],
+                    tier_bonus=rec['tier_bonus'],
+                    popularity_score=rec['popularity'],
+                    is_active=True,
+                )
+                for rec in recommendations
+            )
+        
+        with transaction.atomic():
+            if rows:
+                self.bulk_create(
+                    rows,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=['user', 'offer', 'recommendation_type'],
+                    update_fields=self.SCORE_FIELDS + ['is_active', 'updated_at'],
+                )
+            # Lignes absentes des nouvelles listes, identifiées par (utilisateur, offre) :
+            # ne dépend pas de l'horloge (deux écritures peuvent partager le même instant)
+            active = self.filter(
+                user__in=users, recommendation_type='offer', is_active=True
+            ).values_list('pk', 'user_id', 'offer_id')
+            stale = [pk for pk, user_id, offer_id in active if (user_id, offer_id) not in written]
+            for start in range(0, len(stale), batch_size):
+                self.filter(pk__in=stale[start:start + batch_size]).update(is_active=False, updated_at=written_at)
+            RecommendationSnapshot.objects.bulk_create(
+                snapshots,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['limit', 'count', 'computed_at'],
+            )
+        
+        return rows
+    
+    def save_offer_recommendations(self, user, recommendations, limit):
+        """
+        Enregistre la liste classée d'un utilisateur (calculée avec limit) et
+        retourne les lignes écrites, dans l'ordre du classement
+        """
+        rows = self.write_offer_recommendations([(user, recommendations)], limit)
+        
+        # Les lignes déjà existantes gardent leur suivi et leur date de création
+        state = {
+            row['id']: row
+            for row in self.filter(pk__in=[row.pk for row in rows]).values(
+                'id', 'is_viewed', 'viewed_at', 'is_clicked', 'clicked_at',
+                'is_booked', 'booked_at', 'created_at',
+            )
+        }
+        for row in rows:
+            for field, value in state.get(row.pk, {}).items():
+                setattr(row, field, value)
+        prefetch_related_objects(rows, 'feedback')
+        
+        return rows
+    
+    def fresh_offer_recommendations(self, user, limit, values=None):
+        """
+        Recommandations d'offres enregistrées (par exemple par la commande
+        precompute_recommendations) si elles sont encore valides, sinon None.
+        
+        Une liste plus courte que limit n'est valide que si elle est complète :
+        le moteur, appelé avec une limite plus grande, n'a pas trouvé d'autres
+        offres (voir RecommendationSnapshot).
+        
+        Avec values (liste de champs), retourne des dictionnaires values()
+        au lieu d'instances.
+        """
+        snapshot = RecommendationSnapshot.objects.filter(user=user).values_list(
+            'limit', 'count', 'computed_at'
+        ).first()
+        if snapshot is None:
+            return None
+        stored_limit, count, computed_at = snapshot
+        
+        now = timezone.now()
+        not_before = [now - timedelta(seconds=getattr(settings, 'RECOMMENDATION_PRECOMPUTE_MAX_AGE', 86400))]
+        
+        preference = getattr(user, 'preference', None)
+        if preference is not None:
+            not_before.append(preference.updated_at)
+        loyalty = getattr(user, 'loyalty_program', None)
+        if loyalty is not None:
+            not_before.append(loyalty.last_tier_update)
+        changed_at = CatalogChange.last()
+        if changed_at is not None:
+            not_before.append(changed_at)
+        
+        if computed_at < max(not_before):
+            return None
+        
+        # Une offre désactivée depuis le calcul manque à la liste : elle est recalculée
+        recommendations = self.filter(
+            user=user, recommendation_type='offer', is_active=True, offer__actif=True
+        ).order_by('-match_score', '-created_at')
+        
+        if values is None:
+            rows = list(recommendations.select_related(*self.API_RELATED)[:limit])
+        else:
+            rows = list(recommendations.values(*values)[:limit])
+        
+        complete = count < stored_limit and len(rows) == count
+        if len(rows) < limit and not complete:
+            return None
+        
+        return rows
+
 
 class Recommendation(models.Model):
     RECOMMENDATION_TYPE = [
@@ -50,9 +209,9 @@ class Recommendation(models.Model):
         help_text="Score de correspondance avec les préférences (0-100)"
     )
     
-    reason = models.TextField(
-        blank=True,
-        help_text="Raison de la recommandation"
+    reason_codes = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Raisons de la recommandation (masque de bits, voir reasons.py)"
     )
     
     # Facteurs de recommandation
@@ -73,16 +232,71 @@ class Recommendation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = RecommendationManager()
+    
     class Meta:
         ordering = ['-match_score', '-created_at']
         indexes = [
             models.Index(fields=['user', '-match_score']),
-            models.Index(fields=['user', 'is_active']),
+            # Recommandations actives d'un utilisateur, dans l'ordre d'affichage
+            models.Index(
+                fields=['user', 'recommendation_type', 'is_active', '-match_score', '-created_at'],
+                name='recommendation_user_active_idx',
+            ),
+            # Lignes candidates à l'archivage (voir retention.py)
+            models.Index(
+                fields=['updated_at'],
+                name='recommendation_archivable_idx',
+                condition=models.Q(is_active=False, is_viewed=False, is_clicked=False, is_booked=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'offer', 'recommendation_type'],
+                name='unique_recommendation_per_user_offer',
+            ),
         ]
     
     def __str__(self):
         item = self.offer or self.destination or self.hebergement
         return f"Recommandation pour {self.user.username} - {item}"
+    
+    @property
+    def reason(self):
+        """Raison en texte, dans la langue active"""
+        return reasons.render(self.reason_codes)
+    
+    def as_engine_result(self):
+        """Même forme que les éléments de RecommendationEngine.generate_recommendations"""
+        return {
+            'type': self.recommendation_type,
+            'item': self.offer,
+            'score': self.match_score,
+            'reason_codes': self.reason_codes,
+            'preference_match': self.preference_match,
+            'price_match': self.price_match,
+            'tier_bonus': self.tier_bonus,
+            'popularity': self.popularity_score,
+        }
+
+
+class RecommendationSnapshot(models.Model):
+    """
+    Dernière liste d'offres enregistrée pour un utilisateur : limite passée
+    au moteur et nombre d'offres obtenues. Une liste plus courte que sa
+    limite est complète (aucune autre offre au-dessus du seuil).
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recommendation_snapshot'
+    )
+    limit = models.PositiveIntegerField(help_text="Limite passée au moteur")
+    count = models.PositiveIntegerField(help_text="Offres enregistrées")
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.count}/{self.limit} recommandations pour {self.user_id} ({self.computed_at})"
 
 
 class RecommendationFeedback(models.Model):
@@ -107,3 +321,200 @@ class RecommendationFeedback(models.Model):
     def __str__(self):
         return f"Feedback pour {self.recommendation} - {self.feedback_type}"
         return f"Recommendation: {offer_title} for {self.user.get_full_name()}"
+
+
+class RecommendationArchive(models.Model):
+    """Lot de recommandations archivées, en JSON compressé (voir retention.py)"""
+    first_id = models.PositiveIntegerField(help_text="Plus petit id archivé")
+    last_id = models.PositiveIntegerField(help_text="Plus grand id archivé")
+    row_count = models.PositiveIntegerField()
+    payload = models.BinaryField(help_text="Lignes en JSON compressé (zlib)")
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-archived_at']
+    
+    def __str__(self):
+        return f"Archive {self.first_id}-{self.last_id} ({self.row_count} recommandations)"
+    
+    def rows(self):
+        """Lignes archivées (dictionnaires)"""
+        return json.loads(zlib.decompress(self.payload))
+
+
+class OfferSimilarity(models.Model):
+    """
+    Voisins d'une offre par co-réservation (« les voyageurs qui ont réservé
+    cette offre ont aussi réservé »). Seuls les N meilleurs voisins de chaque
+    offre sont gardés ; voir similarity.py.
+    """
+    offer = models.ForeignKey(
+        'offreDestination.Offre',
+        on_delete=models.CASCADE,
+        related_name='similar_offers'
+    )
+    neighbour = models.ForeignKey(
+        'offreDestination.Offre',
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    
+    co_bookings = models.PositiveIntegerField(default=0, help_text="Clients ayant réservé les deux offres")
+    score = models.FloatField(default=0, help_text="Similarité cosinus (0-1)")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['offer', '-score'], name='offer_similarity_rank_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['offer', 'neighbour'], name='unique_offer_neighbour'),
+        ]
+    
+    def __str__(self):
+        return f"{self.offer_id} ~ {self.neighbour_id} ({self.score:.2f})"
+
+
+class OfferFeedbackStats(models.Model):
+    """
+    Compteurs de feedback par offre et par segment (price_range, tier),
+    tenus à jour à chaque écriture de feedback (voir signals.py). La ligne
+    ALL/ALL regroupe tous les segments. adjustment est la pénalité de score
+    (négative ou nulle) appliquée par le moteur.
+    """
+    ALL = '*'
+    COUNTERS = ['relevant', 'not_relevant', 'already_visited', 'interested']
+    # Feedbacks qui pénalisent l'offre
+    NEGATIVE = ['not_relevant', 'already_visited']
+    
+    offer = models.ForeignKey(
+        'offreDestination.Offre',
+        on_delete=models.CASCADE,
+        related_name='feedback_stats'
+    )
+    # Segment de l'utilisateur ('' sans préférences / sans tier, ALL pour le total)
+    price_range = models.CharField(max_length=20, blank=True)
+    tier = models.CharField(max_length=20, blank=True)
+    
+    relevant = models.PositiveIntegerField(default=0)
+    not_relevant = models.PositiveIntegerField(default=0)
+    already_visited = models.PositiveIntegerField(default=0)
+    interested = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    
+    adjustment = models.FloatField(default=0, help_text="Pénalité de score (points, ≤ 0)")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['price_range', 'tier', 'offer'], name='unique_offer_feedback_cohort'),
+        ]
+    
+    def __str__(self):
+        return f"Feedback {self.offer_id} [{self.price_range or '-'}/{self.tier or '-'}] {self.adjustment:.1f}"
+    
+    @classmethod
+    def adjustment_expression(cls):
+        """Pénalité calculée en SQL : part lissée des feedbacks négatifs × pénalité maximale"""
+        max_penalty = getattr(settings, 'RECOMMENDATION_FEEDBACK_MAX_PENALTY', 30)
+        prior = getattr(settings, 'RECOMMENDATION_FEEDBACK_PRIOR', 5)
+        
+        negative = sum((F(name) for name in cls.NEGATIVE[1:]), F(cls.NEGATIVE[0]))
+        total = sum((F(name) for name in cls.COUNTERS[1:]), F(cls.COUNTERS[0]))
+        return Cast(negative, models.FloatField()) * Value(-float(max_penalty)) / (
+            Cast(total, models.FloatField()) + Value(float(prior))
+        )
+    
+    @classmethod
+    def record(cls, offer_id, cohort, feedback_type, rating, delta):
+        """Ajoute (delta=1) ou retire (delta=-1) un feedback des compteurs de
+        l'offre, pour son segment et pour le total"""
+        cohorts = [cohort, (cls.ALL, cls.ALL)]
+        cls.objects.bulk_create(
+            [cls(offer_id=offer_id, price_range=price_range, tier=tier) for price_range, tier in cohorts],
+            ignore_conflicts=True,
+        )
+        
+        changes = {}
+        if feedback_type in cls.COUNTERS:
+            changes[feedback_type] = F(feedback_type) + delta
+        if rating is not None:
+            changes['rating_sum'] = F('rating_sum') + rating * delta
+            changes['rating_count'] = F('rating_count') + delta
+        if not changes:
+            return
+        
+        rows = cls.objects.filter(
+            models.Q(price_range=cohort[0], tier=cohort[1]) | models.Q(price_range=cls.ALL, tier=cls.ALL),
+            offer_id=offer_id,
+        )
+        with transaction.atomic():
+            rows.update(**changes)
+            rows.update(adjustment=cls.adjustment_expression())
+    
+    @classmethod
+    def adjustments(cls, cohort):
+        """{offre: pénalité} pour un segment (à défaut, le total), en une requête"""
+        adjustments = {}
+        rows = cls.objects.filter(
+            models.Q(price_range=cohort[0], tier=cohort[1])
+            | models.Q(price_range=cls.ALL, tier=cls.ALL, adjustment__lt=0),
+        ).values_list('offer_id', 'price_range', 'adjustment')
+        for offer_id, price_range, adjustment in rows:
+            # La ligne du segment l'emporte sur le total
+            if price_range != cls.ALL or offer_id not in adjustments:
+                adjustments[offer_id] = adjustment
+        return {offer_id: adjustment for offer_id, adjustment in adjustments.items() if adjustment}
+
+
+class CatalogChange(models.Model):
+    """
+    Date du dernier changement du catalogue (offres, hébergements et leurs
+    relations), en une seule ligne. Enregistrée en base plutôt que dans le
+    cache : tous les processus la lisent, y compris après un redémarrage,
+    pour écarter les recommandations enregistrées avant le changement.
+    """
+    changed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Catalogue modifié le {self.changed_at}"
+    
+    @classmethod
+    def mark(cls, when=None):
+        when = when or timezone.now()
+        if not cls.objects.filter(pk=1).update(changed_at=when):
+            cls.objects.update_or_create(pk=1, defaults={'changed_at': when})
+    
+    @classmethod
+    def last(cls):
+        """Date du dernier changement (None si aucun n'a été enregistré)"""
+        return cls.objects.filter(pk=1).values_list('changed_at', flat=True).first()
+
+
+class RecommendationVersion(models.Model):
+    """
+    Version des entrées de recommandation d'un utilisateur (préférences,
+    fidélité, réservations), incrémentée à chaque changement. Enregistrée en
+    base plutôt que dans le cache : un jeton par utilisateur ne doit pas être
+    évincé quand le cache partagé fait de la place.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='recommendation_version'
+    )
+    version = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Version {self.version} des recommandations de {self.user_id}"
+    
+    @classmethod
+    def bump(cls, user_id):
+        if not cls.objects.filter(user_id=user_id).update(version=F('version') + 1):
+            cls.objects.get_or_create(user_id=user_id, defaults={'version': 1})
+    
+    @classmethod
+    def current(cls, user_id):
+        """Version courante (0 si les entrées n'ont jamais changé)"""
+        return cls.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
@@ -0,0 +1,48 @@
+"""Codes de raison des recommandations.
+
+La raison d'une recommandation est stockée comme un masque de bits
+(Recommendation.reason_codes) et n'est traduite en texte qu'à l'affichage,
+dans la langue de la requête.
+"""
+from django.utils.text import format_lazy
+from django.utils.translation import gettext_lazy as _
+
+
+PREFERENCES = 1
+PRICE = 2
+TIER_BRONZE = 4
+TIER_SILVER = 8
+TIER_GOLD = 16
+TIER_PLATINUM = 32
+FIVE_STAR = 64
+SIMILAR = 128
+
+TIER_CODES = {
+    'BRONZE': TIER_BRONZE,
+    'SILVER': TIER_SILVER,
+    'GOLD': TIER_GOLD,
+    'PLATINUM': TIER_PLATINUM,
+}
+
+# Fragments dans l'ordre d'affichage
+LABELS = [
+    (PREFERENCES, _("Correspond à vos préférences")),
+    (PRICE, _("Prix avantageux pour votre gamme")),
+    *[(code, format_lazy(_("Avantage spécial {tier}"), tier=tier)) for tier, code in TIER_CODES.items()],
+    (FIVE_STAR, _("Hébergement 5 étoiles disponible")),
+    (SIMILAR, _("Souvent réservée avec vos voyages")),
+]
+
+DEFAULT_LABEL = _("Recommandé pour vous")
+SEPARATOR = " • "
+
+
+def tier_code(tier):
+    """Code du tier (Bronze pour un tier inconnu, comme le bonus)"""
+    return TIER_CODES.get(tier, TIER_BRONZE)
+
+
+def render(codes):
+    """Texte de la raison, traduit dans la langue active"""
+    fragments = [str(label) for code, label in LABELS if codes & code]
+    return SEPARATOR.join(fragments) if fragments else str(DEFAULT_LABEL)
@@ -0,0 +1,109 @@
+"""Rétention de la table des recommandations.
+
+Deux passes, chacune par petits lots (une transaction courte par lot, pour
+ne jamais bloquer longtemps les écritures du moteur) :
+
+- deactivate_superseded : désactive les recommandations actives dont
+  l'offre n'est plus active ou qui n'ont pas été recalculées depuis
+  longtemps ;
+- archive_unseen : déplace dans RecommendationArchive (JSON compressé) les
+  recommandations inactives anciennes qui n'ont jamais été vues, cliquées ni
+  réservées et n'ont pas de feedback.
+"""
+import json
+import time
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Recommendation, RecommendationArchive
+
+
+DEACTIVATE_AFTER_DAYS = getattr(settings, 'RECOMMENDATION_DEACTIVATE_AFTER_DAYS', 7)
+ARCHIVE_AFTER_DAYS = getattr(settings, 'RECOMMENDATION_ARCHIVE_AFTER_DAYS', 30)
+
+ARCHIVED_FIELDS = [
+    'id', 'user_id', 'recommendation_type', 'offer_id', 'destination_id', 'hebergement_id',
+    'match_score', 'reason_codes', 'preference_match', 'price_match', 'tier_bonus', 'popularity_score',
+    'created_at', 'updated_at',
+]
+
+
+def _batches(queryset, batch_size):
+    """Identifiants par lots croissants (pagination par clé, sans OFFSET)"""
+    last_pk = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        last_pk = ids[-1]
+        yield ids
+
+
+def deactivate_superseded(days=DEACTIVATE_AFTER_DAYS, batch_size=1000, pause=0, dry_run=False):
+    """Désactive les recommandations périmées ; retourne le nombre de lignes"""
+    cutoff = timezone.now() - timedelta(days=days)
+    superseded = Recommendation.objects.filter(is_active=True).filter(
+        Q(updated_at__lt=cutoff) | Q(offer__actif=False)
+    )
+
+    total = 0
+    for ids in _batches(superseded, batch_size):
+        if not dry_run:
+            total += Recommendation.objects.filter(pk__in=ids, is_active=True).update(
+                is_active=False, updated_at=timezone.now(),
+            )
+        else:
+            total += len(ids)
+        time.sleep(pause)
+    return total
+
+
+def archivable(days=ARCHIVE_AFTER_DAYS):
+    """Recommandations inactives sans interaction, plus anciennes que days"""
+    return Recommendation.objects.filter(
+        is_active=False,
+        is_viewed=False,
+        is_clicked=False,
+        is_booked=False,
+        updated_at__lt=timezone.now() - timedelta(days=days),
+        feedback__isnull=True,
+    )
+
+
+def archive_unseen(days=ARCHIVE_AFTER_DAYS, batch_size=1000, pause=0, dry_run=False):
+    """
+    Archive puis supprime les recommandations jamais consultées, un lot
+    par transaction ; retourne (lignes archivées, lots écrits)
+    """
+    candidates = archivable(days)
+
+    rows_total = batches = 0
+    for ids in _batches(candidates, batch_size):
+        if dry_run:
+            rows_total += len(ids)
+            continue
+
+        with transaction.atomic():
+            # Relu dans la transaction : une ligne vue entre-temps n'est pas archivée
+            rows = list(candidates.filter(pk__in=ids).order_by('pk').values(*ARCHIVED_FIELDS))
+            if rows:
+                RecommendationArchive.objects.create(
+                    first_id=rows[0]['id'],
+                    last_id=rows[-1]['id'],
+                    row_count=len(rows),
+                    payload=zlib.compress(json.dumps(rows, cls=DjangoJSONEncoder).encode('utf-8')),
+                )
+                Recommendation.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+                rows_total += len(rows)
+                batches += 1
+        time.sleep(pause)
+
+    return rows_total, batches
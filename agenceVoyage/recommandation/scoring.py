@@ -0,0 +1,196 @@
+"""Noyau de scoring vectorisé pour le moteur de recommandation.
+
+Le catalogue des offres actives est chargé en colonnes NumPy (prix,
+réservations, hébergement 5 étoiles, destinations) puis toutes les offres
+sont notées en une seule passe, avec les mêmes formules que
+RecommendationEngine.calculate_offer_score. Les mêmes formules existent
+aussi en expressions SQL, pour ordonner ou classer côté base.
+"""
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import BooleanField, Case, FloatField, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
+from offreDestination.models import OffreStats
+from preferences.models import PriceRange
+
+
+# Plages de prix (min, max) par gamme, pour les offres et les hébergements
+OFFER_PRICE_BANDS = {
+    PriceRange.BUDGET: (0, 500),
+    PriceRange.STANDARD: (500, 1500),
+    PriceRange.PREMIUM: (1500, 10000),
+}
+DEFAULT_OFFER_PRICE_BAND = (0, 10000)
+
+HEBERGEMENT_PRICE_BANDS = {
+    PriceRange.BUDGET: (0, 100),
+    PriceRange.STANDARD: (100, 300),
+    PriceRange.PREMIUM: (300, 1000),
+}
+DEFAULT_HEBERGEMENT_PRICE_BAND = (0, 1000)
+
+# Bonus par tier de fidélité (un tier inconnu vaut Bronze)
+TIER_BONUSES = {
+    'BRONZE': 5,
+    'SILVER': 15,
+    'GOLD': 25,
+    'PLATINUM': 35,
+}
+DEFAULT_TIER_BONUS = 5
+
+
+# Poids des composantes du score et seuil de recommandation
+# (mêmes valeurs que RecommendationEngine.calculate_offer_score)
+Weights = namedtuple('Weights', ['preference', 'price', 'tier', 'popularity', 'threshold'])
+DEFAULT_WEIGHTS = Weights(preference=0.4, price=0.3, tier=0.2, popularity=0.1, threshold=40)
+
+
+def tier_bonus(tier):
+    """Bonus de tier (0 sans programme de fidélité)"""
+    if not tier:
+        return 0
+    return TIER_BONUSES.get(tier, DEFAULT_TIER_BONUS)
+
+
+def with_scoring_inputs(offers):
+    """Annote les offres avec leurs données de scoring lues dans OffreStats
+    (calculées à la volée pour une offre sans statistiques)"""
+    live = OffreStats.live_annotations()
+
+    return offers.annotate(
+        destination_count=Coalesce('stats__destination_count', live['destination_count']),
+        reservation_count=Coalesce('stats__reservation_count', live['reservation_count']),
+        has_five_star=Coalesce('stats__has_five_star', live['has_five_star'], output_field=BooleanField()),
+    )
+
+
+def price_score_expression(field, price_range, bands, default_band, decay):
+    """Score de prix (0-100) calculé en SQL, mêmes règles que
+    RecommendationEngine._calculate_price_score / _calculate_accommodation_price_score.
+
+    price_range vaut None quand l'utilisateur n'a pas de préférences.
+    """
+    if price_range is None:
+        return Value(50.0, output_field=FloatField())
+
+    min_price, max_price = bands.get(price_range, default_band)
+    price = Cast(field, FloatField())
+
+    return Case(
+        When(**{f'{field}__lt': min_price}, then=Greatest(
+            Value(0.0), Value(100.0) - (Value(float(min_price)) - price) / Value(float(decay))
+        )),
+        When(**{f'{field}__gt': max_price}, then=Greatest(
+            Value(0.0), Value(100.0) - (price - Value(float(max_price))) / Value(float(decay))
+        )),
+        default=Value(100.0),
+        output_field=FloatField(),
+    )
+
+
+def popularity_expression():
+    """Popularité (0-100) en SQL, à partir des annotations reservation_count et has_five_star"""
+    rating = Least(Cast('reservation_count', FloatField()) / Value(5.0), Value(100.0))
+    five_star = Case(When(has_five_star=True, then=Value(20.0)), default=Value(0.0), output_field=FloatField())
+    return Least(rating + five_star, Value(100.0))
+
+
+class OfferCatalog:
+    """Catalogue d'offres en colonnes NumPy"""
+
+    def __init__(self, ids, prices, destination_counts, reservation_counts, has_five_star):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.destination_counts = np.asarray(destination_counts, dtype=np.int64)
+        self.reservation_counts = np.asarray(reservation_counts, dtype=np.int64)
+        self.has_five_star = np.asarray(has_five_star, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_queryset(cls, offers):
+        """Construit le catalogue à partir d'offres annotées (destination_count,
+        reservation_count, has_five_star), sans instancier de modèles"""
+        rows = list(offers.values_list(
+            'pk', 'prix_par_personne', 'destination_count', 'reservation_count', 'has_five_star'
+        ))
+        return cls(
+            [row[0] for row in rows],
+            [float(row[1]) for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows],
+            [bool(row[4]) for row in rows],
+        )
+
+    def preference_scores(self, has_preferences):
+        if not has_preferences:
+            return np.full(len(self), 50.0)
+        return np.minimum(50.0 + np.where(self.destination_counts > 0, 25.0, 0.0), 100)
+
+    def price_scores(self, price_range):
+        if price_range is None:
+            return np.full(len(self), 50.0)
+
+        min_price, max_price = OFFER_PRICE_BANDS.get(price_range, DEFAULT_OFFER_PRICE_BAND)
+        below = np.maximum(0, 100 - (min_price - self.prices) / 10)
+        above = np.maximum(0, 100 - (self.prices - max_price) / 10)
+
+        return np.where(
+            self.prices < min_price, below,
+            np.where(self.prices > max_price, above, 100.0)
+        )
+
+    def popularity_scores(self):
+        rating = np.minimum(self.reservation_counts / 5, 100)
+        rating = rating + np.where(self.has_five_star, 20, 0)
+        return np.minimum(rating, 100)
+
+    def score(self, price_range, tier_bonus, weights=DEFAULT_WEIGHTS):
+        """Retourne (score, préférences, prix, popularité) pour toutes les offres.
+
+        price_range vaut None quand l'utilisateur n'a pas de préférences.
+        """
+        preference = self.preference_scores(price_range is not None)
+        price = self.price_scores(price_range)
+        popularity = self.popularity_scores()
+
+        score = preference * weights.preference
+        score = score + price * weights.price
+        score = score + tier_bonus * weights.tier
+        score = score + popularity * weights.popularity
+
+        return np.minimum(score, 100), preference, price, popularity
+
+    def adjustments(self, adjustments):
+        """Ajustements {id: points} en tableau aligné sur le catalogue (0 ailleurs)"""
+        values = np.zeros(len(self))
+        if not adjustments or not len(self):
+            return values
+
+        ids = np.fromiter(adjustments, dtype=np.int64, count=len(adjustments))
+        points = np.fromiter(adjustments.values(), dtype=np.float64, count=len(adjustments))
+        order = np.argsort(self.ids)
+        positions = order[np.minimum(np.searchsorted(self.ids, ids, sorter=order), len(self) - 1)]
+        found = self.ids[positions] == ids
+        values[positions[found]] = points[found]
+        return values
+
+    def top_k(self, scores, k, threshold):
+        """Indices des k meilleurs scores au-dessus du seuil, triés par score
+        décroissant (à score égal, l'ordre du catalogue est conservé)"""
+        candidates = np.flatnonzero(scores > threshold)
+
+        if len(candidates) > k > 0:
+            candidate_scores = scores[candidates]
+            partition = np.argpartition(-candidate_scores, k - 1)[:k]
+            cutoff = candidate_scores[partition].min()
+            above = candidates[candidate_scores > cutoff]
+            ties = candidates[candidate_scores == cutoff][:k - len(above)]
+            candidates = np.concatenate([above, ties])
+        elif k <= 0:
+            candidates = candidates[:0]
+
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order]
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from . import reasons
 from .models import Recommendation, RecommendationFeedback
 from offreDestination.models import Offre, Destination, Hebergement
 
@@ -37,7 +38,71 @@ class RecommendationSerializer(serializers.ModelSerializer):
         model = Recommendation
         fields = [
             'id', 'recommendation_type', 'offer', 'destination', 'hebergement',
-            'match_score', 'reason', 'preference_match', 'price_match',
+            'match_score', 'reason', 'reason_codes', 'preference_match', 'price_match',
             'tier_bonus', 'popularity_score', 'is_viewed', 'is_clicked',
             'is_booked', 'feedback', 'created_at'
         ]
+
+
+class RecommendationValuesSerializer:
+    """
+    Même sortie que RecommendationSerializer, construite à partir de lignes
+    values() : aucun modèle n'est instancié. Chaque valeur passe par le champ
+    DRF correspondant, le format (décimaux, dates) est donc identique.
+    """
+    serializer_class = RecommendationSerializer
+    # Champs calculés : champ lu dans values() et fonction de rendu
+    computed = {
+        'reason': ('reason_codes', reasons.render),
+    }
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def lookups(cls):
+        """Champs à passer à values() (relations aplaties en relation__champ)"""
+        fields = []
+        for name, field in cls.serializer_class().fields.items():
+            if isinstance(field, serializers.BaseSerializer):
+                # La clé primaire indique si la relation existe
+                fields.append(f'{name}__pk')
+                fields.extend(f'{name}__{sub}' for sub in field.fields)
+            elif name in cls.computed:
+                fields.append(cls.computed[name][0])
+            else:
+                fields.append(name)
+        return list(dict.fromkeys(fields))
+
+    @classmethod
+    def from_queryset(cls, queryset):
+        return cls(queryset.values(*cls.lookups()))
+
+    @property
+    def data(self):
+        fields = self.serializer_class().fields.items()
+        return [
+            {
+                name: self._nested(row, name, field) if isinstance(field, serializers.BaseSerializer)
+                else self._computed(row, name) if name in self.computed
+                else self._value(field, row[name])
+                for name, field in fields
+            }
+            for row in self.rows
+        ]
+
+    def _nested(self, row, name, serializer):
+        if row[f'{name}__pk'] is None:
+            return None
+        return {
+            sub: self._value(field, row[f'{name}__{sub}'])
+            for sub, field in serializer.fields.items()
+        }
+
+    def _computed(self, row, name):
+        source, render = self.computed[name]
+        return render(row[source])
+
+    @staticmethod
+    def _value(field, value):
+        return None if value is None else field.to_representation(value)
@@ -0,0 +1,102 @@
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from offreDestination.models import Offre, Hebergement
+from preferences.models import Preference
+from programmeFidilite import tiers
+from programmeFidilite.models import LoyaltyProgram, FidelityTierConfig
+from reservation.models import Reservation
+from . import cache, similarity
+from .models import OfferFeedbackStats, Recommendation, RecommendationFeedback
+
+
+@receiver(post_save, sender=Preference)
+@receiver(post_delete, sender=Preference)
+@receiver(post_save, sender=LoyaltyProgram)
+@receiver(post_delete, sender=LoyaltyProgram)
+def invalidate_user_recommendations(sender, instance, **kwargs):
+    """Préférences ou tier modifiés : les recommandations de l'utilisateur sont à recalculer"""
+    cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=Offre)
+@receiver(post_delete, sender=Offre)
+@receiver(post_save, sender=Hebergement)
+@receiver(post_delete, sender=Hebergement)
+def invalidate_catalog_recommendations(sender, **kwargs):
+    """Catalogue modifié : toutes les recommandations sont à recalculer"""
+    cache.invalidate_catalog()
+
+
+@receiver(m2m_changed, sender=Offre.nom_destinations.through)
+@receiver(m2m_changed, sender=Hebergement.offres.through)
+def invalidate_catalog_on_relations(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        cache.invalidate_catalog()
+
+
+@receiver(post_save, sender=FidelityTierConfig)
+@receiver(post_delete, sender=FidelityTierConfig)
+def invalidate_tier_recommendations(sender, **kwargs):
+    cache.invalidate_tier_config()
+
+
+@receiver(post_save, sender=Reservation)
+def record_co_booking(sender, instance, created, **kwargs):
+    """Première réservation d'un client sur une offre : nouvelles paires de co-réservation"""
+    if not created:
+        return
+    cache.invalidate_user(instance.client_id)
+    if not Reservation.objects.filter(
+        client_id=instance.client_id, offre_id=instance.offre_id
+    ).exclude(pk=instance.pk).exists():
+        similarity.record_booking(instance.client_id, instance.offre_id)
+
+
+@receiver(post_delete, sender=Reservation)
+def forget_co_booking(sender, instance, **kwargs):
+    cache.invalidate_user(instance.client_id)
+    if not Reservation.objects.filter(client_id=instance.client_id, offre_id=instance.offre_id).exists():
+        similarity.record_booking(instance.client_id, instance.offre_id, delta=-1)
+
+
+def _feedback_target(feedback):
+    """(offre, segment de l'utilisateur) de la recommandation, ou None ; le
+    tier est résolu comme dans le moteur (tiers.effective_tier)"""
+    row = Recommendation.objects.filter(pk=feedback.recommendation_id).values_list(
+        'offer_id', 'user__preference__price_range',
+        'user__loyalty_program__tier', 'user__loyalty_program__totalEarnedPoints',
+    ).first()
+    if row is None or row[0] is None:
+        return None
+    offer_id, price_range, tier, earned = row
+    if tier is not None:
+        tier = tiers.effective_tier(tier, earned)
+    return offer_id, (price_range or '', tier or '')
+
+
+@receiver(pre_save, sender=RecommendationFeedback)
+def stash_previous_feedback(sender, instance, **kwargs):
+    instance._previous_feedback = None
+    if instance.pk:
+        instance._previous_feedback = (
+            RecommendationFeedback.objects.filter(pk=instance.pk).values_list('feedback_type', 'rating').first()
+        )
+
+
+@receiver(post_save, sender=RecommendationFeedback)
+def record_feedback_stats(sender, instance, **kwargs):
+    """Met à jour les compteurs de l'offre : retire l'ancien feedback, ajoute le nouveau"""
+    target = _feedback_target(instance)
+    if target is None:
+        return
+    previous = getattr(instance, '_previous_feedback', None)
+    if previous is not None:
+        OfferFeedbackStats.record(*target, *previous, delta=-1)
+    OfferFeedbackStats.record(*target, instance.feedback_type, instance.rating, delta=1)
+
+
+@receiver(post_delete, sender=RecommendationFeedback)
+def forget_feedback_stats(sender, instance, **kwargs):
+    target = _feedback_target(instance)
+    if target is not None:
+        OfferFeedbackStats.record(*target, instance.feedback_type, instance.rating, delta=-1)
@@ -0,0 +1,183 @@
+"""Similarité entre offres par co-réservation.
+
+Deux offres sont proches quand les mêmes clients les ont réservées :
+score = clients communs / sqrt(clients de A × clients de B) (cosinus).
+Seuls les N meilleurs voisins de chaque offre sont stockés dans
+OfferSimilarity ; une recherche coûte donc O(voisins).
+
+Les réservations mettent à jour les paires concernées au fil de l'eau
+(voir signals.py). Une paire sortie du top N perd son compteur : ces mises
+à jour sont approchées, la commande rebuild_offer_similarity recalcule
+l'index exact en parcourant les réservations par lots.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from reservation.models import Reservation
+from .models import OfferSimilarity
+
+
+# Voisins gardés par offre
+NEIGHBOURS = getattr(settings, 'RECOMMENDATION_SIMILARITY_NEIGHBOURS', 20)
+
+
+def cosine(co_bookings, bookers_a, bookers_b):
+    if not bookers_a or not bookers_b:
+        return 0.0
+    return co_bookings / math.sqrt(bookers_a * bookers_b)
+
+
+def _booker_counts(offer_ids):
+    """Nombre de clients distincts par offre"""
+    return dict(
+        Reservation.objects.filter(offre_id__in=offer_ids).order_by()
+        .values('offre_id').annotate(n=Count('client_id', distinct=True))
+        .values_list('offre_id', 'n')
+    )
+
+
+def similar_offers(offer_ids, exclude=()):
+    """{voisin: meilleur score} pour un ensemble d'offres, sans les voisins de exclude, en une requête"""
+    similar = {}
+    rows = OfferSimilarity.objects.filter(offer_id__in=offer_ids).exclude(
+        neighbour_id__in=exclude
+    ).values_list('neighbour_id', 'score')
+    for neighbour_id, score in rows:
+        if score > similar.get(neighbour_id, 0.0):
+            similar[neighbour_id] = score
+    return similar
+
+
+def neighbours(offer_id, limit=NEIGHBOURS):
+    """Voisins d'une offre, du plus proche au plus éloigné"""
+    return (
+        OfferSimilarity.objects.filter(offer_id=offer_id)
+        .select_related('neighbour')
+        .order_by('-score', 'neighbour_id')[:limit]
+    )
+
+
+def record_booking(client_id, offre_id, delta=1):
+    """
+    Met à jour les paires (offre, autres offres du client) quand un client
+    réserve une offre pour la première fois (delta=1) ou n'a plus aucune
+    réservation dessus (delta=-1)
+    """
+    others = set(
+        Reservation.objects.filter(client_id=client_id).exclude(offre_id=offre_id)
+        .values_list('offre_id', flat=True).distinct()
+    )
+    if not others:
+        return
+
+    bookers = _booker_counts(others | {offre_id})
+    pairs = [(offre_id, other) for other in others] + [(other, offre_id) for other in others]
+
+    with transaction.atomic():
+        existing = {
+            (offer_id, neighbour_id): (pk, co_bookings)
+            for pk, offer_id, neighbour_id, co_bookings in OfferSimilarity.objects.select_for_update().filter(
+                Q(offer_id=offre_id, neighbour_id__in=others) | Q(offer_id__in=others, neighbour_id=offre_id)
+            ).values_list('pk', 'offer_id', 'neighbour_id', 'co_bookings')
+        }
+
+        updated = []
+        created = []
+        emptied = []
+        for offer_id, neighbour_id in pairs:
+            pk, co_bookings = existing.get((offer_id, neighbour_id), (None, 0))
+            co_bookings += delta
+            if co_bookings <= 0:
+                if pk is not None:
+                    emptied.append(pk)
+                continue
+            row = OfferSimilarity(
+                pk=pk,
+                offer_id=offer_id,
+                neighbour_id=neighbour_id,
+                co_bookings=co_bookings,
+                score=cosine(co_bookings, bookers.get(offer_id, 0), bookers.get(neighbour_id, 0)),
+            )
+            (created if pk is None else updated).append(row)
+
+        if emptied:
+            OfferSimilarity.objects.filter(pk__in=emptied).delete()
+        if updated:
+            for row in updated:
+                row.updated_at = timezone.now()
+            OfferSimilarity.objects.bulk_update(updated, ['co_bookings', 'score', 'updated_at'])
+        # Une annulation ne crée jamais de paire (l'offre peut être en cours de suppression)
+        if created and delta > 0:
+            OfferSimilarity.objects.bulk_create(
+                created,
+                update_conflicts=True,
+                unique_fields=['offer', 'neighbour'],
+                update_fields=['co_bookings', 'score', 'updated_at'],
+            )
+            _trim(others | {offre_id})
+
+
+def _trim(offer_ids, limit=NEIGHBOURS):
+    """Supprime les voisins au-delà du top N des offres données"""
+    overflow = list(
+        OfferSimilarity.objects.filter(offer_id__in=offer_ids).annotate(
+            rank=Window(RowNumber(), partition_by=F('offer_id'), order_by=[F('score').desc(), F('neighbour_id').asc()]),
+        ).filter(rank__gt=limit).values_list('pk', flat=True)
+    )
+    if overflow:
+        OfferSimilarity.objects.filter(pk__in=overflow).delete()
+
+
+def rebuild(limit=NEIGHBOURS, chunk_size=5000, batch_size=1000):
+    """
+    Recalcule tout l'index. Les paires (client, offre) sont lues par lots,
+    triées par client ; seuls les compteurs de paires restent en mémoire.
+    Retourne le nombre de lignes écrites.
+    """
+    co_bookings = defaultdict(Counter)
+    bookers = Counter()
+
+    rows = (
+        Reservation.objects.order_by('client_id', 'offre_id')
+        .values_list('client_id', 'offre_id').distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+    for _, group in groupby(rows, key=itemgetter(0)):
+        offers = [offre_id for _, offre_id in group]
+        bookers.update(offers)
+        for offer_id in offers:
+            for neighbour_id in offers:
+                if offer_id != neighbour_id:
+                    co_bookings[offer_id][neighbour_id] += 1
+
+    written = 0
+    with transaction.atomic():
+        OfferSimilarity.objects.all().delete()
+        batch = []
+        for offer_id, counter in co_bookings.items():
+            best = heapq.nsmallest(limit, (
+                (-cosine(count, bookers[offer_id], bookers[neighbour_id]), neighbour_id, count)
+                for neighbour_id, count in counter.items()
+            ))
+            batch.extend(
+                OfferSimilarity(offer_id=offer_id, neighbour_id=neighbour_id, co_bookings=count, score=-score)
+                for score, neighbour_id, count in best
+            )
+            if len(batch) >= batch_size:
+                OfferSimilarity.objects.bulk_create(batch, batch_size=batch_size)
+                written += len(batch)
+                batch = []
+        if batch:
+            OfferSimilarity.objects.bulk_create(batch, batch_size=batch_size)
+            written += len(batch)
+
+    return written
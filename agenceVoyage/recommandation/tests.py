@@ -1,3 +1,990 @@
-from django.test import TestCase
+import functools
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as django_cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone, translation
+from rest_framework.test import APIClient
+
+from offreDestination.models import Destination, Hebergement, Offre, OffreStats
+from preferences.models import Preference
+from programmeFidilite import tiers
+from programmeFidilite.models import FidelityTierConfig, LoyaltyProgram
+from reservation.models import Reservation
+from . import benchmark, cache, candidates, evaluation, reasons, scoring, similarity, tracking
+from .models import (
+    OfferFeedbackStats, OfferSimilarity, Recommendation, RecommendationArchive, RecommendationFeedback,
+    RecommendationSnapshot, RecommendationVersion,
+)
+from .serializers import RecommendationSerializer, RecommendationValuesSerializer
+from .views import RecommendationEngine, render_recommendations_json
+
+
+class RecommendationSerializationTests(TestCase):
+    """Le nombre de requêtes ne dépend pas du nombre de recommandations"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.destination = Destination.objects.create(
+            nom_destination="Djerba", pays="Tunisie", description="Île", image="destinations/djerba.jpg"
+        )
+        cls.hebergement = Hebergement.objects.create(
+            nom_hebergement="Hôtel Mer", type_hebergement="hotel", destination=cls.destination,
+            prix_par_nuit=Decimal('120.00'), etoiles=4,
+        )
+        cls.offers = [
+            Offre.objects.create(
+                titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal(400 + i * 10),
+                image="offres/offre.jpg",
+            )
+            for i in range(40)
+        ]
+        for offer in cls.offers:
+            offer.nom_destinations.add(cls.destination)
+
+        User = get_user_model()
+        cls.small = User.objects.create_user(email="small@example.com", password="x")
+        cls.large = User.objects.create_user(email="large@example.com", password="x")
+        cls._recommend(cls.small, cls.offers[:20])
+        cls._recommend(cls.large, cls.offers)
+
+    @classmethod
+    def _recommend(cls, user, offers):
+        for i, offer in enumerate(offers):
+            recommendation = Recommendation.objects.create(
+                user=user, offer=offer, recommendation_type='offer', match_score=90 - i,
+                reason_codes=reasons.PREFERENCES | reasons.TIER_GOLD,
+                destination=cls.destination if i % 2 else None,
+                hebergement=cls.hebergement if i % 3 else None,
+            )
+            if i % 2:
+                RecommendationFeedback.objects.create(
+                    recommendation=recommendation, feedback_type='relevant', rating=5
+                )
+        RecommendationSnapshot.objects.create(
+            user=user, limit=len(offers), count=len(offers), computed_at=timezone.now()
+        )
+
+    def _serialize(self, user):
+        with CaptureQueriesContext(connection) as queries:
+            data = RecommendationSerializer(Recommendation.objects.for_api().filter(user=user), many=True).data
+        return data, len(queries)
+
+    def test_for_api_serializes_in_one_query(self):
+        small, small_queries = self._serialize(self.small)
+        large, large_queries = self._serialize(self.large)
+
+        self.assertEqual((len(small), len(large)), (20, 40))
+        self.assertEqual(small_queries, 1)
+        self.assertEqual(large_queries, 1)
+
+    def test_values_serializer_matches_model_serializer(self):
+        queryset = Recommendation.objects.for_api().filter(user=self.large)
+        expected = RecommendationSerializer(queryset, many=True).data
+
+        with CaptureQueriesContext(connection) as queries:
+            lean = RecommendationValuesSerializer.from_queryset(queryset).data
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(lean, [dict(item) for item in expected])
+
+    def test_my_recommendations_query_count(self):
+        client = APIClient()
+        counts = {}
+        for user in (self.small, self.large):
+            client.force_authenticate(user)
+            for lean in ('0', '1'):
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get('/recommendations/api/my_recommendations/', {'lean': lean})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()), 20)
+                counts[user.pk, lean] = len(queries)
+
+        self.assertEqual(counts[self.small.pk, '0'], counts[self.large.pk, '0'])
+        self.assertEqual(counts[self.small.pk, '1'], counts[self.large.pk, '1'])
+
+    def test_lean_response_matches_default_response(self):
+        client = APIClient()
+        client.force_authenticate(self.large)
+
+        default = client.get('/recommendations/api/my_recommendations/').json()
+        lean = client.get('/recommendations/api/my_recommendations/', {'lean': '1'}).json()
+
+        self.assertEqual(lean, default)
+
+
+class ReasonLabelTests(SimpleTestCase):
+    """Les raisons sont rendues dans la langue active"""
+
+    codes = reasons.PREFERENCES | reasons.TIER_GOLD | reasons.FIVE_STAR
+
+    def test_english_catalog(self):
+        with translation.override('en'):
+            self.assertEqual(
+                reasons.render(self.codes),
+                "Matches your preferences • Special GOLD benefit • 5-star accommodation available",
+            )
+            self.assertEqual(reasons.render(0), "Recommended for you")
+
+    def test_french_source(self):
+        with translation.override('fr'):
+            self.assertEqual(
+                reasons.render(self.codes),
+                "Correspond à vos préférences • Avantage spécial GOLD • Hébergement 5 étoiles disponible",
+            )
+            self.assertEqual(reasons.render(0), "Recommandé pour vous")
+
+
+def create_recommendations(count, email="tracking@example.com"):
+    user = get_user_model().objects.create_user(email=email, password="x")
+    offers = [
+        Offre.objects.create(
+            titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal('500.00'), image="offres/offre.jpg",
+        )
+        for i in range(count)
+    ]
+    return user, [Recommendation.objects.create(user=user, offer=offer, match_score=50) for offer in offers]
+
+
+class TrackingBufferTests(TestCase):
+    """Événements de suivi écrits par lots"""
+
+    def setUp(self):
+        self.user, self.recommendations = create_recommendations(3)
+        self.ids = [recommendation.pk for recommendation in self.recommendations]
+
+    def viewed(self):
+        return set(Recommendation.objects.filter(is_viewed=True).values_list('pk', flat=True))
+
+    def test_buffer_flushes_when_full(self):
+        buffer = tracking.TrackingBuffer(max_events=2, flush_interval=0)
+        buffer.record('view', self.ids[:1])
+        self.assertEqual(self.viewed(), set())
+
+        with self.assertNumQueries(2):  # une requête par type d'événement
+            buffer.record('click', self.ids[1:2])
+        self.assertEqual(self.viewed(), set(self.ids[:1]))
+        self.assertTrue(Recommendation.objects.get(pk=self.ids[1]).is_clicked)
+
+    def test_close_flushes_pending_events(self):
+        buffer = tracking.TrackingBuffer(max_events=100, flush_interval=0)
+        buffer.record('view', self.ids)
+        self.assertEqual(self.viewed(), set())
+
+        self.assertEqual(buffer.close(), 3)
+        self.assertEqual(self.viewed(), set(self.ids))
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_mark_viewed_writes_immediately(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post('/recommendations/api/mark_viewed/', {'recommendation_id': self.ids[0]}, format='json')
+
+        self.assertEqual(response.json(), {'success': True})
+        self.assertEqual(self.viewed(), {self.ids[0]})
+
+
+class TrackingFlushThreadTests(TransactionTestCase):
+    """Un worker inactif écrit ses événements sans attendre la requête suivante"""
+
+    def test_interval_flush_runs_in_background(self):
+        _, recommendations = create_recommendations(2)
+        buffer = tracking.TrackingBuffer(max_events=100, flush_interval=0.05)
+        try:
+            buffer.record('view', [recommendation.pk for recommendation in recommendations])
+
+            deadline = time.monotonic() + 5
+            while Recommendation.objects.filter(is_viewed=True).count() < 2 and time.monotonic() < deadline:
+                time.sleep(0.02)
+            self.assertEqual(Recommendation.objects.filter(is_viewed=True).count(), 2)
+        finally:
+            buffer.close()
+        self.assertIsNone(buffer._thread)
+
+
+class RecommendationJsonTests(TestCase):
+    """JSON rapide de api_recommendations_json"""
+
+    def test_repeated_fields_are_emitted_once(self):
+        _, [recommendation] = create_recommendations(1)
+
+        payload = render_recommendations_json([recommendation.as_engine_result()], ['id', 'score', 'id'])
+
+        self.assertEqual(
+            payload, f'{{"count": 1, "recommendations": [{{"id": {recommendation.offer_id}, "score": 50.0}}]}}'
+        )
+
+
+class RecommendationCacheTests(TestCase):
+    """LRU par worker et invalidation par jetons de version"""
+
+    def test_lru_counts_hits_misses_and_evictions(self):
+        lru = cache.LRUCache(max_size=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)  # évince b, le moins récemment utilisé
+
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.stats(), {
+            'size': 2, 'max_size': 2, 'hits': 1, 'misses': 1, 'evictions': 1, 'hit_rate': 0.5,
+        })
+
+    def test_lru_entries_expire(self):
+        lru = cache.LRUCache(max_size=2, ttl=10)
+        with mock.patch('recommandation.cache.time.monotonic', return_value=100):
+            lru.set('a', 1)
+        with mock.patch('recommandation.cache.time.monotonic', return_value=109):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch('recommandation.cache.time.monotonic', return_value=111):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual((lru.hits, lru.misses, lru.stats()['size']), (1, 1, 0))
+
+    def test_saves_replace_version_tokens(self):
+        user, [recommendation] = create_recommendations(1)
+        offer = recommendation.offer
+
+        key = cache.user_cache_key(user.pk)
+        Preference.objects.create(user=user, price_range='PREMIUM')
+        self.assertNotEqual(cache.user_cache_key(user.pk), key)
+        # Version en base : vider le cache partagé ne la perd pas
+        version = RecommendationVersion.current(user.pk)
+        django_cache.clear()
+        self.assertEqual(cache.user_cache_key(user.pk)[1], version)
+
+        key = cache.cohort_cache_key(('PREMIUM', None))
+        offer.prix_par_personne = Decimal('450.00')
+        offer.save()
+        self.assertNotEqual(cache.cohort_cache_key(('PREMIUM', None)), key)
+
+        key = cache.cohort_cache_key(('PREMIUM', None))
+        FidelityTierConfig.objects.create(
+            tier='GOLD', points_requis_min=5000, points_requis_max=19999,
+            pourcentage_remise=Decimal('10.00'), bonus_multiplier=Decimal('1.50'),
+        )
+        self.assertNotEqual(cache.cohort_cache_key(('PREMIUM', None)), key)
+
+    def test_engine_recomputes_after_catalog_change(self):
+        user, [recommendation] = create_recommendations(1)
+
+        def misses():
+            before = cache.user_recommendations.misses
+            RecommendationEngine(user).generate_recommendations()
+            return cache.user_recommendations.misses - before
+
+        self.assertEqual(misses(), 1)
+        self.assertEqual(misses(), 0)
+        recommendation.offer.save()
+        self.assertEqual(misses(), 1)
+
+
+class StoredRecommendationTests(TestCase):
+    """Recommandations enregistrées servies sans relancer le moteur"""
+
+    def test_stale_after_deactivation_or_catalog_change(self):
+        user, recommendations = create_recommendations(3)
+        RecommendationSnapshot.objects.create(user=user, limit=3, count=3, computed_at=timezone.now())
+        offer = recommendations[0].offer
+        fresh = lambda: Recommendation.objects.fresh_offer_recommendations(user, limit=3)
+        self.assertEqual(len(fresh()), 3)
+
+        # Désactivée sans signal (QuerySet.update) : la liste est incomplète
+        Offre.objects.filter(pk=offer.pk).update(actif=False)
+        self.assertIsNone(fresh())
+        Offre.objects.filter(pk=offer.pk).update(actif=True)
+        self.assertEqual(len(fresh()), 3)
+
+        # Le changement est lu en base, pas dans le cache d'un processus
+        offer.save()
+        django_cache.clear()
+        self.assertIsNone(fresh())
+
+    def test_short_list_is_fresh_only_when_complete(self):
+        user, _ = create_recommendations(3)
+        fresh = lambda limit: Recommendation.objects.fresh_offer_recommendations(user, limit=limit)
+        self.assertIsNone(fresh(10))  # jamais enregistrée par le moteur
+
+        # Trois offres pour une limite de 20 : le moteur n'en a pas trouvé d'autres
+        snapshot = RecommendationSnapshot.objects.create(user=user, limit=20, count=3, computed_at=timezone.now())
+        self.assertEqual(len(fresh(10)), 3)
+        self.assertEqual(len(fresh(2)), 2)
+
+        # Trois offres pour une limite de 3 : il y en a peut-être d'autres
+        snapshot.limit = 3
+        snapshot.save()
+        self.assertEqual(len(fresh(3)), 3)
+        self.assertIsNone(fresh(10))
+
+    def test_views_share_one_stored_list(self):
+        user, _ = create_recommendations(3)
+        Recommendation.objects.filter(user=user).delete()
+        Preference.objects.create(user=user, price_range='STANDARD')
+        client = APIClient()
+        client.force_login(user)
+
+        self.assertEqual(len(client.get('/recommendations/api/my_recommendations/').json()), 3)
+        with mock.patch.object(RecommendationEngine, 'generate_recommendations') as generate:
+            self.assertEqual(client.get('/recommendations/').status_code, 200)
+            self.assertEqual(len(client.get('/recommendations/api/my_recommendations/').json()), 3)
+            self.assertEqual(len(client.get('/recommendations/api/json/').json()['recommendations']), 3)
+        generate.assert_not_called()
+        self.assertEqual(
+            RecommendationSnapshot.objects.filter(user=user).values_list('limit', 'count').get(),
+            (Recommendation.objects.STORED_LIMIT, 3),
+        )
+
+
+class PrecomputeCommandTests(TransactionTestCase):
+    """precompute_recommendations : sélection des utilisateurs et processus de calcul"""
+
+    def setUp(self):
+        User = get_user_model()
+        for i in range(3):
+            Offre.objects.create(
+                titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal('500.00'), image="offres/offre.jpg",
+            )
+        self.users = []
+        for i in range(4):
+            user = User.objects.create_user(email=f"precompute{i}@example.com", password="x")
+            Preference.objects.create(user=user, price_range='STANDARD')
+            self.users.append(user)
+
+    def precompute(self, *args):
+        output = StringIO()
+        call_command('precompute_recommendations', *args, stdout=output)
+        return output.getvalue()
+
+    def test_workers_store_complete_lists(self):
+        output = self.precompute('--workers', '2', '--chunk-size', '1')
+
+        self.assertIn("4 utilisateurs, 4 lots, 2 processus", output)
+        self.assertEqual(
+            dict(RecommendationSnapshot.objects.values_list('user_id', 'count')), {user.pk: 3 for user in self.users}
+        )
+        self.assertEqual(Recommendation.objects.filter(is_active=True).count(), 12)
+        # Trois offres seulement : la liste courte est servie telle quelle
+        for user in get_user_model().objects.filter(pk__in=[user.pk for user in self.users]):
+            self.assertEqual(len(Recommendation.objects.fresh_offer_recommendations(user, limit=10)), 3)
+
+    def test_since_and_max_age_select_users(self):
+        self.precompute()
+        self.assertIn("0 utilisateurs", self.precompute('--max-age', '3600'))
+
+        since = timezone.now()
+        preference = self.users[1].preference
+        preference.price_range = 'PREMIUM'
+        preference.save()
+        self.assertIn("1 utilisateurs", self.precompute('--since', since.isoformat()))
+
+        self.assertIn("4 utilisateurs", self.precompute('--max-age', '0'))
+
+
+def create_evaluation_dataset():
+    """
+    Deux utilisateurs STANDARD et leurs recommandations jugées. L'offre à
+    3000 € est hors budget : sous le seuil 40 de la variante de référence.
+    """
+    User = get_user_model()
+    offers = [
+        Offre.objects.create(
+            titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal(price), image="offres/offre.jpg",
+        )
+        for i, price in enumerate(['1000.00', '3000.00', '1000.00', '1000.00'])
+    ]
+    users = []
+    for i in range(2):
+        user = User.objects.create_user(email=f"evaluation{i}@example.com", password="x")
+        Preference.objects.create(user=user, price_range='STANDARD')
+        users.append(user)
+
+    def recommend(user, offer, feedback=None, rating=None, **outcome):
+        recommendation = Recommendation.objects.create(user=user, offer=offer, match_score=50, **outcome)
+        if feedback:
+            RecommendationFeedback.objects.create(recommendation=recommendation, feedback_type=feedback, rating=rating)
+
+    recommend(users[0], offers[0], is_clicked=True)
+    recommend(users[0], offers[1], is_booked=True)
+    recommend(users[0], offers[2])
+    recommend(users[0], offers[3], feedback='not_relevant', is_clicked=True)
+    recommend(users[1], offers[0], feedback='already_visited', rating=5)
+    recommend(users[1], offers[2], feedback='interested')
+    return users
+
+
+class EvaluationTests(TestCase):
+    """Métriques hors ligne des variantes de poids"""
+
+    VARIANTS = ['reference=0.4,0.3,0.2,0.1', 'tous=0.4,0.3,0.2,0.1,0']
+
+    def test_parse_variant(self):
+        self.assertEqual(
+            evaluation.parse_variant('prix=0.3,0.4,0.2,0.1'),
+            ('prix', scoring.Weights(0.3, 0.4, 0.2, 0.1, scoring.DEFAULT_WEIGHTS.threshold)),
+        )
+        self.assertEqual(evaluation.parse_variant('seuil=0.4,0.3,0.2,0.1,50')[1].threshold, 50)
+        for spec in ['=0.4,0.3,0.2,0.1', 'court=0.4,0.3', 'texte=a,b,c,d']:
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                evaluation.parse_variant(spec)
+
+    def test_is_relevant(self):
+        self.assertTrue(evaluation.is_relevant(True, False, None, None))
+        self.assertTrue(evaluation.is_relevant(False, True, None, None))
+        self.assertTrue(evaluation.is_relevant(False, False, 'interested', None))
+        self.assertTrue(evaluation.is_relevant(False, False, 'already_visited', 4))
+        self.assertFalse(evaluation.is_relevant(False, False, 'already_visited', 3))
+        self.assertFalse(evaluation.is_relevant(True, True, 'not_relevant', 5))
+
+    def test_precision_and_rates(self):
+        create_evaluation_dataset()
+        variants = [evaluation.parse_variant(spec) for spec in self.VARIANTS]
+
+        result = evaluation.evaluate_users(variants, k=2)
+        reference, everything = evaluation.report(result, variants, k=2)
+
+        self.assertEqual(result['rows'], 6)
+        # Premier utilisateur : top 2 = offres 0 et 2, une seule pertinente ;
+        # second utilisateur : ses deux offres sont pertinentes
+        self.assertEqual(reference['precision@2'], 0.75)
+        self.assertEqual(reference['recommended'], 5)
+        self.assertEqual(reference['click_rate'], 2 / 5)
+        self.assertEqual(reference['booking_rate'], 0.0)
+        self.assertEqual(reference['coverage'], 5 / 6)
+
+        # Seuil 0 : l'offre hors budget est gardée mais reste derrière les autres
+        self.assertEqual(everything['precision@2'], 0.75)
+        self.assertEqual(everything['recommended'], 6)
+        self.assertEqual(everything['booking_rate'], 1 / 6)
+        self.assertEqual(everything['coverage'], 1.0)
+
+    def test_user_ranges_merge_to_the_full_evaluation(self):
+        users = create_evaluation_dataset()
+        variants = [evaluation.parse_variant(spec) for spec in self.VARIANTS]
+
+        merged = evaluation.merge([
+            evaluation.evaluate_users(variants, 2, (None, users[1].pk)),
+            evaluation.evaluate_users(variants, 2, (users[1].pk, None)),
+        ])
+
+        self.assertEqual(merged['totals'], evaluation.evaluate_users(variants, 2)['totals'])
+
+
+class EvaluateCommandTests(TransactionTestCase):
+    """evaluate_recommendation_weights répartit les utilisateurs entre processus"""
+
+    def test_workers_report_the_same_metrics(self):
+        create_evaluation_dataset()
+        variants = [evaluation.parse_variant(spec) for spec in EvaluationTests.VARIANTS]
+        expected = evaluation.report(evaluation.evaluate_users(variants, 2), variants, 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'evaluation.json')
+            output = StringIO()
+            call_command(
+                'evaluate_recommendation_weights', '--workers', '2', '--ranges', '2', '--k', '2',
+                *[f'--variant={spec}' for spec in EvaluationTests.VARIANTS], '--output', path, stdout=output,
+            )
+            with open(path, encoding='utf-8') as f:
+                written = json.load(f)
+
+        self.assertIn("6 recommandations, 2 plages, 2 processus", output.getvalue())
+        self.assertEqual(written['rows'], 6)
+        self.assertEqual(written['variants'], expected)
+
+
+def create_catalog(seed, size=80):
+    """
+    Catalogue aléatoire mais reproductible : prix, destinations,
+    hébergements, réservations et pénalités de feedback variés. Retourne un
+    utilisateur STANDARD / GOLD.
+    """
+    rng = random.Random(seed)
+    destinations = [
+        Destination.objects.create(nom_destination=f"Destination {i}", pays="Tunisie", description="-", image="d.jpg")
+        for i in range(6)
+    ]
+    hebergements = [
+        Hebergement.objects.create(
+            nom_hebergement=f"Hébergement {i}", type_hebergement="hotel", destination=rng.choice(destinations),
+            prix_par_nuit=Decimal(rng.randrange(40, 600, 10)), etoiles=rng.randint(2, 5),
+        )
+        for i in range(12)
+    ]
+
+    User = get_user_model()
+    client = User.objects.create_user(email="catalog@example.com", password="x")
+    reservations = []
+    for i in range(size):
+        offer = Offre.objects.create(
+            titre=f"Offre {i}", description="-", image="o.jpg",
+            prix_par_personne=Decimal(rng.randrange(100, 3000, 10)), actif=rng.random() > 0.1,
+        )
+        offer.nom_destinations.set(rng.sample(destinations, rng.randint(0, 2)))
+        offer.hebergements.set(rng.sample(hebergements, rng.randint(0, 2)))
+        reservations.extend(
+            Reservation(client=client, offre=offer, nb_personnes=1, prix_total=offer.prix_par_personne)
+            for _ in range(rng.choice([0, 0, 5, 40, 200]))
+        )
+        if rng.random() < 0.2:
+            OfferFeedbackStats.objects.create(
+                offer=offer, price_range='STANDARD', tier='GOLD', not_relevant=1, adjustment=-rng.randint(1, 20),
+            )
+    Reservation.objects.bulk_create(reservations)
+    OffreStats.refresh(Offre.objects.values_list('pk', flat=True))
+
+    user = User.objects.create_user(email="scored@example.com", password="x")
+    Preference.objects.create(user=user, price_range='STANDARD')
+    LoyaltyProgram.objects.create(user=user, tier='GOLD')
+    return User.objects.get(pk=user.pk)
+
+
+class ScoringPathTests(TestCase):
+    """Les chemins de classement du moteur donnent les mêmes scores que la notation offre par offre"""
+
+    LIMIT = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(seed=7)
+
+    def setUp(self):
+        self.engine = RecommendationEngine(self.user)
+
+    def reference(self):
+        """Classement d'origine : chaque offre active notée par calculate_offer_score"""
+        scored = []
+        for offer in Offre.objects.filter(actif=True):
+            score, reason_codes = self.engine.calculate_offer_score(offer)
+            if score > 40:
+                scored.append((offer.pk, score, reason_codes))
+        scored.sort(key=lambda entry: (-entry[1], entry[0]))
+        return scored[:self.LIMIT]
+
+    def assertSameRanking(self, recommendations, expected):
+        self.assertEqual(
+            [(rec['item'].pk, rec['reason_codes']) for rec in recommendations],
+            [(pk, reason_codes) for pk, _, reason_codes in expected],
+        )
+        for rec, (_, score, _) in zip(recommendations, expected):
+            self.assertAlmostEqual(rec['score'], score, places=9)
+
+    def test_vectorized_path_matches_per_offer_scores(self):
+        expected = self.reference()
+        self.assertEqual(len(expected), self.LIMIT)
+
+        self.assertSameRanking(self.engine._generate_vectorized(self.LIMIT), expected)
+
+    def test_ranking_paths_agree(self):
+        expected = self.reference()
+        paths = {
+            'vectorized': self.engine._generate_vectorized,
+            'two_stage': self.engine._generate_two_stage,
+        }
+        for name, generate in paths.items():
+            with self.subTest(path=name):
+                self.assertSameRanking(generate(self.LIMIT), expected)
+
+    def test_two_stage_pool_smaller_than_catalog_keeps_the_top(self):
+        # Pool > classement + offres pénalisées : le top exact y figure
+        pool_size = self.LIMIT + OfferFeedbackStats.objects.count() + 5
+        self.assertLess(pool_size, Offre.objects.filter(actif=True).count())
+
+        with mock.patch.object(candidates, 'generate', functools.partial(candidates.generate, size=pool_size)):
+            self.assertSameRanking(self.engine._generate_two_stage(self.LIMIT), self.reference())
+
+    def test_tier_table_is_read_once_per_engine(self):
+        with mock.patch.object(tiers, 'get_table', wraps=tiers.get_table) as get_table:
+            engine = RecommendationEngine(self.user)
+            engine._compute_recommendations(self.LIMIT)
+            for offer in Offre.objects.all():
+                engine.calculate_offer_score(offer)
+
+        self.assertEqual(get_table.call_count, 1)
+        self.assertEqual(engine.tier, 'GOLD')
+
+    def test_popularity_counts_bookings(self):
+        # Changement voulu : avant related_name='reservations', les réservations étaient ignorées
+        offer = Offre.objects.create(titre="Populaire", description="-", image="o.jpg", prix_par_personne=Decimal('800'))
+        Reservation.objects.bulk_create(
+            Reservation(client=self.user, offre=offer, nb_personnes=1, prix_total=offer.prix_par_personne)
+            for _ in range(40)
+        )
+
+        self.assertEqual(self.engine._calculate_popularity(offer), 8.0)
+
+
+class SimilarityTests(TestCase):
+    """Index de co-réservation et bonus de similarité du moteur"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [User.objects.create_user(email=f"similar{i}@example.com", password="x") for i in range(3)]
+        self.offers = [
+            Offre.objects.create(
+                titre=f"Offre {i}", description="Séjour", prix_par_personne=Decimal('500.00'), image="offres/offre.jpg",
+            )
+            for i in range(4)
+        ]
+
+    def book(self, user, *offers):
+        return [Reservation.objects.create(client=user, offre=offer, nb_personnes=1) for offer in offers]
+
+    def pairs(self):
+        return {
+            (offer_id, neighbour_id): (co_bookings, round(score, 6))
+            for offer_id, neighbour_id, co_bookings, score in OfferSimilarity.objects.values_list(
+                'offer_id', 'neighbour_id', 'co_bookings', 'score'
+            )
+        }
+
+    def test_bookings_update_pairs_and_rebuild_is_exact(self):
+        a, b, c, _ = self.offers
+        half = round(1 / 2 ** 0.5, 6)
+        self.book(self.users[0], a, b)
+        self.assertEqual(self.pairs(), {(a.pk, b.pk): (1, 1.0), (b.pk, a.pk): (1, 1.0)})
+
+        # Seules les paires de la nouvelle offre sont recalculées : (a, b) garde son ancien score
+        self.book(self.users[1], a, c)
+        self.assertEqual(self.pairs(), {
+            (a.pk, b.pk): (1, 1.0), (b.pk, a.pk): (1, 1.0), (a.pk, c.pk): (1, half), (c.pk, a.pk): (1, half),
+        })
+
+        self.assertEqual(similarity.rebuild(), 4)
+        exact = {(a.pk, b.pk): (1, half), (b.pk, a.pk): (1, half), (a.pk, c.pk): (1, half), (c.pk, a.pk): (1, half)}
+        self.assertEqual(self.pairs(), exact)
+
+        # Dernière réservation du client sur b annulée : ses paires disparaissent
+        Reservation.objects.filter(client=self.users[0], offre=b).delete()
+        self.assertEqual(self.pairs(), {(a.pk, c.pk): (1, half), (c.pk, a.pk): (1, half)})
+
+    def test_similar_offers_keeps_best_score_outside_exclusions(self):
+        a, b, c, d = self.offers
+        self.book(self.users[0], a, b, c)
+        self.book(self.users[1], b, d)
+        similarity.rebuild()
+
+        self.assertEqual(
+            {pk: round(score, 6) for pk, score in similarity.similar_offers({a.pk, d.pk}).items()},
+            {b.pk: round(1 / 2 ** 0.5, 6), c.pk: 1.0},
+        )
+        self.assertEqual(set(similarity.similar_offers({a.pk, d.pk}, exclude={b.pk})), {c.pk})
+        self.assertEqual(similarity.similar_offers({a.pk}, exclude={b.pk, c.pk}), {})
+
+    def test_own_co_bookings_do_not_boost_booked_offers(self):
+        a, b, _, _ = self.offers
+        user = self.users[2]
+        Preference.objects.create(user=user, price_range='STANDARD')
+        self.book(user, a, b)  # seules réservations : les paires (a, b) sont les siennes
+        user = get_user_model().objects.get(pk=user.pk)
+        engine = RecommendationEngine(user)
+
+        recommendations = engine.generate_recommendations(limit=10)
+
+        self.assertEqual(len(recommendations), 4)
+        for rec in recommendations:
+            self.assertFalse(rec['reason_codes'] & reasons.SIMILAR)
+            self.assertAlmostEqual(rec['score'], engine.calculate_offer_score(rec['item'])[0], places=9)
+
+    @override_settings(RECOMMENDATION_SIMILARITY_WEIGHT=0.2)
+    def test_neighbours_of_booked_offers_are_boosted(self):
+        a, b, c, d = self.offers
+        self.book(self.users[0], a, b)
+        self.book(self.users[1], a, c)
+        user = self.users[2]
+        self.book(user, a)
+        similarity.rebuild()
+        engine = RecommendationEngine(user)
+
+        # Sans préférences, aucune offre ne passe le seuil : les voisins sont notés hors du classement du segment
+        self.assertEqual(engine._cohort_recommendations(10), [])
+        recommendations = engine.generate_recommendations(limit=10)
+
+        self.assertEqual({rec['item'].pk for rec in recommendations}, {b.pk, c.pk})
+        for rec in recommendations:
+            self.assertTrue(rec['reason_codes'] & reasons.SIMILAR)
+            expected = engine.calculate_offer_score(rec['item'])[0] + 100 / 3 ** 0.5 * 0.2
+            self.assertAlmostEqual(rec['score'], expected, places=9)
+
+
+class DiversityTests(TestCase):
+    """Ré-ordonnancement MMR du classement d'un segment"""
+
+    @staticmethod
+    def pks(recommendations):
+        return [rec['item'].pk for rec in recommendations]
+
+    def test_offers_from_other_destinations_are_promoted(self):
+        recommendations = [
+            {'item': SimpleNamespace(pk=pk), 'score': score} for pk, score in [(1, 90), (2, 89), (3, 88), (4, 70)]
+        ]
+        destinations = {1: frozenset({10}), 2: frozenset({10}), 3: frozenset({10, 11}), 4: frozenset({20})}
+
+        # 2 : 0,7 × 89 - 0,3 × 100 × 1 = 32,3 ; 3 : 61,6 - 30 × 0,5 = 46,6 ; 4 : 49 - 0 = 49
+        self.assertEqual(self.pks(candidates.diversify(recommendations, destinations, 3, diversity=0.7)), [1, 4, 3])
+        self.assertEqual(self.pks(candidates.diversify(recommendations, destinations, 3, diversity=1)), [1, 2, 3])
+
+    def test_cohort_slice_is_the_diversified_prefix_by_score(self):
+        engine = RecommendationEngine(create_catalog(seed=11))
+        size = max(10, cache.COHORT_SIZE)
+        ranked = engine._compute_recommendations(size)
+        expected = candidates.diversify(ranked, candidates.destination_sets(self.pks(ranked)), 10)
+
+        recommendations = engine._cohort_recommendations(10)
+
+        self.assertEqual(set(self.pks(recommendations)), set(self.pks(expected)))
+        self.assertNotEqual(self.pks(expected), self.pks(ranked[:10]))  # le MMR a changé la sélection ou l'ordre
+        scores = [rec['score'] for rec in recommendations]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class DestinationRankingTests(TestCase):
+    """Classement SQL des destinations"""
+
+    def test_offers_without_stats_count_their_bookings(self):
+        user = get_user_model().objects.create_user(email="ranking@example.com", password="x")
+        destination = Destination.objects.create(
+            nom_destination="Tabarka", pays="Tunisie", description="Côte", image="destinations/tabarka.jpg"
+        )
+        Hebergement.objects.create(
+            nom_hebergement="Corail", type_hebergement="hotel", destination=destination,
+            prix_par_nuit=Decimal('150.00'), etoiles=4,
+        )
+        offer = Offre.objects.create(titre="Corail", description="-", image="o.jpg", prix_par_personne=Decimal('600'))
+        offer.nom_destinations.add(destination)
+        Reservation.objects.bulk_create(
+            Reservation(client=user, offre=offer, nb_personnes=1, prix_total=offer.prix_par_personne)
+            for _ in range(300)
+        )
+        OffreStats.objects.filter(offre=offer).delete()  # pas encore reconstruites
+
+        engine = RecommendationEngine(user)
+        [ranked] = engine.rank_destinations()
+
+        self.assertEqual(ranked.score, 40 + 30)  # 4 étoiles sur 5 × 50, 300 réservations / 10
+        self.assertEqual(engine.calculate_destination_score(destination), ranked.score)
+
+
+class StoredRecommendationWriteTests(TestCase):
+    """Upsert groupé des listes classées"""
+
+    def engine_result(self, offer, score):
+        return {
+            'item': offer, 'score': score, 'reason_codes': reasons.PRICE,
+            'preference_match': score * 0.4, 'price_match': score * 0.3, 'tier_bonus': 0, 'popularity': score * 0.1,
+        }
+
+    def test_rewrite_updates_in_place_and_deactivates_dropped_offers(self):
+        user, stored = create_recommendations(3)
+        Recommendation.objects.filter(user=user).delete()
+        offers = [recommendation.offer for recommendation in stored]
+        instant = timezone.now()
+
+        # Même instant pour les deux écritures : la désactivation ne dépend pas de l'horloge
+        with mock.patch('django.utils.timezone.now', return_value=instant):
+            Recommendation.objects.write_offer_recommendations(
+                [(user, [self.engine_result(offer, 60) for offer in offers])], 10
+            )
+            first = dict(Recommendation.objects.values_list('offer_id', 'pk'))
+            Recommendation.objects.write_offer_recommendations(
+                [(user, [self.engine_result(offers[0], 80), self.engine_result(offers[2], 70)])], 10
+            )
+
+        rows = {row.offer_id: row for row in Recommendation.objects.filter(user=user)}
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({offer_id: row.pk for offer_id, row in rows.items()}, first)
+        self.assertEqual(
+            [(rows[offer.pk].is_active, rows[offer.pk].match_score) for offer in offers],
+            [(True, 80), (False, 60), (True, 70)],
+        )
+
+
+class FeedbackStatsTests(TestCase):
+    """Compteurs de feedback tenus à jour par les signaux"""
+
+    def setUp(self):
+        self.user, [self.recommendation] = create_recommendations(1)
+        Preference.objects.create(user=self.user, price_range='STANDARD')
+        LoyaltyProgram.objects.create(user=self.user, tier='SILVER')
+        self.offer_id = self.recommendation.offer_id
+
+    def counters(self, price_range='STANDARD', tier='SILVER'):
+        row = OfferFeedbackStats.objects.get(offer_id=self.offer_id, price_range=price_range, tier=tier)
+        return [getattr(row, name) for name in OfferFeedbackStats.COUNTERS + ['rating_sum', 'rating_count']]
+
+    def assertStats(self, counters, adjustments):
+        self.assertEqual(self.counters(), counters)
+        self.assertEqual(self.counters(OfferFeedbackStats.ALL, OfferFeedbackStats.ALL), counters)
+        self.assertEqual(OfferFeedbackStats.adjustments(('STANDARD', 'SILVER')), adjustments)
+        # Autre segment, sans ligne propre : le total s'applique
+        self.assertEqual(OfferFeedbackStats.adjustments(('BUDGET', '')), adjustments)
+
+    def test_create_change_and_delete(self):
+        feedback = RecommendationFeedback.objects.create(
+            recommendation=self.recommendation, feedback_type='not_relevant', rating=2
+        )
+        # 1 feedback négatif sur 1 : -30 × 1 / (1 + 5)
+        self.assertStats([0, 1, 0, 0, 2, 1], {self.offer_id: -5.0})
+
+        feedback.feedback_type = 'relevant'
+        feedback.rating = 5
+        feedback.save()
+        self.assertStats([1, 0, 0, 0, 5, 1], {})
+
+        feedback.feedback_type = 'already_visited'
+        feedback.rating = None
+        feedback.save()
+        self.assertStats([0, 0, 1, 0, 0, 0], {self.offer_id: -5.0})
+
+        feedback.delete()
+        self.assertStats([0, 0, 0, 0, 0, 0], {})
+
+
+    def test_segment_uses_the_engine_tier(self):
+        # Tier enregistré absent de la configuration : le moteur le résout par les points
+        FidelityTierConfig.objects.create(
+            tier='GOLD', points_requis_min=5000, points_requis_max=19999,
+            pourcentage_remise=Decimal('10.00'), bonus_multiplier=Decimal('1.50'),
+        )
+        tiers.invalidate()  # on_commit ne s'exécute pas dans un TestCase
+        self.addCleanup(tiers.invalidate)
+        LoyaltyProgram.objects.filter(user=self.user).update(totalEarnedPoints=6000)
+        user = get_user_model().objects.get(pk=self.user.pk)
+
+        RecommendationFeedback.objects.create(recommendation=self.recommendation, feedback_type='not_relevant')
+
+        self.assertEqual(RecommendationEngine(user).cohort, ('STANDARD', 'GOLD'))
+        self.assertEqual(self.counters(tier='GOLD'), [0, 1, 0, 0, 0, 0])
+        self.assertFalse(OfferFeedbackStats.objects.filter(tier='SILVER').exists())
+
+class SqlParityTests(TestCase):
+    """Les expressions SQL de scoring.py reprennent les formules Python du moteur"""
+
+    PRICE_RANGES = [None, 'BUDGET', 'STANDARD', 'PREMIUM']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_catalog(seed=11)
+
+    def engine(self, price_range):
+        engine = RecommendationEngine(self.user)
+        engine.preferences = SimpleNamespace(price_range=price_range) if price_range else None
+        return engine
+
+    def test_offer_expressions_match_python_scores(self):
+        for price_range in self.PRICE_RANGES:
+            engine = self.engine(price_range)
+            offers = scoring.with_scoring_inputs(Offre.objects.all()).annotate(
+                price_score=scoring.price_score_expression(
+                    'prix_par_personne', price_range, scoring.OFFER_PRICE_BANDS, scoring.DEFAULT_OFFER_PRICE_BAND, 10
+                ),
+                popularity=scoring.popularity_expression(),
+            )
+            for offer in offers:
+                with self.subTest(price_range=price_range, offer=offer.pk):
+                    self.assertAlmostEqual(offer.price_score, engine._calculate_price_score(offer), places=9)
+                    self.assertAlmostEqual(offer.popularity, engine._calculate_popularity(offer), places=9)
+
+    def test_hebergement_price_expression_matches_python_score(self):
+        for price_range in self.PRICE_RANGES:
+            engine = self.engine(price_range)
+            hebergements = Hebergement.objects.annotate(price_score=scoring.price_score_expression(
+                'prix_par_nuit', price_range, scoring.HEBERGEMENT_PRICE_BANDS, scoring.DEFAULT_HEBERGEMENT_PRICE_BAND, 2
+            ))
+            for hebergement in hebergements:
+                with self.subTest(price_range=price_range, hebergement=hebergement.pk):
+                    self.assertAlmostEqual(
+                        hebergement.price_score, engine._calculate_accommodation_price_score(hebergement), places=9
+                    )
+
+    def test_rankings_match_per_item_scores(self):
+        for price_range in self.PRICE_RANGES:
+            engine = self.engine(price_range)
+            with self.subTest(price_range=price_range):
+                expected = sorted(
+                    (-engine.calculate_destination_score(destination), destination.pk)
+                    for destination in Destination.objects.all()
+                )
+                ranked = engine.rank_destinations(limit=100, threshold=-1)
+                self.assertEqual([destination.pk for destination in ranked], [pk for _, pk in expected])
+                for destination, (score, _) in zip(ranked, expected):
+                    self.assertAlmostEqual(destination.score, -score, places=9)
+
+                expected = sorted(
+                    (-engine.calculate_hebergement_score(hebergement), hebergement.pk)
+                    for hebergement in Hebergement.objects.all()
+                )
+                ranked = engine.rank_hebergements(limit=100, threshold=-1)
+                self.assertEqual([hebergement.pk for hebergement in ranked], [pk for _, pk in expected])
+                for hebergement, (score, _) in zip(ranked, expected):
+                    self.assertAlmostEqual(hebergement.score, -score, places=9)
+
+
+class RetentionTests(TestCase):
+    """prune_recommendations : désactivation puis archivage par lots"""
+
+    def test_prune_deactivates_then_archives_only_unseen_old_rows(self):
+        _, rows = create_recommendations(10)
+        now = timezone.now()
+        old, stale, inactive_offer, recent, viewed, with_feedback, young = rows[:3], *rows[3:9]
+        days_ago = lambda days: now - timedelta(days=days)
+
+        Recommendation.objects.filter(pk__in=[row.pk for row in old]).update(is_active=False, updated_at=days_ago(40))
+        Recommendation.objects.filter(pk=stale.pk).update(updated_at=days_ago(10))
+        Offre.objects.filter(pk=inactive_offer.offer_id).update(actif=False)
+        Recommendation.objects.filter(pk=viewed.pk).update(is_active=False, is_viewed=True, updated_at=days_ago(40))
+        RecommendationFeedback.objects.create(recommendation=with_feedback, feedback_type='relevant')
+        Recommendation.objects.filter(pk=with_feedback.pk).update(is_active=False, updated_at=days_ago(40))
+        Recommendation.objects.filter(pk=young.pk).update(is_active=False, updated_at=days_ago(5))
+
+        call_command('prune_recommendations', '--batch-size', '2', stdout=StringIO())
+
+        remaining = dict(Recommendation.objects.values_list('pk', 'is_active'))
+        self.assertEqual(remaining, {
+            stale.pk: False, inactive_offer.pk: False, recent.pk: True,
+            viewed.pk: False, with_feedback.pk: False, young.pk: False, rows[9].pk: True,
+        })
+        archives = list(RecommendationArchive.objects.order_by('first_id'))
+        self.assertEqual([archive.row_count for archive in archives], [2, 1])
+        self.assertEqual(
+            [row['id'] for archive in archives for row in archive.rows()], [row.pk for row in old]
+        )
+
+
+class BenchmarkSmokeTests(TestCase):
+    """Le banc d'essai tourne de bout en bout sur un petit catalogue"""
+
+    def test_generate_catalog_and_run_benchmarks(self):
+        volumes = benchmark.generate_catalog(
+            offers=30, destinations=4, hebergements=10, users=3, reservations=40, seed=7,
+        )
+        self.assertEqual(
+            volumes, {'offers': 30, 'destinations': 4, 'hebergements': 10, 'users': 3, 'reservations': 40}
+        )
+        self.assertEqual(OffreStats.objects.count(), 30)
+
+        # Sans thread de vidage : les clics de api.track restent dans le tampon
+        with mock.patch.object(tracking.buffer, 'flush_interval', 0):
+            results = benchmark.run_benchmarks(users=2, repeat=1)
+
+        names = set(benchmark.entry_points(None))
+        self.assertEqual({row['entry_point'] for row in results}, names)
+        self.assertEqual(len(results), 2 * len(names))
+        for row in results:
+            self.assertEqual(row['runs'], 1)
+            self.assertGreaterEqual(row['wall_ms']['median'], 0)
+
+        tracking.buffer.flush()
+        self.assertTrue(Recommendation.objects.filter(is_clicked=True).exists())
@@ -0,0 +1,136 @@
+"""Suivi des recommandations (vue, clic, réservation) en écriture différée.
+
+Chaque worker accumule les événements en mémoire et les écrit par lots :
+une requête UPDATE par type d'événement, qui ne touche que les colonnes
+de suivi concernées. Seul le premier événement d'un type est retenu,
+comme pour le marquage « vue » d'origine.
+
+Le tampon est vidé dès qu'il atteint max_events, et au plus tard
+flush_interval secondes après un événement par un thread d'arrière-plan
+(démarré au premier événement du processus, donc après un fork) : un
+worker inactif ne garde pas ses événements. La sortie du processus vide
+aussi le tampon ; un arrêt brutal (SIGKILL) perd au plus les événements
+des flush_interval dernières secondes. write() écrit sans passer par le
+tampon.
+"""
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import Recommendation
+
+logger = logging.getLogger(__name__)
+
+EVENT_FIELDS = {
+    'view': ('is_viewed', 'viewed_at'),
+    'click': ('is_clicked', 'clicked_at'),
+    'book': ('is_booked', 'booked_at'),
+}
+
+
+def write(event, stamps):
+    """Écrit des événements [(recommandation, date), ...] d'un type, retourne le nombre de lignes modifiées"""
+    flag, stamp_field = EVENT_FIELDS[event]
+    return Recommendation.objects.filter(
+        pk__in=[pk for pk, _ in stamps], **{flag: False}
+    ).update(**{
+        flag: True,
+        stamp_field: Case(
+            *[When(pk=pk, then=Value(when)) for pk, when in stamps],
+            output_field=DateTimeField(),
+        ),
+    })
+
+
+class TrackingBuffer:
+    """Tampon d'événements de suivi, vidé par lots"""
+
+    def __init__(self, max_events, flush_interval, batch_size=500):
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def record(self, event, recommendation_ids, when=None):
+        """Ajoute un événement pour chaque recommandation donnée"""
+        if event not in EVENT_FIELDS:
+            raise ValueError(f"Événement inconnu : {event}")
+
+        when = when or timezone.now()
+        with self._lock:
+            for recommendation_id in recommendation_ids:
+                self._pending.setdefault((event, recommendation_id), when)
+            full = len(self._pending) >= self.max_events
+
+        if full:
+            self.flush()
+        elif self.flush_interval:
+            self._start()
+
+    def flush(self):
+        """Écrit les événements en attente, retourne le nombre de lignes modifiées"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        updated = 0
+        for event in EVENT_FIELDS:
+            stamps = [(pk, when) for (name, pk), when in pending.items() if name == event]
+            for start in range(0, len(stamps), self.batch_size):
+                batch = stamps[start:start + self.batch_size]
+                try:
+                    updated += write(event, batch)
+                except Exception as e:
+                    # Le suivi est au mieux : un lot en échec ne doit pas casser la requête
+                    logger.error(f"Error flushing {len(batch)} '{event}' tracking events: {str(e)}")
+
+        return updated
+
+    def close(self):
+        """Arrête le thread d'arrière-plan et écrit les événements en attente"""
+        thread = self._thread
+        self._thread = None
+        self._wakeup.set()
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval)
+        return self.flush()
+
+    def _start(self):
+        # Un thread par processus : celui du parent n'existe plus après un fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._wakeup.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='recommendation-tracking', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        thread = threading.current_thread()
+        while self._thread is thread:
+            self._wakeup.wait(self.flush_interval)
+            if self._pending:
+                try:
+                    self.flush()
+                finally:
+                    # Comme en fin de requête : pas de connexion gardée ouverte entre deux lots
+                    connection.close()
+
+
+buffer = TrackingBuffer(
+    max_events=getattr(settings, 'RECOMMENDATION_TRACKING_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'RECOMMENDATION_TRACKING_FLUSH_INTERVAL', 5),
+)
+
+atexit.register(buffer.close)
@@ -1,20 +1,33 @@
+import json
+
+import numpy as np
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.db.models import Q, Avg, Count, DecimalField
-from django.db.models.functions import Cast
+from django.http import HttpResponse, JsonResponse
+from django.db.models import Q, Avg, Count, Sum, DecimalField, BooleanField, FloatField, Case, When, Value, F, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Least
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 
-from .models import Recommendation, RecommendationFeedback
-from offreDestination.models import Offre, Destination, Hebergement
+from .models import OfferFeedbackStats, Recommendation, RecommendationFeedback
+from offreDestination.models import Offre, Destination, Hebergement, OffreStats
 from preferences.models import Preference, PriceRange
+from programmeFidilite import tiers
 from programmeFidilite.models import LoyaltyProgram
-from .serializers import RecommendationSerializer, RecommendationFeedbackSerializer
+from reservation.models import Reservation
+from .serializers import RecommendationSerializer, RecommendationFeedbackSerializer, RecommendationValuesSerializer
+from . import cache, candidates, reasons, scoring, similarity, tracking
+from .scoring import (
+    OFFER_PRICE_BANDS, DEFAULT_OFFER_PRICE_BAND,
+    HEBERGEMENT_PRICE_BANDS, DEFAULT_HEBERGEMENT_PRICE_BAND,
+    TIER_BONUSES, DEFAULT_TIER_BONUS,
+)
 
 
 class RecommendationEngine:
@@ -24,11 +37,13 @@ class RecommendationEngine:
         self.user = user
         self.preferences = getattr(user, 'preference', None)
         self.loyalty = getattr(user, 'loyalty_program', None)
+        # Tier de fidélité (None sans programme), résolu une fois : le scoring le lit pour chaque offre
+        self.tier = tiers.effective_tier(self.loyalty.tier, self.loyalty.totalEarnedPoints) if self.loyalty else None
+        self._adjustments = None
     
     def calculate_offer_score(self, offer):
         """Calcule le score de correspondance pour une offre"""
         score = 0.0
-        reasons = []
         
         # 1. Score de préférences (40%)
         preference_score = self._calculate_preference_score(offer)
@@ -46,7 +61,10 @@ class RecommendationEngine:
         popularity = self._calculate_popularity(offer)
         score += popularity * 0.1
         
-        return min(score, 100), self._generate_reason(offer, preference_score, price_score, tier_bonus)
+        # 5. Pénalité de feedback du segment (négative ou nulle)
+        score = max(min(score, 100) + self._feedback_adjustment(offer), 0)
+        
+        return score, self._generate_reason(offer, preference_score, price_score, tier_bonus)
     
     def calculate_destination_score(self, destination):
         """Calcule le score pour une destination"""
@@ -59,14 +77,47 @@ class RecommendationEngine:
             # Score basé sur les étoiles
             score += (avg_stars / 5) * 50
         
-        # Popularité
-        avg_reservations = hebergements.aggregate(
-            Count('reservations')
-        )['reservations__count'] or 0
+        # Popularité : réservations des offres de la destination
+        avg_reservations = self._with_scoring_inputs(
+            Offre.objects.filter(nom_destinations=destination)
+        ).aggregate(Sum('reservation_count'))['reservation_count__sum'] or 0
         score += min(avg_reservations / 10, 50)
         
         return min(score, 100)
     
+    def rank_destinations(self, limit=10, threshold=40):
+        """
+        Destinations classées en une seule requête, annotées de leur score
+        (même formule que calculate_destination_score)
+        """
+        avg_stars = Subquery(
+            Hebergement.objects.filter(destination=OuterRef('pk')).order_by()
+            .values('destination').annotate(avg=Avg('etoiles')).values('avg'),
+            output_field=FloatField()
+        )
+        # Réservations lues dans OffreStats, calculées à la volée pour une offre sans statistiques
+        bookings = Coalesce('stats__reservation_count', OffreStats.live_annotations()['reservation_count'])
+        reservations = Subquery(
+            Offre.objects.filter(nom_destinations=OuterRef('pk')).order_by().annotate(bookings=bookings)
+            .values('nom_destinations').annotate(total=Sum('bookings')).values('total'),
+            output_field=FloatField()
+        )
+        
+        stars_score = Case(
+            When(avg_stars__isnull=True, then=Value(0.0)),
+            When(avg_stars=0, then=Value(3 / 5 * 50)),
+            default=F('avg_stars') / Value(5.0) * Value(50.0),
+            output_field=FloatField(),
+        )
+        popularity = Least(Coalesce(F('reservations'), Value(0.0)) / Value(10.0), Value(50.0))
+        
+        return Destination.objects.annotate(
+            avg_stars=avg_stars,
+            reservations=reservations,
+        ).annotate(
+            score=Least(stars_score + popularity, Value(100.0)),
+        ).filter(score__gt=threshold).order_by('-score', 'pk')[:limit]
+    
     def calculate_hebergement_score(self, hebergement):
         """Calcule le score pour un hébergement"""
         score = 0.0
@@ -85,6 +136,35 @@ class RecommendationEngine:
         
         return min(score, 100)
     
+    def rank_hebergements(self, limit=10, threshold=40):
+        """
+        Hébergements classés côté base (même formule que
+        calculate_hebergement_score), chacun annoté de son score
+        """
+        price_range = self.preferences.price_range if self.preferences else None
+        
+        stars_score = Cast('etoiles', FloatField()) / Value(5.0) * Value(100.0)
+        price_score = scoring.price_score_expression(
+            'prix_par_nuit', price_range, HEBERGEMENT_PRICE_BANDS, DEFAULT_HEBERGEMENT_PRICE_BAND, 2
+        )
+        tier_bonus = Value(self._calculate_tier_bonus() * 0.2)
+        
+        # Le classement ne lit que etoiles et prix_par_nuit (index couvrant),
+        # les lignes complètes ne sont chargées que pour le résultat
+        ranked = list(
+            Hebergement.objects.annotate(
+                score=Least(stars_score * Value(0.5) + price_score * Value(0.3) + tier_bonus, Value(100.0)),
+            ).filter(score__gt=threshold).order_by('-score', 'pk').values_list('pk', 'score')[:limit]
+        )
+        hebergements = Hebergement.objects.in_bulk([pk for pk, _ in ranked])
+        
+        result = []
+        for pk, score in ranked:
+            hebergement = hebergements[pk]
+            hebergement.score = score
+            result.append(hebergement)
+        return result
+    
     def _calculate_preference_score(self, offer):
         """Score basé sur les préférences utilisateur"""
         if not self.preferences:
@@ -93,8 +173,7 @@ class RecommendationEngine:
         score = 50.0
         
         # Destinations préférées
-        destinations = offer.nom_destinations.all()
-        if destinations.exists():
+        if self._destination_count(offer):
             # Bonus si dans les destinations de l'offre
             score += 25
         
@@ -107,16 +186,9 @@ class RecommendationEngine:
         
         price = float(offer.prix_par_personne)
         
-        # Plages de prix définies
-        price_ranges = {
-            PriceRange.BUDGET: (0, 500),
-            PriceRange.STANDARD: (500, 1500),
-            PriceRange.PREMIUM: (1500, 10000),
-        }
-        
-        min_price, max_price = price_ranges.get(
+        min_price, max_price = OFFER_PRICE_BANDS.get(
             self.preferences.price_range,
-            (0, 10000)
+            DEFAULT_OFFER_PRICE_BAND
         )
         
         # Score basé sur la plage de prix
@@ -134,15 +206,9 @@ class RecommendationEngine:
         
         price = float(hebergement.prix_par_nuit)
         
-        price_ranges = {
-            PriceRange.BUDGET: (0, 100),
-            PriceRange.STANDARD: (100, 300),
-            PriceRange.PREMIUM: (300, 1000),
-        }
-        
-        min_price, max_price = price_ranges.get(
+        min_price, max_price = HEBERGEMENT_PRICE_BANDS.get(
             self.preferences.price_range,
-            (0, 1000)
+            DEFAULT_HEBERGEMENT_PRICE_BAND
         )
         
         if min_price <= price <= max_price:
@@ -154,104 +220,230 @@ class RecommendationEngine:
     
     def _calculate_tier_bonus(self):
         """Bonus basé sur le tier de fidélité"""
-        if not self.loyalty or not self.loyalty.tier:
-            return 0
-        
-        tier_bonuses = {
-            'BRONZE': 5,
-            'SILVER': 15,
-            'GOLD': 25,
-            'PLATINUM': 35,
-        }
-        
-        return tier_bonuses.get(self.loyalty.tier, 5)
+        return scoring.tier_bonus(self.tier)
     
     def _calculate_popularity(self, offer):
         """Calcule la popularité d'une offre"""
-        # Basé sur le nombre de réservations
-        reservation_count = offer.reservations.count() if hasattr(offer, 'reservations') else 0
-        rating = min(reservation_count / 5, 100)
+        # Basé sur le nombre de réservations (ignorées avant related_name='reservations' :
+        # changement de score voulu)
+        rating = min(self._reservation_count(offer) / 5, 100)
         
         # Bonus si l'offre a des hébergements 5 étoiles
-        hebergements = offer.hebergements.all()
-        if hebergements.filter(etoiles=5).exists():
+        if self._has_five_star(offer):
             rating += 20
         
         return min(rating, 100)
     
+    def feedback_adjustments(self):
+        """Pénalités de feedback {offre: points} du segment, lues une fois par moteur"""
+        if self._adjustments is None:
+            price_range, tier = self.cohort
+            self._adjustments = OfferFeedbackStats.adjustments((price_range or '', tier or ''))
+        return self._adjustments
+    
+    def _feedback_adjustment(self, offer):
+        return self.feedback_adjustments().get(offer.pk, 0.0)
+    
     def _generate_reason(self, offer, pref_score, price_score, tier_bonus):
-        """Génère une raison pour la recommandation"""
-        reasons = []
+        """Codes de raison de la recommandation (voir reasons.py)"""
+        codes = 0
         
         if pref_score > 70:
-            reasons.append("Correspond à vos préférences")
+            codes |= reasons.PREFERENCES
         
         if price_score > 80:
-            reasons.append("Prix avantageux pour votre gamme")
+            codes |= reasons.PRICE
         
         if tier_bonus > 0:
-            reasons.append(f"Avantage spécial {self.loyalty.tier if self.loyalty else 'Bronze'}")
+            codes |= reasons.tier_code(self.tier)
         
         # Bonus hébergement 5 étoiles
-        hebergements = offer.hebergements.all()
-        if hebergements.filter(etoiles=5).exists():
-            reasons.append("Hébergement 5 étoiles disponible")
+        if self._has_five_star(offer):
+            codes |= reasons.FIVE_STAR
         
-        return " • ".join(reasons) if reasons else "Recommandé pour vous"
+        return codes
+    
+    # Les offres annotées par _with_scoring_inputs portent déjà leurs compteurs ;
+    # les autres sont interrogées une par une comme avant.
+    
+    def _destination_count(self, offer):
+        count = getattr(offer, 'destination_count', None)
+        if count is None:
+            count = offer.nom_destinations.count()
+        return count
+    
+    def _reservation_count(self, offer):
+        count = getattr(offer, 'reservation_count', None)
+        if count is None:
+            count = offer.reservations.count()
+        return count
+    
+    def _has_five_star(self, offer):
+        has_five_star = getattr(offer, 'has_five_star', None)
+        if has_five_star is None:
+            has_five_star = offer.hebergements.filter(etoiles=5).exists()
+        return has_five_star
+    
+    def _with_scoring_inputs(self, offers):
+        return scoring.with_scoring_inputs(offers)
     
     def generate_recommendations(self, limit=10):
-        """Génère les recommandations"""
+        """Génère les recommandations (servies depuis le cache si les entrées
+        n'ont pas changé depuis le dernier calcul)"""
+        if not self.user.is_authenticated:
+            return self._cohort_recommendations(limit)
+        
+        key = cache.user_cache_key(self.user.pk, limit, self.cohort)
+        recommendations = cache.user_recommendations.get(key)
+        if recommendations is None:
+            recommendations = self._blend_similar(limit)
+            cache.user_recommendations.set(key, recommendations)
+        
+        return list(recommendations)
+    
+    @property
+    def cohort(self):
+        """Segment de l'utilisateur : seules entrées du score qui dépendent de lui"""
+        return (
+            self.preferences.price_range if self.preferences else None,
+            self.tier,
+        )
+    
+    def _cohort_recommendations(self, limit):
+        """Classement partagé par tous les utilisateurs du même segment"""
+        size = max(limit, cache.COHORT_SIZE)
+        key = cache.cohort_cache_key(self.cohort, size)
+        ranked = cache.cohort_recommendations.get(key)
+        if ranked is None:
+            # Gardé dans l'ordre MMR : tout préfixe est une sélection diversifiée
+            ranked = self._compute_recommendations(size)
+            ranked = candidates.diversify(
+                ranked, candidates.destination_sets([rec['item'].pk for rec in ranked])
+            )
+            cache.cohort_recommendations.set(key, ranked)
+        
+        return self._by_score(ranked[:limit])
+    
+    @staticmethod
+    def _by_score(recommendations):
+        """Affichage (et stockage) par score décroissant"""
+        return sorted(recommendations, key=lambda rec: -rec['score'])
+    
+    def _blend_similar(self, limit):
+        """
+        Ajoute au classement du segment un bonus de co-réservation : les offres
+        proches de celles que l'utilisateur a réservées (voir similarity.py)
+        gagnent jusqu'à RECOMMENDATION_SIMILARITY_WEIGHT × 100 points.
+        
+        Les offres déjà réservées sont écartées des voisins et du classement :
+        les paires qu'elles forment entre elles viennent des co-réservations
+        de l'utilisateur lui-même.
+        """
+        weight = getattr(settings, 'RECOMMENDATION_SIMILARITY_WEIGHT', 0)
+        booked = set()
+        if weight:
+            booked = set(Reservation.objects.filter(client=self.user).values_list('offre_id', flat=True))
+        similar = similarity.similar_offers(booked, exclude=booked) if booked else {}
+        if not similar:
+            return self._cohort_recommendations(limit)
+        
+        pool = {
+            rec['item'].pk: dict(rec)
+            for rec in self._cohort_recommendations(max(limit, cache.COHORT_SIZE))
+            if rec['item'].pk not in booked
+        }
+        
+        # Voisins absents du classement du segment : notés ensemble, en une passe NumPy
+        missing = [pk for pk in similar if pk not in pool]
+        if missing:
+            neighbours = self._score_catalog(Offre.objects.filter(pk__in=missing, actif=True), len(missing), None)
+            pool.update((rec['item'].pk, rec) for rec in neighbours)
+        
+        for pk, rec in pool.items():
+            rec['similarity'] = similar.get(pk, 0.0) * 100
+            if rec['similarity'] > 0:
+                rec['score'] = min(rec['score'] + rec['similarity'] * weight, 100)
+                rec['reason_codes'] |= reasons.SIMILAR
+        
+        ranked = self._by_score(rec for rec in pool.values() if rec['score'] > 40)
+        return self._by_score(candidates.diversify(ranked, candidates.destination_sets(pool), limit))
+    
+    def _compute_recommendations(self, limit):
+        if candidates.POOL_SIZE:
+            return self._generate_two_stage(limit)
+        return self._generate_vectorized(limit)
+    
+    def _generate_two_stage(self, limit):
+        """
+        Note en une passe NumPy les seules candidates retenues par
+        candidates.generate (quelques centaines d'offres au plus)
+        """
+        pool = candidates.generate(
+            self.preferences.price_range if self.preferences else None,
+            self.preferences is not None,
+        )
+        return self._score_catalog(Offre.objects.filter(pk__in=pool), limit)
+    
+    def _generate_vectorized(self, limit):
+        """Même résultat que generate_recommendations, calculé en une passe NumPy"""
+        return self._score_catalog(Offre.objects.filter(actif=True), limit)
+    
+    def _score_catalog(self, offers, limit, threshold=40):
+        """
+        Note des offres en une passe NumPy (mêmes scores que
+        calculate_offer_score) et retourne les limit meilleures au-dessus du
+        seuil (toutes, sans seuil, si threshold vaut None)
+        """
+        catalog = scoring.OfferCatalog.from_queryset(self._with_scoring_inputs(offers).order_by('pk'))
+        price_range = self.preferences.price_range if self.preferences else None
+        tier_bonus = self._calculate_tier_bonus()
+        
+        scores, preference, price, popularity = catalog.score(price_range, tier_bonus)
+        scores = np.maximum(scores + catalog.adjustments(self.feedback_adjustments()), 0)
+        top = catalog.top_k(scores, limit, threshold=-1 if threshold is None else threshold)
+        
+        offers = Offre.objects.in_bulk(catalog.ids[top].tolist())
         recommendations = []
+        for i in top:
+            offer = offers[int(catalog.ids[i])]
+            offer.destination_count = int(catalog.destination_counts[i])
+            offer.reservation_count = int(catalog.reservation_counts[i])
+            offer.has_five_star = bool(catalog.has_five_star[i])
+            
+            score = float(scores[i])
+            recommendations.append({
+                'type': 'offer',
+                'item': offer,
+                'score': score,
+                'reason_codes': self._generate_reason(offer, preference[i], price[i], tier_bonus),
+                'preference_match': score * 0.4,
+                'price_match': score * 0.3,
+                'tier_bonus': tier_bonus,
+                'popularity': score * 0.1,
+            })
         
-        # Récupérer les offres actives
-        offers = Offre.objects.filter(actif=True)
-        
-        for offer in offers:
-            score, reason = self.calculate_offer_score(offer)
-            if score > 40:  # Seuil minimum
-                recommendations.append({
-                    'type': 'offer',
-                    'item': offer,
-                    'score': score,
-                    'reason': reason,
-                    'preference_match': score * 0.4,
-                    'price_match': score * 0.3,
-                    'tier_bonus': self._calculate_tier_bonus(),
-                    'popularity': score * 0.1,
-                })
-        
-        # Trier par score
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        
-        return recommendations[:limit]
+        return recommendations
 
 
 @login_required
 @require_http_methods(["GET"])
 def get_recommendations(request):
     """Récupère les recommandations pour l'utilisateur"""
-    engine = RecommendationEngine(request.user)
-    recommendations = engine.generate_recommendations(limit=10)
-    
-    # Sauvegarder les recommandations
-    for rec in recommendations:
-        Recommendation.objects.update_or_create(
-            user=request.user,
-            offer=rec['item'],
-            recommendation_type='offer',
-            defaults={
-                'match_score': rec['score'],
-                'reason': rec['reason'],
-                'preference_match': rec['preference_match'],
-                'price_match': rec['price_match'],
-                'tier_bonus': rec['tier_bonus'],
-                'popularity_score': rec['popularity'],
-                'is_active': True,
-            }
-        )
+    stored = Recommendation.objects.fresh_offer_recommendations(request.user, limit=10)
+    
+    if stored is not None:
+        recommendations = [rec.as_engine_result() for rec in stored]
+    else:
+        # Liste enregistrée complète (même taille pour toutes les vues), dont on affiche le début
+        stored_limit = Recommendation.objects.STORED_LIMIT
+        recommendations = RecommendationEngine(request.user).generate_recommendations(limit=stored_limit)
+        Recommendation.objects.save_offer_recommendations(request.user, recommendations, stored_limit)
+        recommendations = recommendations[:10]
     
     context = {
-        'recommendations': recommendations,
+        'recommendations': [
+            dict(rec, reason=reasons.render(rec['reason_codes'])) for rec in recommendations
+        ],
         'user': request.user,
     }
     
@@ -268,11 +460,11 @@ def recommendation_detail(request, recommendation_id):
         user=request.user
     )
     
-    # Marquer comme vue
+    # Marquer comme vue (écriture différée)
     if not recommendation.is_viewed:
         recommendation.is_viewed = True
         recommendation.viewed_at = timezone.now()
-        recommendation.save()
+        tracking.buffer.record('view', [recommendation.id], when=recommendation.viewed_at)
     
     context = {
         'recommendation': recommendation,
@@ -289,31 +481,25 @@ class RecommendationViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def my_recommendations(self, request):
-        """Mes recommandations personnalisées"""
-        engine = RecommendationEngine(request.user)
-        recommendations = engine.generate_recommendations(limit=20)
-        
-        # Sauvegarder
-        for rec in recommendations:
-            Recommendation.objects.update_or_create(
-                user=request.user,
-                offer=rec['item'],
-                recommendation_type='offer',
-                defaults={
-                    'match_score': rec['score'],
-                    'reason': rec['reason'],
-                    'preference_match': rec['preference_match'],
-                    'price_match': rec['price_match'],
-                    'tier_bonus': rec['tier_bonus'],
-                    'popularity_score': rec['popularity'],
-                }
+        """Mes recommandations personnalisées (?lean=1 : sérialisation sans instancier de modèles)"""
+        if request.query_params.get('lean') in ('1', 'true'):
+            rows = Recommendation.objects.fresh_offer_recommendations(
+                request.user, limit=20, values=RecommendationValuesSerializer.lookups()
             )
+            if rows is not None:
+                return Response(RecommendationValuesSerializer(rows).data)
+            recs = None
+        else:
+            recs = Recommendation.objects.fresh_offer_recommendations(request.user, limit=20)
         
-        # Récupérer depuis BD
-        recs = Recommendation.objects.filter(
-            user=request.user,
-            is_active=True
-        )[:20]
+        if recs is None:
+            stored_limit = Recommendation.objects.STORED_LIMIT
+            recommendations = RecommendationEngine(request.user).generate_recommendations(limit=stored_limit)
+            
+            # Sauvegarder (les lignes écrites sont renvoyées telles quelles)
+            recs = Recommendation.objects.save_offer_recommendations(
+                request.user, recommendations, stored_limit
+            )[:20]
         
         serializer = RecommendationSerializer(recs, many=True)
         return Response(serializer.data)
@@ -323,25 +509,14 @@ class RecommendationViewSet(viewsets.ViewSet):
         """Top destinations recommandées"""
         engine = RecommendationEngine(request.user)
         
-        destinations = []
-        for dest in Destination.objects.all():
-            score = engine.calculate_destination_score(dest)
-            if score > 40:
-                destinations.append({
-                    'destination': dest,
-                    'score': score,
-                })
-        
-        destinations.sort(key=lambda x: x['score'], reverse=True)
-        
         return Response([
             {
-                'id': d['destination'].id,
-                'nom': d['destination'].nom_destination,
-                'pays': d['destination'].pays,
-                'score': d['score'],
+                'id': destination.id,
+                'nom': destination.nom_destination,
+                'pays': destination.pays,
+                'score': destination.score,
             }
-            for d in destinations[:10]
+            for destination in engine.rank_destinations(limit=10)
         ])
     
     @action(detail=False, methods=['get'])
@@ -349,27 +524,39 @@ class RecommendationViewSet(viewsets.ViewSet):
         """Meilleurs hébergements recommandés"""
         engine = RecommendationEngine(request.user)
         
-        accommodations = []
-        for hebergement in Hebergement.objects.all():
-            score = engine.calculate_hebergement_score(hebergement)
-            if score > 40:
-                accommodations.append({
-                    'hebergement': hebergement,
-                    'score': score,
-                })
-        
-        accommodations.sort(key=lambda x: x['score'], reverse=True)
+        return Response([
+            {
+                'id': hebergement.id,
+                'nom': hebergement.nom_hebergement,
+                'type': hebergement.type_hebergement,
+                'etoiles': hebergement.etoiles,
+                'prix_par_nuit': float(hebergement.prix_par_nuit),
+                'score': hebergement.score,
+            }
+            for hebergement in engine.rank_hebergements(limit=10)
+        ])
+    
+    @action(detail=False, methods=['get'])
+    def also_booked(self, request):
+        """Offres souvent réservées avec une offre donnée (?offer_id=)"""
+        try:
+            offer_id = int(request.query_params.get('offer_id'))
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'offer_id requis'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         return Response([
             {
-                'id': h['hebergement'].id,
-                'nom': h['hebergement'].nom_hebergement,
-                'type': h['hebergement'].type_hebergement,
-                'etoiles': h['hebergement'].etoiles,
-                'prix_par_nuit': float(h['hebergement'].prix_par_nuit),
-                'score': h['score'],
+                'id': row.neighbour.id,
+                'titre': row.neighbour.titre,
+                'prix_par_personne': float(row.neighbour.prix_par_personne),
+                'co_bookings': row.co_bookings,
+                'score': row.score,
             }
-            for h in accommodations[:10]
+            for row in similarity.neighbours(offer_id, limit=10)
+            if row.neighbour.actif
         ])
     
     @action(detail=False, methods=['post'])
@@ -377,21 +564,56 @@ class RecommendationViewSet(viewsets.ViewSet):
         """Marquer une recommandation comme vue"""
         recommendation_id = request.data.get('recommendation_id')
         
-        try:
-            recommendation = Recommendation.objects.get(
-                id=recommendation_id,
-                user=request.user
-            )
-            recommendation.is_viewed = True
-            recommendation.viewed_at = timezone.now()
-            recommendation.save()
-            
-            return Response({'success': True})
-        except Recommendation.DoesNotExist:
+        if not Recommendation.objects.filter(id=recommendation_id, user=request.user).exists():
             return Response(
                 {'error': 'Recommandation non trouvée'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        # Écrit tout de suite : la réponse confirme un marquage enregistré
+        tracking.write('view', [(recommendation_id, timezone.now())])
+        return Response({'success': True})
+    
+    @action(detail=False, methods=['post'])
+    def track(self, request):
+        """
+        Enregistrer un lot d'événements de suivi :
+        {"events": [{"recommendation_id": 1, "event": "view" | "click" | "book"}, ...]}
+        """
+        events = request.data.get('events')
+        if not isinstance(events, list):
+            return Response(
+                {'error': 'Liste d\'événements attendue'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        requested = {}
+        rejected = []
+        for event in events:
+            name = event.get('event') if isinstance(event, dict) else None
+            recommendation_id = event.get('recommendation_id') if isinstance(event, dict) else None
+            if name in tracking.EVENT_FIELDS and isinstance(recommendation_id, int):
+                requested.setdefault(name, set()).add(recommendation_id)
+            else:
+                rejected.append(event)
+        
+        # Une seule lecture pour vérifier que les recommandations appartiennent à l'utilisateur
+        all_ids = set().union(*requested.values()) if requested else set()
+        owned = set(
+            Recommendation.objects.filter(id__in=all_ids, user=request.user).values_list('id', flat=True)
+        )
+        
+        accepted = 0
+        for name, ids in requested.items():
+            tracking.buffer.record(name, ids & owned)
+            accepted += len(ids & owned)
+            rejected.extend({'recommendation_id': pk, 'event': name} for pk in sorted(ids - owned))
+        
+        return Response({
+            'success': True,
+            'accepted': accepted,
+            'rejected': rejected,
+        })
     
     @action(detail=False, methods=['post'])
     def submit_feedback(self, request):
@@ -427,24 +649,73 @@ class RecommendationViewSet(viewsets.ViewSet):
             )
 
 
+# Schéma du JSON rapide : clé -> encodeur de la valeur, dans l'ordre de sortie.
+# Les prix (Decimal) sont écrits tels quels comme nombres JSON, sans passer par float.
+_encode_string = json.JSONEncoder(ensure_ascii=False).encode
+
+RECOMMENDATION_JSON_FIELDS = {
+    'id': lambda rec, names: str(rec['item'].id),
+    'titre': lambda rec, names: _encode_string(rec['item'].titre),
+    'prix': lambda rec, names: str(rec['item'].prix_par_personne),
+    'score': lambda rec, names: repr(float(rec['score'])),
+    'reason': lambda rec, names: _encode_string(reasons.render(rec['reason_codes'])),
+    'destinations': lambda rec, names: _encode_string(names.get(rec['item'].id, [])),
+}
+
+
+def _destination_names(offer_ids):
+    """Noms des destinations de plusieurs offres, en une requête"""
+    names = {}
+    rows = Offre.nom_destinations.through.objects.filter(
+        offre_id__in=offer_ids
+    ).order_by('pk').values_list('offre_id', 'destination__nom_destination')
+    for offer_id, nom in rows:
+        names.setdefault(offer_id, []).append(nom)
+    return names
+
+
+def render_recommendations_json(recommendations, fields=None):
+    """
+    Sérialise les recommandations avec le schéma pré-construit ; fields
+    restreint (et ordonne) les clés de chaque recommandation
+    """
+    fields = list(dict.fromkeys(fields or RECOMMENDATION_JSON_FIELDS))  # sans doublons, dans l'ordre
+    schema = [(_encode_string(name) + ': ', RECOMMENDATION_JSON_FIELDS[name]) for name in fields]
+    names = {}
+    if 'destinations' in fields:
+        names = _destination_names([rec['item'].id for rec in recommendations])
+    
+    items = ', '.join(
+        '{' + ', '.join(key + encode(rec, names) for key, encode in schema) + '}'
+        for rec in recommendations
+    )
+    return f'{{"count": {len(recommendations)}, "recommendations": [{items}]}}'
+
+
 @login_required
 @require_http_methods(["GET"])
+@gzip_page
 def api_recommendations_json(request):
-    """API JSON pour les recommandations"""
-    engine = RecommendationEngine(request.user)
-    recommendations = engine.generate_recommendations(limit=10)
+    """API JSON pour les recommandations (?fields=id,titre,score pour ne garder que ces champs)"""
+    fields = None
+    if request.GET.get('fields'):
+        fields = list(dict.fromkeys(name.strip() for name in request.GET['fields'].split(',') if name.strip()))
+        unknown = [name for name in fields if name not in RECOMMENDATION_JSON_FIELDS]
+        if unknown:
+            return JsonResponse({
+                'error': f"Champs inconnus : {', '.join(unknown)}",
+                'fields': list(RECOMMENDATION_JSON_FIELDS),
+            }, status=400)
     
-    return JsonResponse({
-        'count': len(recommendations),
-        'recommendations': [
-            {
-                'id': rec['item'].id,
-                'titre': rec['item'].titre,
-                'prix': float(rec['item'].prix_par_personne),
-                'score': rec['score'],
-                'reason': rec['reason'],
-                'destinations': list(rec['item'].nom_destinations.values_list('nom_destination', flat=True)),
-            }
-            for rec in recommendations
-        ]
-    })
+    stored = Recommendation.objects.fresh_offer_recommendations(request.user, limit=10)
+    
+    if stored is not None:
+        recommendations = [rec.as_engine_result() for rec in stored]
+    else:
+        engine = RecommendationEngine(request.user)
+        recommendations = engine.generate_recommendations(limit=10)
+    
+    return HttpResponse(
+        render_recommendations_json(recommendations, fields),
+        content_type='application/json',
+    )
@@ -0,0 +1,10 @@
+"""Initialisation des processus de calcul des commandes
+(precompute_recommendations, evaluate_recommendation_weights)"""
+import django
+from django.db import connections
+
+
+def init_worker():
+    # Chaque processus ouvre sa propre connexion : celle héritée du parent n'est pas partageable
+    django.setup()
+    connections.close_all()
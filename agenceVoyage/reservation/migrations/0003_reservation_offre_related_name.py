@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('offreDestination', '0001_initial'),
+        ('reservation', '0002_alter_reservation_mode_paiement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='offre',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='offreDestination.offre'),
+        ),
+    ]
@@ -17,7 +17,7 @@ class Reservation(models.Model):
     prix_total = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
     nb_personnes = models.PositiveIntegerField()
     client = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    offre = models.ForeignKey('offreDestination.Offre', on_delete=models.CASCADE)
+    offre = models.ForeignKey('offreDestination.Offre', on_delete=models.CASCADE, related_name='reservations')
 
     
     mode_paiement = models.CharField(